@@ -0,0 +1,206 @@
+"""
+Модуль приближённого поиска ближайших соседей (ANN) по эмбеддингам каталога.
+
+Содержит:
+- `IVFIndex` — инвертированный индекс по кластерам (IVF) на numpy: эмбеддинги каталога
+  разбиваются сферическим k-means на `n_lists` кластеров, при поиске просматриваются
+  только `n_probe` ближайших к запросу кластеров.
+- `prepare_ann_index` — построение и сохранение индекса рядом с FastText-моделью.
+- `fuse_candidates` — объединение списков кандидатов BM25 и ANN методом Reciprocal Rank Fusion.
+
+Параметры точности/скорости:
+- `n_lists` — число кластеров (задаётся при построении, по умолчанию ~sqrt(размер каталога)).
+- `n_probe` — число просматриваемых кластеров при поиске: больше — выше полнота, но медленнее.
+- `fusion_weight` — вес списка ANN при объединении с BM25: при значениях меньше ~0.87 (для k_top=10)
+  кандидаты ANN занимают только места, на которые у BM25 нет совпадений по токенам.
+
+Сохраняет:
+- `models/ann_ivf.npz` — центроиды кластеров и списки индексов наименований по кластерам.
+"""
+
+import os
+import numpy as np
+from scipy import sparse
+from utils.bm25_utils import select_top_k
+from utils.embedding_utils import normalize_rows
+from utils.manifest_utils import file_hash, is_stage_current, record_stage
+
+
+class IVFIndex:
+    """
+    IVF-индекс над L2-нормированной матрицей эмбеддингов каталога.
+
+    Сам индекс хранит только центроиды и разбиение индексов строк по кластерам,
+    векторы берутся из матрицы `catalog_embeddings`, переданной при поиске.
+    """
+
+    def __init__(self, centroids, list_ids, list_offsets, n_probe=8, fusion_weight=0.5):
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.n_probe = n_probe
+        self.fusion_weight = fusion_weight
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings, n_lists=None, n_iter=10, n_probe=8, max_train_size=100_000, seed=42):
+        """
+        Строит индекс: обучает сферический k-means на (под)выборке эмбеддингов
+        и раскладывает все строки матрицы по ближайшим центроидам.
+        """
+        n = len(embeddings)
+        rng = np.random.default_rng(seed)
+        train = embeddings
+        if n > max_train_size:
+            train = embeddings[np.sort(rng.choice(n, max_train_size, replace=False))]
+
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, len(train)))
+
+        centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = _assign(train, centroids)
+            one_hot = sparse.csr_matrix(
+                (np.ones(len(train), dtype=np.float32), (assignments, np.arange(len(train)))),
+                shape=(n_lists, len(train))
+            )
+            sums = np.asarray(one_hot @ train)
+
+            # Пустые кластеры заново инициализируем случайными точками
+            empty = np.diff(one_hot.indptr) == 0
+            if empty.any():
+                sums[empty] = train[rng.choice(len(train), int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+
+        return cls(centroids, None, None, n_probe=n_probe).reassign(embeddings)
+
+    def reassign(self, embeddings):
+        """
+        Раскладывает строки матрицы эмбеддингов по уже обученным центроидам.
+        Используется и при построении, и после инкрементального обновления каталога.
+
+        Возвращает:
+        -----------
+        IVFIndex
+            Этот же индекс с обновлёнными списками.
+        """
+        assignments = _assign(embeddings, self.centroids)
+        self.list_ids = np.argsort(assignments, kind='stable')
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=self.n_lists))))
+        return self
+
+    def search(self, query_vec, catalog_embeddings, k, n_probe=None):
+        """
+        Ищет k ближайших по косинусному сходству наименований среди `n_probe` ближайших кластеров.
+
+        Возвращает:
+        -----------
+        tuple(np.ndarray, np.ndarray)
+            Индексы наименований и их сходства по убыванию сходства.
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        query_vec = normalize_rows(np.asarray(query_vec).reshape(1, -1))[0]
+
+        probe_lists, _ = select_top_k(self.centroids @ query_vec, n_probe)
+        candidate_ids = np.concatenate([
+            self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probe_lists
+        ])
+        similarities = catalog_embeddings[candidate_ids] @ query_vec
+        top, top_scores = select_top_k(similarities, k)
+        return candidate_ids[top], top_scores
+
+    def search_batch(self, query_vecs, catalog_embeddings, k, n_probe=None):
+        """Выполняет `search` для каждой строки матрицы запросов, возвращает список индексов."""
+        return [self.search(vec, catalog_embeddings, k, n_probe)[0] for vec in query_vecs]
+
+    def save(self, path):
+        """Сохраняет индекс в .npz (путь или открытый файл)."""
+        np.savez(path, centroids=self.centroids, list_ids=self.list_ids, list_offsets=self.list_offsets,
+                 n_probe=self.n_probe, fusion_weight=self.fusion_weight)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['centroids'], data['list_ids'], data['list_offsets'],
+                   n_probe=int(data['n_probe']), fusion_weight=float(data['fusion_weight']))
+
+
+def _assign(embeddings, centroids, chunk_size=65_536):
+    """Возвращает номер ближайшего центроида для каждой строки (порциями, чтобы не раздувать память)."""
+    assignments = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = embeddings[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def fuse_candidates(candidate_lists, k, weights=None, rrf_k=60):
+    """
+    Объединяет несколько ранжированных списков кандидатов методом Reciprocal Rank Fusion:
+    документ получает сумму weight / (rrf_k + ранг) по всем спискам, где он встретился.
+
+    При весе второго списка меньше (rrf_k + 1) / (rrf_k + k) его кандидаты не вытесняют
+    кандидатов первого списка, а только заполняют свободные места и поднимают
+    документы, найденные обоими способами.
+
+    Возвращает:
+    -----------
+    np.ndarray
+        До k индексов документов по убыванию итогового RRF-скора.
+    """
+    ids = np.concatenate([np.asarray(c, dtype=np.int64) for c in candidate_lists])
+    if weights is None:
+        weights = [1.0] * len(candidate_lists)
+    ranks = np.concatenate([np.arange(1, len(c) + 1) for c in candidate_lists])
+    list_weights = np.concatenate([np.full(len(c), w, dtype=np.float64) for c, w in zip(candidate_lists, weights)])
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    rrf_scores = np.bincount(inverse, weights=list_weights / (rrf_k + ranks), minlength=len(unique_ids))
+
+    # При равенстве RRF-скоров выше документ, который раньше встретился в первом списке
+    first_pos = np.full(len(unique_ids), len(ids))
+    np.minimum.at(first_pos, inverse, np.arange(len(ids)))
+    order = np.lexsort((first_pos, -rrf_scores))[:k]
+    return unique_ids[order]
+
+
+def prepare_ann_index(catalog_embeddings, save_dir_model='models', n_lists=None, n_probe=8):
+    """
+    Строит IVF-индекс по матрице эмбеддингов каталога или загружает его с диска,
+    если он построен по текущей матрице с текущими параметрами (по манифесту сборки).
+
+    Возвращает:
+    -----------
+    IVFIndex
+        Индекс для приближённого поиска по эмбеддингам.
+        Возвращает None, если матрица эмбеддингов каталога не подготовлена.
+    """
+
+    index_path = os.path.join(save_dir_model, 'ann_ivf.npz')
+    embeddings_path = os.path.join(save_dir_model, 'catalog_embeddings.npy')
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
+
+    if catalog_embeddings is None:
+        print("Подготовьте матрицу эмбеддингов каталога.")
+        return None
+
+    inputs = {
+        'catalog_embeddings': file_hash(embeddings_path, manifest_path) if os.path.exists(embeddings_path) else None,
+        'params': {'n_lists': n_lists, 'n_probe': n_probe},
+    }
+    if is_stage_current('ann', inputs, [index_path], manifest_path):
+        print("ANN-индекс на месте, построение не требуется")
+        return IVFIndex.load(index_path)
+
+    print("Строим ANN-индекс по эмбеддингам каталога...")
+    ann_index = IVFIndex.build(catalog_embeddings, n_lists=n_lists, n_probe=n_probe)
+
+    os.makedirs(save_dir_model, exist_ok=True)
+    ann_index.save(index_path)
+    record_stage('ann', inputs, [index_path], manifest_path)
+    print(f"ANN-индекс сохранён в {index_path}")
+
+    return ann_index
@@ -0,0 +1,250 @@
+"""
+Модуль числовых атрибутов наименований товаров.
+
+В наименованиях закодированы размеры, толщина, плотность и т.п.: «ПВХ ECO-FIX 1050х2450х6мм».
+Предобработка текста отделяет числа от букв и разделителей «х», и для BM25 число «6» —
+обычный токен, а единица «мм» вообще удаляется как стоп-слово. Здесь числа разбираются
+до предобработки, вместе с единицами измерения:
+- `extract_attributes` — набор атрибутов (значение, единица) наименования; все числа
+  размерного кортежа «1050х2450х6мм» получают единицу, записанную после него;
+- `AttributeIndex` — компактный индекс атрибутов каталога: отсортированный массив значений
+  и для каждого значения список документов (postings) с кодами единиц;
+- `prepare_attribute_index` — построение индекса по списку наименований и его сохранение.
+
+Атрибут запроса совпадает с атрибутом документа, если равны значения и единицы, либо единица
+не указана у одного из них («лист 6» совпадает с «6мм»). Единицы не пересчитываются друг
+в друга. Числа с единицей «кг» пропускаются — как и при предобработке текста, где они удаляются.
+
+Сохраняет:
+- `models/attribute_index.npz` — массивы индекса атрибутов.
+"""
+
+import os
+import re
+import joblib
+import numpy as np
+from utils.manifest_utils import config_hash, file_hash, is_stage_current, record_stage
+
+# Написания единиц измерения и их каноническая форма
+UNITS = {
+    'мм': 'мм', 'mm': 'мм',
+    'см': 'см', 'cm': 'см',
+    'мкм': 'мкм', 'мк': 'мкм', 'mkm': 'мкм', 'mic': 'мкм',
+    'м': 'м', 'm': 'м',
+    'м2': 'м2', 'м²': 'м2', 'кв.м': 'м2', 'm2': 'м2',
+    'г/м2': 'г/м2', 'г/м²': 'г/м2', 'гр/м2': 'г/м2', 'g/m2': 'г/м2', 'gsm': 'г/м2',
+    'г': 'г', 'гр': 'г', 'g': 'г',
+    'кг': 'кг', 'kg': 'кг',
+    'л': 'л', 'мл': 'мл', 'шт': 'шт',
+}
+IGNORED_UNITS = {'кг'}
+# Коды единиц в индексе: 0 — единица не указана
+UNIT_CODES = ('', 'мм', 'см', 'мкм', 'м', 'м2', 'г/м2', 'г', 'л', 'мл', 'шт')
+
+_NUMBER = r'\d+(?:\.\d+)?'
+_UNIT_ALTERNATION = '|'.join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True))
+# Число не начинается внутри другого числа: ни после цифры, ни после «цифра.» (дробная часть);
+# после буквы с точкой («д.110») — начинается
+_ATTRIBUTE_PATTERN = re.compile(
+    rf'(?<!\d)(?<!\d\.)({_NUMBER}(?:\s*[xх×*]\s*{_NUMBER})*)(?:\s*({_UNIT_ALTERNATION})(?![а-яa-z0-9]))?'
+)
+_DECIMAL_COMMA = re.compile(r'(\d),(\d)')
+
+
+def extract_attributes(text):
+    """
+    Извлекает числовые атрибуты из наименования товара.
+
+    Десятичная запятая заменяется точкой, ведущие нули не учитываются («06» равно «6»).
+    Размерный кортеж «1050х2450х6мм» даёт три атрибута с единицей «мм».
+
+    Возвращает:
+    -----------
+    list of tuple(float, str)
+        Уникальные пары (значение, каноническая единица или '') в порядке появления.
+    """
+    text = _DECIMAL_COMMA.sub(r'\1.\2', str(text).lower().replace('ё', 'е'))
+    attributes = {}
+    for match in _ATTRIBUTE_PATTERN.finditer(text):
+        unit = UNITS.get(match.group(2), '') if match.group(2) else ''
+        if unit in IGNORED_UNITS:
+            continue
+        for number in re.findall(_NUMBER, match.group(1)):
+            attributes.setdefault((round(float(number), 6), unit), None)
+    return list(attributes)
+
+
+def get_attribute_config():
+    """Возвращает конфигурацию извлечения атрибутов (для отслеживания её изменений при сборке индекса)."""
+    return {
+        'pattern': _ATTRIBUTE_PATTERN.pattern,
+        'units': UNITS,
+        'ignored_units': sorted(IGNORED_UNITS),
+        'unit_codes': list(UNIT_CODES),
+    }
+
+
+class AttributeIndex:
+    """
+    Инвертированный индекс числовых атрибутов каталога.
+
+    `values` — отсортированные уникальные значения; вхождения значения `values[i]` лежат
+    в `docs[ptr[i]:ptr[i + 1]]` (номера документов по возрастанию) и `units` (коды единиц
+    из `UNIT_CODES`). Все данные — плоские numpy-массивы.
+    """
+
+    def __init__(self, values, ptr, docs, units, n_docs):
+        self.values = values
+        self.ptr = ptr
+        self.docs = docs
+        self.units = units
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, names):
+        """Строит индекс по списку наименований (номер документа — позиция в списке)."""
+        unit_codes = {unit: code for code, unit in enumerate(UNIT_CODES)}
+        values, docs, units = [], [], []
+        n_docs = 0
+        for doc, name in enumerate(names):
+            n_docs += 1
+            for value, unit in extract_attributes(name):
+                values.append(value)
+                docs.append(doc)
+                units.append(unit_codes[unit])
+
+        values = np.asarray(values, dtype=np.float64)
+        docs = np.asarray(docs, dtype=np.int32)
+        units = np.asarray(units, dtype=np.int8)
+        order = np.lexsort((units, docs, values))
+        values, docs, units = values[order], docs[order], units[order]
+
+        unique_values, starts = np.unique(values, return_index=True)
+        ptr = np.r_[starts, len(values)].astype(np.int64)
+        return cls(unique_values, ptr, docs, units, n_docs)
+
+    def lookup(self, attributes):
+        """
+        Находит документы, совпадающие с атрибутами запроса.
+
+        Возвращает:
+        -----------
+        tuple(np.ndarray, np.ndarray)
+            Номера документов по возрастанию и число совпавших атрибутов запроса у каждого.
+            Пустые массивы, если ни один атрибут не найден.
+        """
+        unit_codes = {unit: code for code, unit in enumerate(UNIT_CODES)}
+        matched = []
+        for value, unit in dict.fromkeys(attributes):
+            i = int(np.searchsorted(self.values, value))
+            if i == len(self.values) or self.values[i] != value:
+                continue
+            docs = self.docs[self.ptr[i]:self.ptr[i + 1]]
+            if unit:
+                units = self.units[self.ptr[i]:self.ptr[i + 1]]
+                docs = docs[(units == 0) | (units == unit_codes[unit])]
+            # Вхождения значения упорядочены по документу: повторы документа (с разными единицами) идут подряд
+            if len(docs):
+                matched.append(docs[_run_starts(docs)])
+
+        if not matched:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # Слияние отсортированных списков: сортировка устойчива и быстра на упорядоченных участках
+        docs = np.sort(np.concatenate(matched), kind='stable')
+        starts = np.flatnonzero(_run_starts(docs))
+        counts = np.empty(len(starts), dtype=np.int64)
+        counts[:-1] = starts[1:] - starts[:-1]
+        counts[-1] = len(docs) - starts[-1]
+        return docs[starts].astype(np.int64), counts
+
+    def match(self, attributes):
+        """
+        Возвращает документы, совпадающие с наибольшим числом атрибутов запроса
+        (`extract_attributes` от текста запроса).
+
+        Возвращает:
+        -----------
+        tuple(np.ndarray, np.ndarray, np.ndarray) или None
+            (лучшие документы по возрастанию, все совпавшие документы, число совпадений у каждого).
+            None, если в запросе нет атрибутов или ни один из них не найден в каталоге.
+        """
+        if not attributes:
+            return None
+        docs, counts = self.lookup(attributes)
+        if not len(docs):
+            return None
+        return docs[counts == counts.max()], docs, counts
+
+    def save(self, path):
+        np.savez(path, values=self.values, ptr=self.ptr, docs=self.docs, units=self.units,
+                 n_docs=self.n_docs, unit_codes=np.array(UNIT_CODES))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        if tuple(data['unit_codes'].tolist()) != UNIT_CODES:
+            raise ValueError("Коды единиц индекса атрибутов не совпадают с текущими, пересоберите индекс.")
+        return cls(data['values'], data['ptr'], data['docs'], data['units'], int(data['n_docs']))
+
+
+def _run_starts(sorted_array):
+    """Возвращает маску начал участков равных значений в отсортированном массиве."""
+    starts = np.empty(len(sorted_array), dtype=bool)
+    starts[:1] = True
+    np.not_equal(sorted_array[1:], sorted_array[:-1], out=starts[1:])
+    return starts
+
+
+def attribute_match_counts(match, candidates):
+    """
+    Число совпавших атрибутов запроса для каждого кандидата (0 — нет совпадений).
+    `match` — результат `AttributeIndex.match`; при None возвращаются нули.
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    if match is None:
+        return np.zeros(candidates.shape, dtype=np.int64)
+    _, docs, counts = match
+    positions = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+    return np.where(docs[positions] == candidates, counts[positions], 0)
+
+
+def prepare_attribute_index(save_dir_names='data', save_dir_model='models'):
+    """
+    Строит индекс числовых атрибутов каталога или загружает его с диска, если он построен
+    по текущим наименованиям и текущей конфигурации извлечения атрибутов (по манифесту сборки).
+
+    Возвращает:
+    -----------
+    AttributeIndex
+        Индекс атрибутов, готовый к использованию в `match_query` и `match_queries`.
+        Возвращает None, если отсутствует файл с предобработанными наименованиями.
+    """
+
+    index_path = os.path.join(save_dir_model, 'attribute_index.npz')
+    names_path = os.path.join(save_dir_names, 'vink_names.joblib')
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
+
+    if not os.path.exists(names_path):
+        if os.path.exists(index_path):
+            print("Индекс атрибутов на месте, построение не требуется")
+            return AttributeIndex.load(index_path)
+        print("Подготовьте обработанный датасет.")
+        return None
+
+    inputs = {
+        'vink_names': file_hash(names_path, manifest_path),
+        'attribute_config': config_hash(get_attribute_config()),
+    }
+    if is_stage_current('attributes', inputs, [index_path], manifest_path):
+        print("Индекс атрибутов на месте, построение не требуется")
+        return AttributeIndex.load(index_path)
+
+    print("Строим индекс числовых атрибутов каталога...")
+    attribute_index = AttributeIndex.build(joblib.load(names_path))
+
+    os.makedirs(save_dir_model, exist_ok=True)
+    attribute_index.save(index_path)
+    record_stage('attributes', inputs, [index_path], manifest_path)
+    print(f"Индекс атрибутов сохранён в {index_path}")
+
+    return attribute_index
@@ -0,0 +1,317 @@
+"""
+Модуль для измерения качества и скорости сопоставления.
+
+Содержит функции для:
+- Подготовки отложенной выборки запросов: синтетической (`generate_synthetic_names`
+  с фиксированным seed) или из размеченных файлов сопоставлений с конкурентами.
+- Расчёта hits@k и задержек (p50/p95/p99, запросов в секунду) для `match_query`
+  и пакетного `match_queries`.
+- Замера холодного запуска (в отдельном процессе) и времени построения индексов.
+- Сохранения результатов в JSON и сравнения с эталонными результатами (baseline)
+  с допусками: падение качества или рост задержек сверх допуска считается регрессией.
+
+Все метрики хранятся плоским словарём с ключами вида 'match_query.hits@1'.
+Направление метрики (больше — лучше или меньше — лучше) определяется по её имени.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+HITS_K = (1, 3, 5)
+DEFAULT_TOLERANCES = {
+    'hits': 0.01,     # абсолютное падение доли попаданий
+    'latency': 0.20,  # относительный рост задержки / времени
+    'qps': 0.20,      # относительное падение пропускной способности
+    'min_ms': 1.0,        # рост задержки запроса меньше этого (мс) не считается регрессией
+    'min_seconds': 0.1,   # рост времени запуска или построения меньше этого (с) не считается регрессией
+}
+
+
+# ---------- Отложенная выборка ---------- #
+
+def build_synthetic_holdout(vink_names, n_queries=500, seed=42):
+    """
+    Строит синтетическую отложенную выборку: для `n_queries` случайных наименований каталога
+    генерируется по одному варианту функциями `generate_synthetic_names`. Выборка
+    воспроизводима при одинаковых seed и каталоге.
+
+    Возвращает:
+    -----------
+    pd.DataFrame
+        Колонки 'competitor_name' (запрос) и 'vink_name' (правильное наименование).
+    """
+    from utils.dataset_utils import generate_synthetic_names
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vink_names), size=min(n_queries, len(vink_names)), replace=False)
+    sample = pd.DataFrame({'vink_name': [vink_names[i] for i in np.sort(rows)]})
+
+    holdout = generate_synthetic_names(sample, k=1, seed=seed)
+    return holdout.rename(columns={'vink_name_synt': 'competitor_name'})[['competitor_name', 'vink_name']]
+
+
+def load_competitor_holdout(match_paths):
+    """
+    Загружает размеченные сопоставления с конкурентами (файлы `Сметченные_позиции_источник_*.csv`)
+    так же, как в исследовательском ноутбуке: только точные совпадения, без дубликатов
+    и неинформативных наименований.
+
+    Возвращает:
+    -----------
+    pd.DataFrame
+        Колонки 'competitor_name', 'vink_id' и 'vink_name'.
+    """
+    name_columns = ('name', 'product_name')
+    frames = []
+    for path in match_paths:
+        matches = pd.read_csv(path)
+        name_column = next(column for column in name_columns if column in matches.columns)
+        matches = matches.drop_duplicates(subset=[name_column, 'item_name'], keep='first')
+        if 'match_type' in matches.columns:
+            matches = matches[matches['match_type'] == 'exact']
+        matches = matches[[name_column, 'sku_id', 'item_name']]
+        matches.columns = ['competitor_name', 'vink_id', 'vink_name']
+        frames.append(matches)
+
+    holdout = pd.concat(frames, ignore_index=True).dropna()
+    junk = ['Создано пользователем', 'есрпви', "form.cleaned_data['name']"]
+    return holdout[~holdout['competitor_name'].isin(junk)].reset_index(drop=True)
+
+
+# ---------- Метрики ---------- #
+
+def hits_at_k(predicted, expected, ks=HITS_K):
+    """
+    Доля запросов, у которых правильное наименование входит в первые k результатов.
+
+    Возвращает:
+    -----------
+    dict
+        {'hits@k': доля} для каждого k из ks.
+    """
+    return {
+        f'hits@{k}': float(np.mean([true in list(pred)[:k] for pred, true in zip(predicted, expected)]))
+        for k in ks
+    }
+
+
+def latency_stats(seconds):
+    """Возвращает перцентили задержки в миллисекундах и число запросов в секунду."""
+    seconds = np.asarray(seconds, dtype=np.float64)
+    p50, p95, p99 = np.percentile(seconds * 1000, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'qps': float(len(seconds) / seconds.sum()) if seconds.sum() > 0 else 0.0}
+
+
+def benchmark_match_query(holdout, resources, k_top=10, ks=HITS_K, warmup=10):
+    """
+    Прогоняет запросы выборки по одному через `match_query` (без кэша результатов).
+
+    Возвращает:
+    -----------
+    dict
+        hits@k и статистика задержки одного запроса.
+    """
+    from utils.matching_utils import match_query
+
+    vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index = resources
+    queries = holdout['competitor_name'].tolist()
+
+    def run(query):
+        return match_query(query, vink_names, bm25_model, fasttext_model, k_top=k_top, n_top=max(ks),
+                           catalog_embeddings=catalog_embeddings, ann_index=ann_index,
+                           attribute_index=attribute_index)
+
+    for query in queries[:warmup]:
+        run(query)
+
+    predicted, seconds = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = run(query)
+        seconds.append(time.perf_counter() - start)
+        predicted.append(result['Наименование товара'].tolist())
+
+    return {**hits_at_k(predicted, holdout['vink_name'], ks), **latency_stats(seconds)}
+
+
+def benchmark_match_queries(holdout, resources, k_top=10, ks=HITS_K, batch_size=256):
+    """
+    Прогоняет запросы выборки через пакетный `match_queries` порциями по `batch_size`.
+
+    Возвращает:
+    -----------
+    dict
+        hits@k, статистика задержки порции и число запросов в секунду.
+    """
+    from utils.matching_utils import match_queries
+
+    vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index = resources
+    queries = holdout['competitor_name'].tolist()
+
+    results, seconds = [], []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        batch_start = time.perf_counter()
+        result = match_queries(batch, vink_names, bm25_model, fasttext_model, catalog_embeddings,
+                               k_top=k_top, n_top=max(ks), batch_size=batch_size, ann_index=ann_index,
+                               attribute_index=attribute_index)
+        seconds.append(time.perf_counter() - batch_start)
+        result['query_idx'] += start
+        results.append(result)
+
+    result = pd.concat(results, ignore_index=True)
+    predicted = result.sort_values(['query_idx', 'rank']).groupby('query_idx')['vink_name'].apply(list)
+    stats = latency_stats(seconds)
+    stats['qps'] = float(len(queries) / sum(seconds))
+    return {**hits_at_k(predicted, holdout['vink_name'], ks), **stats}
+
+
+def benchmark_cold_start(cwd='.'):
+    """
+    Замеряет холодный запуск: время импорта и подготовки всех ресурсов поиска
+    (`load_resources`) в новом процессе Python.
+
+    Возвращает:
+    -----------
+    dict
+        Общее время запуска процесса и длительности этапов запуска в секундах.
+    """
+    code = (
+        "import json, time\n"
+        "start = time.perf_counter()\n"
+        "from utils.startup_utils import StartupProgress, load_resources\n"
+        "progress = StartupProgress()\n"
+        "load_resources(progress=progress)\n"
+        "print('BENCHMARK ' + json.dumps({'seconds': time.perf_counter() - start, **progress.report()}))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True, check=True).stdout
+    line = next(line for line in output.splitlines() if line.startswith('BENCHMARK '))
+    report = json.loads(line[len('BENCHMARK '):])
+    return {f'{name}_seconds' if name != 'seconds' else name: value for name, value in report.items()}
+
+
+def benchmark_index_build(vink_names, catalog_embeddings):
+    """
+    Замеряет построение индексов по уже подготовленным данным: BM25-индекса по токенам
+    каталога и IVF-индекса по матрице эмбеддингов.
+
+    Возвращает:
+    -----------
+    dict
+        Время построения каждого индекса в секундах.
+    """
+    from utils.bm25_utils import BM25Index
+    from utils.ann_utils import IVFIndex
+    from utils.corpus_utils import build_corpus
+
+    if hasattr(vink_names, 'token_lists'):
+        corpus = vink_names.token_lists(np.arange(len(vink_names)))
+    else:
+        corpus = build_corpus(vink_names, desc="Токенизация для замера")
+
+    start = time.perf_counter()
+    BM25Index(corpus)
+    bm25_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    IVFIndex.build(catalog_embeddings)
+    ann_seconds = time.perf_counter() - start
+
+    return {'bm25_seconds': bm25_seconds, 'ann_seconds': ann_seconds}
+
+
+# ---------- Запуск и сравнение с эталоном ---------- #
+
+def run_benchmark(resources, holdout, holdout_name, k_top=10, batch_size=256, cold_start=True, index_build=True):
+    """
+    Выполняет полный набор замеров и собирает результаты.
+
+    Возвращает:
+    -----------
+    dict
+        {'meta': сведения о запуске, 'metrics': {имя метрики: значение}}.
+    """
+    metrics = {}
+    for group, values in (
+        ('match_query', benchmark_match_query(holdout, resources, k_top=k_top)),
+        ('match_queries', benchmark_match_queries(holdout, resources, k_top=k_top, batch_size=batch_size)),
+        ('cold_start', benchmark_cold_start() if cold_start else {}),
+        ('build', benchmark_index_build(resources[0], resources[3]) if index_build else {}),
+    ):
+        metrics.update({f'{group}.{name}': value for name, value in values.items()})
+
+    meta = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'holdout': holdout_name,
+        'n_queries': len(holdout),
+        'catalog_size': len(resources[0]),
+        'k_top': k_top,
+        'batch_size': batch_size,
+        'ann': resources[4] is not None,
+        'attributes': resources[5] is not None,
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+    }
+    return {'meta': meta, 'metrics': metrics}
+
+
+def save_results(results, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _metric_kind(name):
+    """Определяет тип метрики по имени: 'hits', 'qps' или 'latency' (задержки и время)."""
+    metric = name.rsplit('.', 1)[-1]
+    if metric.startswith('hits@'):
+        return 'hits'
+    if metric == 'qps':
+        return 'qps'
+    return 'latency'
+
+
+def compare_with_baseline(results, baseline, tolerances=None):
+    """
+    Сравнивает результаты с эталонными по общим метрикам.
+
+    Регрессия — падение hits@k больше чем на `tolerances['hits']` (абсолютно), рост задержки
+    или времени больше чем на `tolerances['latency']` (относительно, но не меньше
+    `tolerances['min_ms']` / `tolerances['min_seconds']` абсолютно) или падение
+    запросов в секунду больше чем на `tolerances['qps']` (относительно).
+
+    Возвращает:
+    -----------
+    list of dict
+        Регрессии: метрика, эталонное и текущее значения. Пустой список — регрессий нет.
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    regressions = []
+    for name, base in baseline['metrics'].items():
+        current = results['metrics'].get(name)
+        if current is None:
+            continue
+        kind = _metric_kind(name)
+        if kind == 'hits':
+            regressed = current < base - tolerances['hits']
+        elif kind == 'qps':
+            regressed = current < base * (1 - tolerances['qps'])
+        else:
+            floor = tolerances['min_ms'] if name.endswith('_ms') else tolerances['min_seconds']
+            regressed = current > base * (1 + tolerances['latency']) and current - base > floor
+        if regressed:
+            regressions.append({'metric': name, 'baseline': base, 'current': current})
+    return regressions
@@ -1,47 +1,659 @@
 
 import os
+import json
 import joblib
-from rank_bm25 import BM25Okapi
-from nltk.tokenize import word_tokenize
-from utils.text_utils import preprocess_text
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from utils.corpus_utils import build_corpus
+from utils.text_utils import get_text_config
+from utils.manifest_utils import (config_hash, file_hash, is_stage_current, record_stage, new_version_dir,
+                                  publish_version, current_version_dir)
+from utils.metrics_utils import metrics
 
-def prepare_bm25_model(save_dir_names='data', save_dir_model='models'):
+BM25_FORMAT_VERSION = 1
+BLOCK_SIZE = 128
+# Начиная с этого размера корпуса пропуск блоков окупает накладные расходы на запрос
+PRUNING_MIN_DOCS = 100_000
+
+
+class BM25Index:
+    """
+    Инвертированный индекс BM25 на разреженной матрице термин-документ.
+
+    Повторяет формулы `rank_bm25.BM25Okapi` (те же k1, b, epsilon и нижняя граница IDF),
+    но веса каждой пары (термин, документ) с учётом IDF и нормировки по длине документа
+    рассчитываются один раз при построении и хранятся в CSR-матрице. Скоринг запроса
+    сводится к одному умножению разреженной строки запроса на эту матрицу.
+
+    Словарь хранится как отсортированный массив терминов в UTF-8 (`terms`), номер термина —
+    его позиция в массиве. Все данные индекса — плоские numpy-массивы, поэтому индекс
+    сохраняется в набор .npy-файлов (`save`) и открывается через memory-map (`load`).
+
+    Для `top_k` документы разбиты на блоки по `block_size` подряд идущих документов, и для каждой
+    пары (термин, блок) хранится максимальный вес термина в блоке (block-max). Сумма этих максимумов
+    по терминам запроса — верхняя граница скора документов блока: блоки просматриваются по убыванию
+    границы, и блоки, граница которых ниже k-го лучшего найденного скора, пропускаются
+    (block-max MaxScore). Результат совпадает с полным перебором.
+
+    Если передан `statistics` (`corpus_statistics` / `merge_statistics` по всему каталогу),
+    IDF и средняя длина документа берутся из него, а не из `corpus`: так строятся индексы
+    частей (шардов) каталога, веса которых совпадают с весами индекса всего каталога.
     """
-    Обучает BM25-модель на списке товарных наименований.
 
-    Если сериализованная BM25-модель уже существует, она загружается
-    с диска. В противном случае модель обучается на предобработанных наименованиях товаров
-    и сохраняется в файл для повторного использования.
+    def __init__(self, corpus, k1=1.5, b=0.75, epsilon=0.25, block_size=BLOCK_SIZE, statistics=None):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.block_size = block_size
+        vocab = {}
+        self._fit(self._doc_term_matrix(corpus, vocab), vocab, statistics)
+
+    @staticmethod
+    def _doc_term_matrix(corpus, vocab):
+        """Строит матрицу документ-термин с частотами, дополняя словарь vocab новыми терминами."""
+        indptr = [0]
+        indices = []
+        for document in corpus:
+            indices.extend(vocab.setdefault(word, len(vocab)) for word in document)
+            indptr.append(len(indices))
+
+        doc_term = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float64), indices, indptr),
+            shape=(len(indptr) - 1, len(vocab))
+        )
+        doc_term.sum_duplicates()
+        return doc_term
+
+    def _fit(self, doc_term, vocab, statistics=None):
+        """
+        Рассчитывает словарь, статистики корпуса, IDF и веса BM25 по матрице документ-термин
+        (IDF и среднюю длину документа — по `statistics`, если они переданы).
+        """
+        self.corpus_size = doc_term.shape[0]
+        self.doc_len = np.asarray(doc_term.sum(axis=1)).ravel().astype(np.int64)
+        if statistics is None:
+            self.avgdl = self.doc_len.sum() / self.corpus_size
+        else:
+            self.avgdl = statistics['total_len'] / statistics['corpus_size']
+
+        # Оставляем только встречающиеся в корпусе термины и упорядочиваем их по алфавиту
+        term_doc = doc_term.T.tocsr()
+        words = np.empty(len(vocab), dtype=object)
+        for word, i in vocab.items():
+            words[i] = word.encode('utf-8')
+        used = np.flatnonzero(np.diff(term_doc.indptr) > 0)
+        encoded = np.array(words[used].tolist() or [b''], dtype=bytes)[:len(used)]
+        order = np.argsort(encoded, kind='stable')
+        self.terms = encoded[order]
+        term_doc = term_doc[used[order]]
+
+        # IDF с нижней границей epsilon * average_idf, как в BM25Okapi
+        doc_freq = np.diff(term_doc.indptr)
+        if statistics is None:
+            idf = np.log(self.corpus_size - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+            self.average_idf = idf.mean() if len(idf) else 0.0
+        else:
+            # Термины всего каталога в том же порядке (по алфавиту), что и у индекса всего каталога
+            n_docs = statistics['corpus_size']
+            all_freq = np.array([statistics['doc_freq'][term] for term in sorted(statistics['doc_freq'])],
+                                dtype=np.int64)
+            all_idf = np.log(n_docs - all_freq + 0.5) - np.log(all_freq + 0.5)
+            self.average_idf = all_idf.mean() if len(all_idf) else 0.0
+            global_freq = np.array([statistics['doc_freq'][term.decode('utf-8')] for term in self.terms],
+                                   dtype=np.int64)
+            idf = np.log(n_docs - global_freq + 0.5) - np.log(global_freq + 0.5)
+        idf[idf < 0] = self.epsilon * self.average_idf
+        self.idf = idf
+
+        # Веса BM25 для каждой ненулевой пары (термин, документ); частоты сохраняются
+        # для пересчёта весов при обновлении каталога
+        self.term_freqs = term_doc.data.astype(np.float32)
+        tf = term_doc.data
+        doc_len = self.doc_len[term_doc.indices]
+        term_idf = np.repeat(self.idf, doc_freq)
+        term_doc.data = term_idf * (tf * (self.k1 + 1) /
+                                    (tf + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl)))
+        self.matrix = term_doc
+        self.min_weight = float(term_doc.data.min()) if term_doc.nnz else 0.0
+        self._blocks = None
+
+    def _block_index(self):
+        """Возвращает block-max-индекс (строится при первом обращении, если не был загружен)."""
+        if self._blocks is None:
+            self._blocks = build_block_index(self.matrix, self.block_size)
+        return self._blocks
+
+    def update(self, source_ids, new_documents):
+        """
+        Обновляет индекс под изменённый каталог без повторной токенизации неизменённых документов.
+
+        Новый корпус задаётся построчно: `source_ids[i]` — индекс документа текущего индекса,
+        который становится i-м документом, либо -1 для нового документа. Токены новых
+        документов передаются в `new_documents` в порядке их появления. Частоты терминов
+        сохранённых документов переиспользуются, а IDF, средняя длина документа и веса
+        пересчитываются векторно — результат совпадает с построением индекса с нуля.
+        """
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        is_new = source_ids < 0
+        if int(is_new.sum()) != len(new_documents):
+            raise ValueError("Число новых документов не совпадает с числом позиций -1 в source_ids.")
+
+        vocab = {term.decode('utf-8'): i for i, term in enumerate(self.terms)}
+        old_doc_term = sparse.csr_matrix(
+            (np.asarray(self.term_freqs, dtype=np.float64), self.matrix.indices, self.matrix.indptr),
+            shape=self.matrix.shape
+        ).T.tocsr()
+        new_doc_term = self._doc_term_matrix(new_documents, vocab)
+        old_doc_term.resize((old_doc_term.shape[0], len(vocab)))
+
+        combined = sparse.vstack([old_doc_term[source_ids[~is_new]], new_doc_term], format='csr')
+        order = np.empty(len(source_ids), dtype=np.int64)
+        order[~is_new] = np.arange(int((~is_new).sum()))
+        order[is_new] = int((~is_new).sum()) + np.arange(int(is_new.sum()))
+
+        self._fit(combined[order], vocab)
+
+    def _lookup(self, words):
+        """Возвращает номера терминов для слов и маску слов, найденных в словаре."""
+        if not words or len(self.terms) == 0:
+            return np.zeros(len(words), dtype=np.int64), np.zeros(len(words), dtype=bool)
+        encoded = np.array([word.encode('utf-8') for word in words], dtype=bytes)
+        positions = np.minimum(np.searchsorted(self.terms, encoded), len(self.terms) - 1)
+        return positions, self.terms[positions] == encoded
+
+    def _query_matrix(self, queries):
+        """Строит разреженную матрицу запросов с количеством вхождений известных терминов."""
+        words = [word for query in queries for word in query]
+        rows = np.repeat(np.arange(len(queries)), [len(query) for query in queries])
+        term_ids, found = self._lookup(words)
+        query_matrix = sparse.csr_matrix(
+            (np.ones(int(found.sum()), dtype=np.float64), (rows[found], term_ids[found])),
+            shape=(len(queries), len(self.terms))
+        )
+        query_matrix.sum_duplicates()
+        return query_matrix
+
+    def get_scores(self, query):
+        """
+        Считает BM25-скоры запроса для всех документов корпуса.
+
+        Возвращает:
+        -----------
+        np.ndarray
+            Массив скоров длины corpus_size, совпадающий с `BM25Okapi.get_scores`.
+        """
+        return (self._query_matrix([query]) @ self.matrix).toarray().ravel()
+
+    def get_scores_subset(self, query, docs):
+        """
+        Считает BM25-скоры запроса только для документов `docs` (номера по возрастанию).
+
+        Для каждого термина запроса его список вхождений сопоставляется с `docs` двоичным поиском
+        по более длинному из двух массивов, поэтому стоимость зависит от размера подмножества
+        и длины списков вхождений, а не от размера корпуса.
+
+        Возвращает:
+        -----------
+        np.ndarray
+            Массив скоров в порядке `docs`.
+        """
+        docs = np.asarray(docs, dtype=np.int64)
+        scores = np.zeros(len(docs))
+        term_ids, found = self._lookup(query)
+        term_ids, counts = np.unique(term_ids[found], return_counts=True)
+        for t, count in zip(term_ids, counts):
+            start, stop = int(self.matrix.indptr[t]), int(self.matrix.indptr[t + 1])
+            postings = self.matrix.indices[start:stop]
+            if stop - start <= len(docs):
+                positions = np.minimum(np.searchsorted(docs, postings), len(docs) - 1)
+                hit = docs[positions] == postings
+                scores[positions[hit]] += count * self.matrix.data[start:stop][hit]
+            else:
+                positions = np.minimum(np.searchsorted(postings, docs), stop - start - 1)
+                hit = postings[positions] == docs
+                scores[hit] += count * self.matrix.data[start:stop][positions[hit]]
+        return scores
+
+    def top_k(self, query, k, pruning=None, return_stats=False, docs=None):
+        """
+        Отбирает k документов с наибольшим BM25-скором.
+
+        Если передан `docs` (номера документов по возрастанию), скоры считаются только для них
+        (`get_scores_subset`) и документы отбираются из этого подмножества.
+
+        При pruning=True используется block-max MaxScore: скоры считаются только для блоков
+        документов, верхняя граница скора которых не ниже k-го лучшего найденного скора.
+        Иначе (или если в индексе есть отрицательные веса, для которых границы неприменимы)
+        скоры считаются для всего корпуса. По умолчанию (pruning=None) пропуск блоков
+        включается для корпусов от `PRUNING_MIN_DOCS` документов. Результат в обоих режимах одинаков: по убыванию
+        скора, при равных скорах — по возрастанию индекса документа.
+
+        Возвращает:
+        -----------
+        tuple(np.ndarray, np.ndarray)
+            Индексы документов и их скоры по убыванию скора.
+            При return_stats=True третьим элементом — статистика поиска: число блоков
+            и документов всего, просмотренных и пропущенных, число просмотренных вхождений терминов.
+        """
+        if docs is not None:
+            docs = np.asarray(docs, dtype=np.int64)
+            top_positions, top_scores = select_top_k(self.get_scores_subset(query, docs), k)
+            top_indices = docs[top_positions]
+            stats = {'docs_scored': len(docs), 'docs_skipped': self.corpus_size - len(docs)}
+        else:
+            top_indices, top_scores, stats = self._top_k_full(query, k, pruning)
+
+        metrics.inc('bm25_docs_scored', stats['docs_scored'])
+        metrics.inc('bm25_docs_skipped', stats['docs_skipped'])
+        if return_stats:
+            return top_indices, top_scores, stats
+        return top_indices, top_scores
+
+    def _top_k_full(self, query, k, pruning):
+        k = min(k, self.corpus_size)
+        if pruning is None:
+            pruning = self.corpus_size >= PRUNING_MIN_DOCS
+        if pruning and self.min_weight >= 0:
+            top_indices, top_scores, stats = self._top_k_pruned(query, k)
+        else:
+            top_indices, top_scores = select_top_k(self.get_scores(query), k)
+            stats = {'docs_scored': self.corpus_size, 'docs_skipped': 0}
+        return top_indices, top_scores, stats
+
+    def _top_k_pruned(self, query, k):
+        """Block-max MaxScore: точный top-k с пропуском блоков, которые не могут в него попасть."""
+        blocks = self._block_index()
+        n_blocks = -(-self.corpus_size // self.block_size)
+        term_ids, found = self._lookup(query)
+        term_ids, counts = np.unique(term_ids[found], return_counts=True)
+        term_blocks = []
+        for t in term_ids:
+            start, stop = int(blocks['ptr'][t]), int(blocks['ptr'][t + 1])
+            term_blocks.append({name: blocks[name][start:stop] for name in ('ids', 'max', 'start', 'end')})
+
+        # Верхние границы скоров блоков; небольшой запас страхует от погрешностей округления
+        upper = np.zeros(n_blocks)
+        for entries, count in zip(term_blocks, counts):
+            upper[entries['ids']] += count * entries['max']
+        upper *= 1 + 1e-9
+        candidates = np.flatnonzero(upper > 0)
+        order = candidates[np.argsort(-upper[candidates], kind='stable')]
+
+        top_docs = np.empty(0, dtype=np.int64)
+        top_scores = np.empty(0, dtype=np.float64)
+        position, step = 0, max(1, -(-k // self.block_size))
+        docs_scored = postings_scored = 0
+        while position < len(order):
+            batch = order[position:position + step]
+            if len(top_docs) == k:
+                # Блоки упорядочены по убыванию границы: берём те, что ещё могут войти в top-k
+                batch = batch[:np.count_nonzero(upper[batch] >= top_scores[-1])]
+                if not len(batch):
+                    break
+            position += len(batch)
+            step *= 2
+
+            # Скоры документов выбранных блоков: документ получает место slot * block_size + смещение в блоке
+            slot = np.full(n_blocks, -1, dtype=np.int64)
+            slot[batch] = np.arange(len(batch))
+            local, weights = [], []
+            for entries, count in zip(term_blocks, counts):
+                term_slots = slot[entries['ids']]
+                mask = term_slots >= 0
+                starts, ends = entries['start'][mask], entries['end'][mask]
+                lengths = ends - starts
+                postings = _concat_ranges(starts, ends)
+                docs = np.asarray(self.matrix.indices[postings], dtype=np.int64)
+                local.append(np.repeat(term_slots[mask], lengths) * self.block_size + docs % self.block_size)
+                weights.append(count * self.matrix.data[postings])
+            local, weights = np.concatenate(local), np.concatenate(weights)
+            postings_scored += len(local)
+            docs_scored += int(np.minimum(self.block_size, self.corpus_size - batch * self.block_size).sum())
+
+            dense = np.bincount(local, weights=weights, minlength=len(batch) * self.block_size)
+            positions = np.flatnonzero(dense)
+            if len(positions) > k:
+                # Оставляем все документы со скором не ниже k-го (равные разрешит слияние по индексу документа)
+                kth = -np.partition(-dense[positions], k - 1)[k - 1]
+                positions = positions[dense[positions] >= kth]
+            block_docs = batch[positions // self.block_size] * self.block_size + positions % self.block_size
+            block_scores = dense[positions]
+            merged_docs = np.concatenate([top_docs, block_docs])
+            merged_scores = np.concatenate([top_scores, block_scores])
+            best = np.lexsort((merged_docs, -merged_scores))[:k]
+            top_docs, top_scores = merged_docs[best], merged_scores[best]
+
+        # Если документов с положительным скором меньше k, добираем документы с нулевым скором
+        # по возрастанию индекса — как при полном переборе
+        positive = top_scores > 0
+        top_docs, top_scores = top_docs[positive], top_scores[positive]
+        if len(top_docs) < k:
+            fill = np.setdiff1d(np.arange(min(self.corpus_size, 2 * k)), top_docs)[:k - len(top_docs)]
+            top_docs = np.concatenate([top_docs, fill])
+            top_scores = np.concatenate([top_scores, np.zeros(len(fill))])
+
+        stats = {
+            'blocks_total': n_blocks,
+            'blocks_scored': position,
+            'docs_scored': docs_scored,
+            'docs_skipped': self.corpus_size - docs_scored,
+            'postings_total': int(sum(int(entries['end'][-1] - entries['start'][0]) for entries in term_blocks)),
+            'postings_scored': postings_scored,
+        }
+        return top_docs.astype(np.int64), top_scores, stats
+
+    def top_k_batch(self, queries, k, max_cells=2 ** 24):
+        """
+        Отбирает top-k документов сразу для списка токенизированных запросов.
+
+        Скоры всех запросов считаются произведением разреженной матрицы запросов
+        на матрицу индекса. Чтобы ограничить память, плотная матрица скоров
+        строится порциями не более `max_cells` элементов.
+
+        Возвращает:
+        -----------
+        tuple(np.ndarray, np.ndarray)
+            Матрицы индексов и скоров размера (len(queries), min(k, corpus_size)).
+        """
+        query_matrix = self._query_matrix(queries)
+        chunk_size = max(1, max_cells // max(self.corpus_size, 1))
+        k = min(k, self.corpus_size)
+
+        top_indices = np.empty((len(queries), k), dtype=np.int64)
+        top_scores = np.empty((len(queries), k), dtype=np.float64)
+        for start in range(0, len(queries), chunk_size):
+            stop = min(start + chunk_size, len(queries))
+            scores = (query_matrix[start:stop] @ self.matrix).toarray()
+            top_indices[start:stop], top_scores[start:stop] = select_top_k(scores, k)
+        return top_indices, top_scores
+
+    def save(self, path):
+        """
+        Сохраняет индекс в директорию: массивы CSR-матрицы, статистики и словарь — в отдельные
+        .npy-файлы, параметры — в meta.json. Индекс пишется новой версией внутри `path`
+        и публикуется атомарной заменой указателя (`publish_version`): при сбое остаётся
+        прежняя версия, а открытый через memory-map индекс работающего процесса не удаляется.
+        """
+        tmp_path = new_version_dir(path)
+
+        arrays = {
+            'indptr': self.matrix.indptr,
+            'indices': self.matrix.indices,
+            'weights': self.matrix.data,
+            'term_freqs': self.term_freqs,
+            'idf': self.idf,
+            'doc_len': self.doc_len,
+            'terms': self.terms,
+        }
+        arrays.update({f'block_{name}': array for name, array in self._block_index().items()})
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), np.asarray(array))
+
+        meta = {
+            'format_version': BM25_FORMAT_VERSION,
+            'k1': self.k1,
+            'b': self.b,
+            'epsilon': self.epsilon,
+            'corpus_size': int(self.corpus_size),
+            'avgdl': float(self.avgdl),
+            'average_idf': float(self.average_idf),
+            'block_size': self.block_size,
+            'min_weight': self.min_weight,
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+        publish_version(tmp_path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Загружает индекс, сохранённый методом `save`.
+
+        При mmap_mode='r' массивы не читаются в память целиком, а отображаются с диска:
+        загрузка не зависит от размера индекса, страницы подгружаются по мере обращения
+        и разделяются между процессами, открывшими один и тот же индекс. Для изменения
+        индекса (`update`) загружайте его с mmap_mode=None.
+
+        Возвращает:
+        -----------
+        BM25Index
+            Индекс, готовый к поиску.
+        """
+        path = current_version_dir(path)
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != BM25_FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия формата BM25-индекса: {meta.get('format_version')}")
+
+        def load_array(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        index = cls.__new__(cls)
+        index.k1 = meta['k1']
+        index.b = meta['b']
+        index.epsilon = meta['epsilon']
+        index.corpus_size = meta['corpus_size']
+        index.avgdl = meta['avgdl']
+        index.average_idf = meta['average_idf']
+        index.idf = load_array('idf')
+        index.doc_len = load_array('doc_len')
+        index.term_freqs = load_array('term_freqs')
+        index.terms = load_array('terms')
+        index.matrix = sparse.csr_matrix(
+            (load_array('weights'), load_array('indices'), load_array('indptr')),
+            shape=(len(index.terms), index.corpus_size), copy=False
+        )
+
+        # Индексы без block-max (сохранённые до его появления) достраивают его при первом поиске
+        index.block_size = meta.get('block_size', BLOCK_SIZE)
+        index.min_weight = meta['min_weight'] if 'min_weight' in meta else float(np.min(index.matrix.data, initial=np.inf))
+        index._blocks = None
+        if 'block_size' in meta:
+            # Обычные ndarray поверх отображения: у подкласса memmap дорогая индексация малых срезов
+            index._blocks = {name: np.asarray(load_array(f'block_{name}')) for name in BLOCK_ARRAYS}
+        return index
+
+
+BLOCK_ARRAYS = ('ptr', 'ids', 'max', 'start', 'end')
+
+
+def corpus_statistics(corpus):
+    """
+    Считает статистики корпуса, по которым рассчитываются IDF и средняя длина документа.
+
+    Возвращает:
+    -----------
+    dict
+        'corpus_size' — число документов, 'total_len' — суммарная длина документов,
+        'doc_freq' — Counter {термин: число документов с ним}.
+    """
+    doc_freq = Counter()
+    corpus_size = total_len = 0
+    for document in corpus:
+        corpus_size += 1
+        total_len += len(document)
+        doc_freq.update(set(document))
+    return {'corpus_size': corpus_size, 'total_len': total_len, 'doc_freq': doc_freq}
+
+
+def merge_statistics(statistics):
+    """Объединяет статистики частей каталога (`corpus_statistics`) в статистики всего каталога."""
+    merged = {'corpus_size': 0, 'total_len': 0, 'doc_freq': Counter()}
+    for part in statistics:
+        merged['corpus_size'] += part['corpus_size']
+        merged['total_len'] += part['total_len']
+        merged['doc_freq'].update(part['doc_freq'])
+    return merged
+
+
+def build_block_index(matrix, block_size=BLOCK_SIZE):
+    """
+    Строит block-max-индекс по CSR-матрице термин-документ с упорядоченными индексами документов.
+
+    Для каждого термина — список блоков документов, в которых он встречается ('ids'),
+    максимальный вес термина в блоке ('max') и границы вхождений блока в списке вхождений
+    термина ('start', 'end' — позиции в `matrix.indices`). 'ptr' — начало записей каждого термина.
+
+    Возвращает:
+    -----------
+    dict of np.ndarray
+        Массивы 'ptr', 'ids', 'max', 'start', 'end'.
+    """
+    n_terms = matrix.shape[0]
+    nnz = len(matrix.indices)
+    if nnz == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return {'ptr': np.zeros(n_terms + 1, dtype=np.int64), 'ids': empty,
+                'max': np.empty(0, dtype=np.float64), 'start': empty, 'end': empty}
+
+    term_of = np.repeat(np.arange(n_terms), np.diff(matrix.indptr))
+    block_of = np.asarray(matrix.indices) // block_size
+    starts = np.flatnonzero(np.r_[True, (term_of[1:] != term_of[:-1]) | (block_of[1:] != block_of[:-1])])
+    return {
+        'ptr': np.r_[0, np.cumsum(np.bincount(term_of[starts], minlength=n_terms))].astype(np.int64),
+        'ids': block_of[starts].astype(np.int64),
+        'max': np.maximum.reduceat(np.asarray(matrix.data, dtype=np.float64), starts),
+        'start': starts.astype(np.int64),
+        'end': np.r_[starts[1:], nnz].astype(np.int64),
+    }
+
+
+def _concat_ranges(starts, ends):
+    """Возвращает конкатенацию диапазонов [starts[i], ends[i]) одним массивом."""
+    lengths = ends - starts
+    if not len(lengths):
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    return offsets + np.arange(int(lengths.sum()))
+
+
+def select_top_k(scores, k):
+    """
+    Выбирает индексы k наибольших значений по последней оси через `argpartition`
+    и сортирует только их. При равных скорах раньше идёт документ с меньшим индексом,
+    в том числе на границе top-k: из равных k-му значению берутся документы с меньшими индексами.
+    Работает как для одного массива скоров, так и для матрицы (по строкам).
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        empty_shape = scores.shape[:-1] + (0,)
+        return np.empty(empty_shape, dtype=np.int64), np.empty(empty_shape, dtype=scores.dtype)
+    if k < n:
+        kth = -np.partition(-scores, k - 1, axis=-1)[..., k - 1:k]
+        take = (scores >= kth).reshape(-1, n)
+        # Строки, где k-му значению равны несколько документов: оставляем из них первые по индексу
+        for row in np.flatnonzero(take.sum(axis=1) > k):
+            row_scores, row_kth = scores.reshape(-1, n)[row], kth.reshape(-1)[row]
+            ties = np.flatnonzero(row_scores == row_kth)
+            take[row, ties[k - np.count_nonzero(row_scores > row_kth):]] = False
+        candidates = np.nonzero(take)[1].reshape(scores.shape[:-1] + (k,))
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1, kind='stable')
+    top_indices = np.take_along_axis(candidates, order, axis=-1)
+    return top_indices, np.take_along_axis(scores, top_indices, axis=-1)
+
+
+def convert_bm25_model(joblib_path='models/bm25_model.joblib', out_dir='models/bm25_index'):
+    """
+    Переводит BM25-модель, сохранённую через joblib, в формат директории `BM25Index.save`.
+
+    Поддерживаются модели `rank_bm25.BM25Okapi` (частоты терминов документов берутся
+    из `doc_freqs`, параметры k1, b, epsilon сохраняются) и `BM25Index` прежних версий
+    со словарём терминов в виде dict. Повторная токенизация каталога не требуется.
 
     Возвращает:
     -----------
-    BM25Okapi
-        Объект обученной BM25-модели, готовый к использованию для поиска и ранжирования.
+    BM25Index
+        Сконвертированный индекс, загруженный с диска через memory-map.
+    """
+
+    model = joblib.load(joblib_path)
+
+    if hasattr(model, 'doc_freqs'):
+        corpus = [[word for word, freq in doc.items() for _ in range(freq)] for doc in model.doc_freqs]
+        index = BM25Index(corpus, k1=model.k1, b=model.b, epsilon=model.epsilon)
+    elif hasattr(model, 'vocab') and hasattr(model, 'term_freqs'):
+        index = BM25Index.__new__(BM25Index)
+        index.k1, index.b, index.epsilon = model.k1, model.b, model.epsilon
+        doc_term = sparse.csr_matrix(
+            (model.term_freqs.astype(np.float64), model.matrix.indices, model.matrix.indptr),
+            shape=model.matrix.shape
+        ).T.tocsr()
+        index._fit(doc_term, model.vocab)
+    else:
+        raise ValueError(f"Неизвестный формат BM25-модели: {type(model).__name__}")
+
+    index.save(out_dir)
+    print(f"BM25-модель {joblib_path} сконвертирована в {out_dir}")
+    return BM25Index.load(out_dir)
+
+
+def prepare_bm25_model(save_dir_names='data', save_dir_model='models', workers=None, catalog_store=None):
+    """
+    Строит BM25-индекс на списке товарных наименований.
+
+    Если BM25-индекс уже сохранён и построен по текущим наименованиям и текущей конфигурации
+    предобработки (по манифесту сборки), он открывается с диска через memory-map.
+    Актуальная модель прежнего формата (joblib) конвертируется без переобучения.
+    В противном случае индекс строится на предобработанных наименованиях товаров
+    и сохраняется в директорию `models/bm25_index` для повторного использования.
+
+    Если передано хранилище каталога `catalog_store` (`prepare_catalog_store`) с теми же
+    наименованиями, индекс строится по его столбцу токенов без повторной токенизации.
+    Иначе предобработка наименований выполняется параллельно на `workers` процессах
+    (по умолчанию — по числу ядер).
+
+    Возвращает:
+    -----------
+    BM25Index
+        Объект BM25-индекса, готовый к использованию для поиска и ранжирования.
         Возвращает None, если отсутствует файл с предобработанными наименованиями.
     """
 
-    model_path = os.path.join(save_dir_model, 'bm25_model.joblib')
+    index_dir = os.path.join(save_dir_model, 'bm25_index')
+    legacy_path = os.path.join(save_dir_model, 'bm25_index.joblib')
     names_path = os.path.join(save_dir_names, 'vink_names.joblib')
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
 
-    # Создание директории под модель и необходимые проверки 
+    # Создание директории под модель и необходимые проверки
     if not os.path.exists(save_dir_model):
         os.makedirs(save_dir_model)
         print(f"Создана директория под модель: {save_dir_model}")
 
-    if os.path.exists(model_path):
-        print("BM25-модель на месте, обучение не требуется")
-        return joblib.load(model_path)
-
     if not os.path.exists(names_path):
+        if os.path.exists(index_dir):
+            print("BM25-модель на месте, обучение не требуется")
+            return BM25Index.load(index_dir)
         print("Подготовьте обработанный датасет.")
         return None
 
+    inputs = {
+        'vink_names': file_hash(names_path, manifest_path),
+        'text_config': config_hash(get_text_config()),
+        'params': {'k1': 1.5, 'b': 0.75, 'epsilon': 0.25},
+    }
+    if is_stage_current('bm25', inputs, [index_dir], manifest_path):
+        print("BM25-модель на месте, обучение не требуется")
+        return BM25Index.load(index_dir)
+
+    if os.path.exists(legacy_path) and is_stage_current('bm25', inputs, [legacy_path], manifest_path):
+        bm25_model = convert_bm25_model(legacy_path, index_dir)
+        record_stage('bm25', inputs, [index_dir], manifest_path)
+        os.remove(legacy_path)
+        return bm25_model
+
     print("Обучаем BM25-модель...")
     vink_names = joblib.load(names_path)
-    corpus = [word_tokenize(preprocess_text(name)) for name in vink_names]
-    bm25_model = BM25Okapi(corpus)
-
-    joblib.dump(bm25_model, model_path)
-    print(f"BM25-модель сохранена в {model_path}")
+    if catalog_store is not None and len(catalog_store) == len(vink_names) and list(catalog_store) == vink_names:
+        corpus = catalog_store.token_lists(np.arange(len(catalog_store)))
+    else:
+        corpus = build_corpus(vink_names, workers=workers)
+    BM25Index(corpus).save(index_dir)
+    record_stage('bm25', inputs, [index_dir], manifest_path)
+    print(f"BM25-модель сохранена в {index_dir}")
 
-    return bm25_model
\ No newline at end of file
+    return BM25Index.load(index_dir)
@@ -0,0 +1,216 @@
+"""
+Модуль массового сопоставления файлов поставщиков с каталогом.
+
+Файл поставщика (CSV) читается порциями, порции сопоставляются пакетным `match_queries`
+на пуле процессов, результаты дописываются в выходной CSV в порядке строк входного файла.
+
+Процессы пула не получают модели от основного процесса, а открывают те же артефакты
+с диска (`open_resources`): BM25-индекс, векторы FastText, матрица эмбеддингов и хранилище
+каталога отображаются через memory-map, и страницы памяти разделяются между процессами.
+
+Ход обработки сохраняется в контрольной точке (`<выходной файл>.checkpoint.json`) после
+каждой записанной порции: число обработанных строк и размер выходного файла. При повторном
+запуске выходной файл обрезается до размера из контрольной точки (недописанная порция
+отбрасывается), и обработка продолжается со следующей строки. Контрольная точка привязана
+к входному файлу, параметрам сопоставления и версии артефактов поиска: если они изменились,
+продолжение невозможно — нужен запуск заново (restart=True).
+"""
+
+import os
+import json
+import time
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from utils.cache_utils import get_artifact_version
+from utils.corpus_utils import imap_bounded
+from utils.manifest_utils import config_hash
+
+_resources = None
+
+
+def checkpoint_path(output_path):
+    return output_path + '.checkpoint.json'
+
+
+def open_resources(save_dir_names='data', save_dir_model='models', use_ann=True, use_attributes=True):
+    """
+    Открывает подготовленные артефакты поиска с диска без проверки манифеста и пересборки
+    (артефакты должны быть подготовлены заранее, например `load_resources`).
+
+    Возвращает:
+    -----------
+    tuple
+        (vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index) —
+        в том же порядке, что и `load_resources`; ann_index и attribute_index равны None,
+        если они отключены или не построены.
+    """
+    from utils.ann_utils import IVFIndex
+    from utils.attribute_utils import AttributeIndex
+    from utils.bm25_utils import BM25Index
+    from utils.store_utils import CatalogStore
+    from utils.vectors_utils import ServingVectors
+
+    vink_names = CatalogStore.open(os.path.join(save_dir_names, 'catalog.arrow'))
+    bm25_model = BM25Index.load(os.path.join(save_dir_model, 'bm25_index'))
+    fasttext_model = ServingVectors.load(os.path.join(save_dir_model, 'fasttext_serving'))
+    catalog_embeddings = np.load(os.path.join(save_dir_model, 'catalog_embeddings.npy'), mmap_mode='r')
+
+    ann_path = os.path.join(save_dir_model, 'ann_ivf.npz')
+    ann_index = IVFIndex.load(ann_path) if use_ann and os.path.exists(ann_path) else None
+    attributes_path = os.path.join(save_dir_model, 'attribute_index.npz')
+    attribute_index = AttributeIndex.load(attributes_path) if use_attributes and os.path.exists(attributes_path) else None
+    return vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index
+
+
+def _init_worker(resource_args):
+    global _resources
+    _resources = open_resources(**resource_args)
+
+
+def _match_chunk(task):
+    """Сопоставляет порцию строк (номер первой строки, наименования) с каталогом."""
+    from utils.matching_utils import match_queries
+
+    start_row, texts, k_top, n_top = task
+    vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index = _resources
+    result = match_queries(texts, vink_names, bm25_model, fasttext_model, catalog_embeddings,
+                           k_top=k_top, n_top=n_top, ann_index=ann_index, attribute_index=attribute_index)
+    result.insert(0, 'row', result.pop('query_idx') + start_row)
+    return start_row, len(texts), result
+
+
+def _iter_chunks(input_path, column, chunk_size, skip_rows, read_csv_kwargs):
+    """
+    Читает колонку наименований порциями, пропуская первые `skip_rows` строк.
+    Строки пропускаются после разбора CSV, поэтому наименования с переводами строк
+    внутри кавычек не сбивают счёт.
+    """
+    row = 0
+    for chunk in pd.read_csv(input_path, usecols=[column], dtype={column: str}, chunksize=chunk_size,
+                             **read_csv_kwargs):
+        texts = chunk[column].fillna('').tolist()
+        if row + len(texts) > skip_rows:
+            offset = max(skip_rows - row, 0)
+            yield row + offset, texts[offset:]
+        row += len(texts)
+
+
+def _load_checkpoint(path, fingerprint):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint['fingerprint'] != fingerprint:
+        raise ValueError(
+            "Контрольная точка относится к другому входному файлу, параметрам или версии моделей. "
+            "Запустите сопоставление заново (restart=True)."
+        )
+    return checkpoint
+
+
+def _save_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def match_file(input_path, output_path, column, k_top=10, n_top=5, chunk_size=5_000, workers=None,
+               restart=False, save_dir_names='data', save_dir_model='models', use_ann=True,
+               use_attributes=True, **read_csv_kwargs):
+    """
+    Сопоставляет наименования из колонки `column` CSV-файла поставщика с каталогом
+    и дописывает результаты в `output_path` с возобновлением по контрольной точке.
+
+    Порции по `chunk_size` строк обрабатываются пулом из `workers` процессов (по умолчанию —
+    по числу ядер); при workers=1 — в текущем процессе. Скорость (строк в секунду)
+    отображается по ходу обработки. Дополнительные аргументы передаются в `pd.read_csv`
+    (например, sep или encoding).
+
+    Выходной CSV — «длинный» формат `match_queries`, по n_top строк на строку входного файла:
+    'row' (номер строки входного файла, с 0), 'rank', 'vink_idx', 'vink_id', 'vink_name', 'score'.
+
+    Возвращает:
+    -----------
+    dict
+        Сводка: обработано строк всего и в этом запуске, время и скорость (строк в секунду).
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    state_path = checkpoint_path(output_path)
+    fingerprint = config_hash({
+        'input': os.path.abspath(input_path),
+        'input_size': os.path.getsize(input_path),
+        'input_mtime_ns': os.stat(input_path).st_mtime_ns,
+        'column': column,
+        'params': {'k_top': k_top, 'n_top': n_top, 'use_ann': use_ann, 'use_attributes': use_attributes},
+        'read_csv': read_csv_kwargs,
+        'artifacts': get_artifact_version(os.path.join(save_dir_model, 'manifest.json')),
+    })
+
+    checkpoint = None if restart else _load_checkpoint(state_path, fingerprint)
+    if checkpoint is None:
+        if not restart and os.path.exists(output_path):
+            raise FileExistsError(
+                f"Файл {output_path} уже существует, а контрольной точки нет. "
+                "Укажите другой файл или запустите сопоставление заново (restart=True)."
+            )
+        checkpoint = {'fingerprint': fingerprint, 'rows_done': 0, 'output_size': 0, 'finished': False}
+    if checkpoint['finished']:
+        print(f"Файл уже обработан: {checkpoint['rows_done']} строк, результаты в {output_path}")
+        return {'rows': checkpoint['rows_done'], 'new_rows': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+    if checkpoint['rows_done']:
+        print(f"Продолжаем с контрольной точки: обработано {checkpoint['rows_done']} строк")
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    # Отбрасываем порцию, записанную после последней контрольной точки
+    with open(output_path, 'a+b') as f:
+        f.truncate(checkpoint['output_size'])
+
+    resource_args = {'save_dir_names': save_dir_names, 'save_dir_model': save_dir_model,
+                     'use_ann': use_ann, 'use_attributes': use_attributes}
+    tasks = ((start_row, texts, k_top, n_top) for start_row, texts in
+             _iter_chunks(input_path, column, chunk_size, checkpoint['rows_done'], read_csv_kwargs))
+
+    pool = None
+    if workers <= 1:
+        _init_worker(resource_args)
+        results = map(_match_chunk, tasks)
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=(resource_args,))
+        results = imap_bounded(pool, _match_chunk, tasks, 2 * workers)
+
+    start_time = time.perf_counter()
+    new_rows = 0
+    # tqdm показывает скорость (строк в секунду) по ходу обработки
+    progress = tqdm(initial=checkpoint['rows_done'], unit=' строк', desc="Сопоставление")
+    try:
+        for start_row, n_rows, result in results:
+            with open(output_path, 'a', encoding='utf-8', newline='') as f:
+                result.to_csv(f, index=False, header=checkpoint['output_size'] == 0)
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint['output_size'] = os.fstat(f.fileno()).st_size
+            checkpoint['rows_done'] = start_row + n_rows
+            _save_checkpoint(state_path, checkpoint)
+
+            new_rows += n_rows
+            progress.update(n_rows)
+    finally:
+        progress.close()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    checkpoint['finished'] = True
+    _save_checkpoint(state_path, checkpoint)
+    seconds = time.perf_counter() - start_time
+    rows_per_second = new_rows / seconds if seconds > 0 else 0.0
+    print(f"Обработано строк: {checkpoint['rows_done']} (в этом запуске {new_rows}, "
+          f"{rows_per_second:.0f} строк/с), результаты в {output_path}")
+    return {'rows': checkpoint['rows_done'], 'new_rows': new_rows, 'seconds': seconds,
+            'rows_per_second': rows_per_second}
@@ -0,0 +1,102 @@
+"""
+Модуль кэша результатов поиска.
+
+Одни и те же наименования запрашиваются многократно, поэтому результат `match_query`
+для запроса сохраняется в LRU-кэше ограниченного размера:
+- ключ — нормализованные токены запроса, `k_top`, признак использования ANN-поиска
+  и числовые атрибуты запроса (токены не различают, например, «6 мм» и «6 м»);
+- значение — индексы кандидатов и их сходства, упорядоченные по убыванию сходства,
+  поэтому из одной записи отдаётся результат для любого `n_top <= k_top`;
+- кэш привязан к версии артефактов (`get_artifact_version`), из которых загружены ресурсы
+  поиска: при загрузке ресурсов другой версии вызывается `set_version`, и все записи
+  сбрасываются (в приложении Streamlit — при каждой перезагрузке ресурсов).
+
+Кэш потокобезопасен и может быть общим для всех сессий Streamlit.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.manifest_utils import MANIFEST_PATH, load_manifest
+
+ARTIFACT_STAGES = ('datasets', 'catalog_store', 'bm25', 'fasttext', 'fasttext_serving', 'catalog_embeddings', 'ann',
+                   'attributes')
+
+
+def get_artifact_version(manifest_path=MANIFEST_PATH):
+    """
+    Возвращает версию артефактов поиска — хэш от build_id их этапов в манифесте сборки.
+    Меняется при любой пересборке и при инкрементальном обновлении каталога.
+    """
+    stages = load_manifest(manifest_path)['stages']
+    build_ids = [f"{stage}:{stages[stage]['build_id']}" for stage in ARTIFACT_STAGES if stage in stages]
+    return hashlib.sha256('|'.join(build_ids).encode('utf-8')).hexdigest()[:16]
+
+
+class QueryResultCache:
+    """
+    LRU-кэш результатов поиска с ограничением числа записей и статистикой попаданий.
+    """
+
+    def __init__(self, maxsize=10_000, version=None):
+        self.maxsize = maxsize
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def make_key(self, query_tokens, k_top, use_ann, attributes=()):
+        return (self.version, tuple(query_tokens), k_top, use_ann, tuple(attributes))
+
+    def get(self, key):
+        """Возвращает сохранённый результат или None; найденная запись становится самой свежей."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key, value):
+        """Сохраняет результат; при превышении размера вытесняет самые давние записи."""
+        if key[0] != self.version:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def set_version(self, version):
+        """Привязывает кэш к версии артефактов; при смене версии все записи сбрасываются."""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = self._evictions = 0
+
+    def stats(self):
+        """
+        Возвращает статистику кэша: попадания, промахи, долю попаданий, число вытеснений,
+        текущий и максимальный размер и версию артефактов.
+        """
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / requests if requests else 0.0,
+                'evictions': self._evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'version': self.version,
+            }
@@ -0,0 +1,259 @@
+"""
+Модуль для инкрементального обновления каталога без полного переобучения моделей.
+
+Содержит функции для:
+- Применения изменений каталога (добавленные, удалённые и переименованные товары)
+  к списку `vink_names`, хранилищу каталога, BM25-индексу, матрице эмбеддингов каталога
+  и ANN-индексу.
+- Учёта версии артефактов каталога.
+
+FastText-модель при обновлении не переобучается: эмбеддинги новых наименований
+считаются существующей моделью (n-граммы подслов покрывают и новые слова).
+Полное переобучение выполняется только по требованию (удалением папки `models`).
+
+Сохраняет:
+- обновлённые `data/vink_names.joblib`, `data/catalog.arrow`, `models/bm25_index/`,
+  `models/catalog_embeddings.npy` и `models/ann_ivf.npz`;
+- `models/catalog_version.json` — номер версии артефактов и сводку последнего обновления.
+"""
+
+import os
+import json
+from collections import defaultdict
+from datetime import datetime
+import joblib
+import numpy as np
+from utils.text_utils import tokenize_product_name
+from utils.bm25_utils import BM25Index
+from utils.embedding_utils import embed_token_lists
+from utils.manifest_utils import file_hash, refresh_stage
+
+
+def get_catalog_version(save_dir_model='models'):
+    """
+    Возвращает сведения о текущей версии артефактов каталога.
+
+    Возвращает:
+    -----------
+    dict
+        Словарь с ключом 'version' (0, если каталог ещё не обновлялся) и сводкой последнего обновления.
+    """
+    version_path = os.path.join(save_dir_model, 'catalog_version.json')
+    if not os.path.exists(version_path):
+        return {'version': 0}
+    with open(version_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _atomic_save(path, write):
+    """Записывает файл через временный файл, чтобы при сбое не остался частично записанный артефакт."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _rows_by_key(keys, wanted, kind):
+    """
+    Находит строку каталога для каждого ключа из `wanted` (наименования или кода товара).
+
+    Возвращает:
+    -----------
+    tuple(dict, set)
+        {ключ: номер строки} и множество ключей, не найденных в каталоге.
+        Ключ, которому соответствует несколько строк, — ошибка ValueError.
+    """
+    rows = defaultdict(list)
+    for i, key in enumerate(keys):
+        if key in wanted:
+            rows[key].append(i)
+    ambiguous = [key for key, key_rows in rows.items() if len(key_rows) > 1]
+    if ambiguous:
+        hint = " Укажите товары по кодам (removed_ids, renamed_ids)." if kind == 'наименование' else ""
+        raise ValueError(f"{kind.capitalize()} встречается в каталоге несколько раз: {ambiguous[:5]}.{hint}")
+    return {key: key_rows[0] for key, key_rows in rows.items()}, set(wanted) - set(rows)
+
+
+def update_catalog(added=None, removed=None, renamed=None, fasttext_model=None,
+                   save_dir_names='data', save_dir_model='models', added_ids=None,
+                   removed_ids=None, renamed_ids=None):
+    """
+    Применяет изменения каталога к сохранённым артефактам без полного переобучения.
+
+    Удалённые наименования исключаются, переименованные остаются на своих позициях
+    с новым наименованием, добавленные дописываются в конец `vink_names`. Токенизируются
+    и эмбеддятся только новые и переименованные наименования; статистики и веса BM25
+    пересчитываются по сохранённым частотам терминов. После обновления номер версии
+    артефактов увеличивается на 1.
+
+    Параметры:
+    ----------
+    added : list of str
+        Новые наименования товаров.
+    removed : list of str
+        Наименования, которые нужно удалить из каталога.
+    renamed : dict
+        Соответствие {старое наименование: новое наименование}.
+    added_ids : list
+        Коды товаров (SKU) для `added` в том же порядке. Переименованные товары сохраняют
+        свои коды; без `added_ids` коды новых товаров в хранилище каталога остаются пустыми.
+    removed_ids : list
+        Коды товаров, которые нужно удалить (требует хранилища каталога).
+    renamed_ids : dict
+        Соответствие {код товара: новое наименование} (требует хранилища каталога).
+
+    Наименование в `removed` и `renamed` должно встречаться в каталоге один раз: товары
+    с одинаковыми наименованиями указываются по кодам (`removed_ids`, `renamed_ids`),
+    иначе выбрасывается ValueError.
+
+    Возвращает:
+    -----------
+    tuple
+        (vink_names, bm25_model, catalog_embeddings, ann_index, version) — обновлённые артефакты
+        и номер их версии. ann_index равен None, если ANN-индекс не был построен.
+    """
+
+    added = list(added or [])
+    if added_ids is not None and len(added_ids) != len(added):
+        raise ValueError("Число кодов added_ids не совпадает с числом добавленных наименований.")
+    removed = set(removed or [])
+    renamed = dict(renamed or {})
+    removed_ids = set(removed_ids or [])
+    renamed_ids = dict(renamed_ids or {})
+
+    names_path = os.path.join(save_dir_names, 'vink_names.joblib')
+    bm25_path = os.path.join(save_dir_model, 'bm25_index')
+    embeddings_path = os.path.join(save_dir_model, 'catalog_embeddings.npy')
+    ann_path = os.path.join(save_dir_model, 'ann_ivf.npz')
+
+    for path in (names_path, bm25_path, embeddings_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Артефакт каталога не найден: {path}. Выполните полное построение моделей.")
+
+    # Новые эмбеддинги считаются теми же векторами, что и матрица каталога при поиске
+    serving_path = os.path.join(save_dir_model, 'fasttext_serving')
+    if fasttext_model is None and os.path.exists(serving_path):
+        from utils.vectors_utils import ServingVectors
+        fasttext_model = ServingVectors.load(serving_path)
+    elif fasttext_model is None:
+        from gensim.models import FastText
+        fasttext_model = FastText.load(os.path.join(save_dir_model, 'fasttext_model_full.model'))
+
+    vink_names = joblib.load(names_path)
+    bm25_model = BM25Index.load(bm25_path, mmap_mode=None)
+    catalog_embeddings = np.load(embeddings_path)
+
+    ann_index = None
+    if os.path.exists(ann_path):
+        from utils.ann_utils import IVFIndex
+        ann_index = IVFIndex.load(ann_path)
+
+    store_path = os.path.join(save_dir_names, 'catalog.arrow')
+    store = None
+    if os.path.exists(store_path):
+        from utils.store_utils import CatalogStore
+        store = CatalogStore.open(store_path, memory_map=False)
+        if len(store) != len(vink_names):
+            raise ValueError("Хранилище каталога не соответствует списку vink_names. Выполните полное построение моделей.")
+    if (removed_ids or renamed_ids) and store is None:
+        raise FileNotFoundError(f"Для изменений по кодам товаров нужно хранилище каталога: {store_path}")
+
+    # Строки каталога, которые удаляются или переименовываются: по наименованиям и по кодам товаров
+    name_rows, missing = _rows_by_key(vink_names, removed | set(renamed), 'наименование')
+    if removed_ids or renamed_ids:
+        id_rows, missing_ids = _rows_by_key(store.take_ids(np.arange(len(store))), removed_ids | set(renamed_ids),
+                                            'код товара')
+        missing |= missing_ids
+    else:
+        id_rows = {}
+    if missing:
+        print(f"В каталоге не найдено {len(missing)} наименований или кодов из списка изменений, они пропущены.")
+    removed_rows = {name_rows[name] for name in removed if name in name_rows}
+    removed_rows |= {id_rows[sku] for sku in removed_ids if sku in id_rows}
+    renamed_rows = {name_rows[name]: new_name for name, new_name in renamed.items() if name in name_rows}
+    renamed_rows.update({id_rows[sku]: new_name for sku, new_name in renamed_ids.items() if sku in id_rows})
+
+    # Новый порядок строк: индекс прежней строки или -1 для нового/переименованного наименования;
+    # для кодов товаров переименованные строки сохраняют индекс прежней строки
+    new_names = []
+    source_ids = []
+    id_sources = []
+    changed_names = []
+    for i, name in enumerate(vink_names):
+        if i in removed_rows:
+            continue
+        if i in renamed_rows:
+            new_names.append(renamed_rows[i])
+            source_ids.append(-1)
+            changed_names.append(renamed_rows[i])
+        else:
+            new_names.append(name)
+            source_ids.append(i)
+        id_sources.append(i)
+    for name in added:
+        new_names.append(name)
+        source_ids.append(-1)
+        changed_names.append(name)
+
+    version_info = get_catalog_version(save_dir_model)
+    if len(new_names) == len(vink_names) and not changed_names:
+        print("Изменений каталога нет, обновление не требуется.")
+        return vink_names, bm25_model, catalog_embeddings, ann_index, version_info['version']
+    if not new_names:
+        raise ValueError("После обновления каталог оказался пустым.")
+
+    print(f"Обновляем каталог: +{len(added)}, -{len(vink_names) - len(new_names) + len(added)}, "
+          f"переименовано {len(changed_names) - len(added)}")
+
+    source_ids = np.asarray(source_ids, dtype=np.int64)
+    is_new = source_ids < 0
+    changed_tokens = [tokenize_product_name(name) for name in changed_names]
+
+    bm25_model.update(source_ids, changed_tokens)
+
+    new_embeddings = np.empty((len(new_names), catalog_embeddings.shape[1]), dtype=np.float32)
+    new_embeddings[~is_new] = catalog_embeddings[source_ids[~is_new]]
+    new_embeddings[is_new] = embed_token_lists(changed_tokens, fasttext_model.wv)
+
+    if ann_index is not None:
+        ann_index.reassign(new_embeddings)
+
+    version = version_info['version'] + 1
+    _atomic_save(names_path, lambda f: joblib.dump(new_names, f))
+    bm25_model.save(bm25_path)
+    _atomic_save(embeddings_path, lambda f: np.save(f, new_embeddings))
+    if ann_index is not None:
+        _atomic_save(ann_path, ann_index.save)
+
+    if store is not None:
+        from utils.store_utils import CatalogStore
+        kept_tokens = iter(store.token_lists(source_ids[~is_new]))
+        changed_iter = iter(changed_tokens)
+        token_lists = [next(changed_iter) if new else next(kept_tokens) for new in is_new]
+        ids = store.take_ids(id_sources) + list(added_ids or [None] * len(added))
+        CatalogStore.from_columns(ids, new_names, token_lists).save(store_path)
+
+    version_info = {
+        'version': version,
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+        'n_items': len(new_names),
+        'added': len(added),
+        'removed': len(vink_names) - len(new_names) + len(added),
+        'renamed': len(changed_names) - len(added),
+    }
+    with open(os.path.join(save_dir_model, 'catalog_version.json'), 'w', encoding='utf-8') as f:
+        json.dump(version_info, f, ensure_ascii=False, indent=2)
+
+    # Отмечаем в манифесте сборки, что артефакты соответствуют обновлённому каталогу,
+    # чтобы при следующем запуске они не пересобирались
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
+    names_hash = file_hash(names_path, manifest_path)
+    refresh_stage('bm25', {'vink_names': names_hash}, manifest_path)
+    refresh_stage('catalog_store', {'vink_names': names_hash}, manifest_path)
+    refresh_stage('catalog_embeddings', {'vink_names': names_hash}, manifest_path)
+    if ann_index is not None:
+        refresh_stage('ann', {'catalog_embeddings': file_hash(embeddings_path, manifest_path)}, manifest_path)
+
+    print(f"Каталог обновлён до версии {version}")
+
+    return new_names, bm25_model, new_embeddings, ann_index, version
@@ -0,0 +1,135 @@
+"""
+Модуль для параллельной предобработки корпусов наименований.
+
+Тексты разбиваются на порции, каждая порция предобрабатывается и токенизируется
+(`tokenize_product_name`) в отдельном процессе, результаты возвращаются в исходном порядке
+по мере готовности. Используется при построении BM25-индекса и обучении FastText.
+
+Корпус можно собрать в список (`build_corpus`) или записать в текстовый файл
+по строке на предложение (`write_corpus_file`) — формат `corpus_file` для gensim.
+
+Порции раздаются процессам с ограничением числа необработанных порций (`imap_bounded`),
+поэтому при потоковой обработке в памяти держится не больше нескольких порций.
+
+Пулы процессов создаются из контекста `get_pool_context` (forkserver или spawn, не fork):
+при запуске приложения пулы создаются из потоков подготовки ресурсов, а fork многопоточного
+процесса копирует блокировки (импорта, логирования, tqdm), захваченные другими потоками,
+и дочерний процесс может зависнуть.
+"""
+
+import os
+import multiprocessing
+from collections import deque
+from itertools import islice
+from tqdm import tqdm
+from utils.text_utils import tokenize_product_name
+
+
+def _tokenize_chunk(texts):
+    return [tokenize_product_name(text) for text in texts]
+
+
+def get_pool_context():
+    """Возвращает контекст multiprocessing для пулов: forkserver, а где его нет (Windows) — spawn."""
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+
+def iter_chunks(iterable, chunk_size):
+    """Разбивает итерируемый объект на списки длиной не более chunk_size."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap_bounded(pool, func, tasks, max_pending):
+    """
+    Аналог `Pool.imap`, который берёт следующие задачи из `tasks` только по мере выдачи
+    результатов: одновременно в работе и в очереди не больше `max_pending` задач.
+
+    Возвращает:
+    -----------
+    generator
+        Результаты func(task) в порядке задач.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def iter_tokenized_corpus(texts, workers=None, chunk_size=10_000):
+    """
+    Потоково токенизирует тексты на нескольких процессах.
+
+    Тексты читаются порциями по `chunk_size`, порции обрабатываются пулом из `workers`
+    процессов (по умолчанию — по числу ядер), токенизированные тексты выдаются
+    по одному в исходном порядке. При workers=1 обработка идёт в текущем процессе.
+
+    Возвращает:
+    -----------
+    generator of list of str
+        Списки токенов для каждого текста.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        for chunk in iter_chunks(texts, chunk_size):
+            yield from _tokenize_chunk(chunk)
+        return
+
+    with get_pool_context().Pool(workers) as pool:
+        for tokens in imap_bounded(pool, _tokenize_chunk, iter_chunks(texts, chunk_size), 2 * workers):
+            yield from tokens
+
+
+def build_corpus(texts, workers=None, chunk_size=10_000, total=None, desc="Создание корпуса"):
+    """
+    Собирает токенизированный корпус в список с отображением прогресса.
+
+    Если число текстов известно и не превышает одной порции, пул процессов не создаётся.
+
+    Возвращает:
+    -----------
+    list of list of str
+        Токенизированные и предобработанные тексты в исходном порядке.
+    """
+    if total is None and hasattr(texts, '__len__'):
+        total = len(texts)
+    if total is not None and total <= chunk_size:
+        workers = 1
+
+    corpus_iter = iter_tokenized_corpus(texts, workers=workers, chunk_size=chunk_size)
+    return list(tqdm(corpus_iter, total=total, desc=desc))
+
+
+def write_corpus_file(texts, path, workers=None, chunk_size=10_000, total=None, desc="Запись корпуса"):
+    """
+    Токенизирует тексты и потоково записывает корпус в файл: одна строка — одно
+    предложение, токены разделены пробелами. Весь корпус в памяти не хранится.
+
+    Возвращает:
+    -----------
+    int
+        Число записанных строк.
+    """
+    if total is None and hasattr(texts, '__len__'):
+        total = len(texts)
+    if total is not None and total <= chunk_size:
+        workers = 1
+
+    n_lines = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        corpus_iter = iter_tokenized_corpus(texts, workers=workers, chunk_size=chunk_size)
+        for tokens in tqdm(corpus_iter, total=total, desc=desc):
+            f.write(' '.join(tokens))
+            f.write('\n')
+            n_lines += 1
+    return n_lines
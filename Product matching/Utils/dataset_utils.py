@@ -8,7 +8,16 @@
 
 Сохраняет:
 - `data/vink_names.joblib` — список оригинальных названий товаров.
-- `data/synthetic_data.csv` — таблица с оригинальными и синтетическими наименованиями.
+- `data/synthetic_data.parquet` — (по запросу, для отладки) таблица с оригинальными
+  и синтетическими наименованиями (Parquet со сжатием zstd, пишется порциями по мере генерации).
+
+Синтетические варианты генерируются порциями на нескольких процессах. Генератор случайных
+чисел инициализируется для каждой строки от (seed, номер строки), поэтому результат
+не зависит от числа процессов и размера порций. Благодаря этому обучающий корпус FastText
+не нужно хранить: `SyntheticCorpus` заново генерирует и токенизирует его на каждой эпохе.
+
+Датасеты пересобираются, только если изменились исходный CSV или параметры подготовки
+(см. `utils.manifest_utils`).
 
 Константы:
 - `DATA_PATH` — путь к исходному CSV с товарами (задается в config.py).
@@ -21,11 +30,20 @@ import pandas as pd
 from tqdm import tqdm
 import joblib
 from config import DATA_PATH
+from utils.corpus_utils import get_pool_context, imap_bounded
+from utils.text_utils import tokenize_product_name
+from utils.manifest_utils import file_hash, is_stage_current, record_stage
 
 # Пути к исходному, обработанному и синтетическому датасетам
 GOODS_DATA_PATH = DATA_PATH
 VINK_NAMES_PATH = 'data/vink_names.joblib'
-SYNTHETIC_DATA_PATH = 'data/synthetic_data.csv'
+SYNTHETIC_DATA_PATH = 'data/synthetic_data.parquet'
+LEGACY_SYNTHETIC_DATA_PATH = 'data/synthetic_data.csv'
+
+# Служебные наименования, исключаемые из каталога, и число синтетических вариантов на наименование
+BAD_NAMES = {'ТЕСТ', 'v', 'test', 'тест', 'Наклейка', 'Образцы', 'Канцелярия', 'Этикетка'}
+SYNTHETIC_K = 10
+SYNTHETIC_SEED = 42
 
 # ---------- Функции модификации наименований ---------- #
 
@@ -88,7 +106,192 @@ mod_functions = [
 
 # ---------- Генерация синтетических данных ---------- #
 
-def generate_synthetic_names(df, column='vink_name', k=10):
+def _synthesize_rows(names, start, k, seed):
+    """
+    Генерирует синтетические варианты для порции наименований, начинающейся со строки `start`.
+    Перед каждой строкой генератор `random` инициализируется от (seed, номер строки).
+
+    Возвращает:
+    -----------
+    tuple(list of str, list of str)
+        Оригинальные и синтетические наименования (пустые варианты пропускаются).
+    """
+    originals, variants = [], []
+    for row, name in enumerate(names, start):
+        random.seed(f'{seed}:{row}')
+        for func in random.choices(mod_functions, k=k):
+            variant = func(name)
+            if variant.strip():
+                originals.append(name)
+                variants.append(variant)
+    return originals, variants
+
+
+def _synthesize_chunk(args):
+    return _synthesize_rows(*args)
+
+
+def iter_synthetic_chunks(names, k=SYNTHETIC_K, seed=SYNTHETIC_SEED, workers=None, chunk_size=10_000):
+    """
+    Генерирует синтетические варианты порциями по `chunk_size` наименований на `workers`
+    процессах (по умолчанию — по числу ядер) и выдаёт порции в исходном порядке.
+
+    Возвращает:
+    -----------
+    generator of tuple(list of str, list of str)
+        Оригинальные и синтетические наименования каждой порции.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tasks = ((names[start:start + chunk_size], start, k, seed) for start in range(0, len(names), chunk_size))
+
+    # Состояние глобального генератора восстанавливается после генерации в текущем процессе
+    if workers <= 1 or len(names) <= chunk_size:
+        state = random.getstate()
+        try:
+            for task in tasks:
+                yield _synthesize_chunk(task)
+        finally:
+            random.setstate(state)
+        return
+
+    with get_pool_context().Pool(workers) as pool:
+        yield from imap_bounded(pool, _synthesize_chunk, tasks, 2 * workers)
+
+
+def _synthesize_and_tokenize_chunk(args):
+    originals, variants = _synthesize_rows(*args)
+    return [tokenize_product_name(f"{name} {variant}") for name, variant in zip(originals, variants)]
+
+
+class SyntheticCorpus:
+    """
+    Переитерируемый поток обучающего корпуса FastText.
+
+    При каждом проходе (gensim проходит корпус при построении словаря и на каждой эпохе)
+    синтетические варианты наименований генерируются заново, пары «оригинал + вариант»
+    нормализуются и токенизируются порциями на `workers` процессах. Проходы совпадают,
+    так как генератор случайных чисел инициализируется для каждой строки. В памяти
+    держатся только наименования каталога и несколько порций корпуса.
+
+    Пул процессов создаётся при первом проходе (из контекста forkserver/spawn, см.
+    `utils.corpus_utils.get_pool_context`) и используется всеми следующими проходами:
+    gensim проходит корпус при живых потоках обучения, и пул не создаётся на каждой эпохе.
+    После обучения пул закрывается `close` (или выходом из блока `with`).
+    """
+
+    def __init__(self, names, k=SYNTHETIC_K, seed=SYNTHETIC_SEED, workers=None, chunk_size=2_000,
+                 desc="Обучение FastText"):
+        self.names = names
+        self.k = k
+        self.seed = seed
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self.desc = desc
+        self._pool = None
+
+    def close(self):
+        """Останавливает пул процессов корпуса, если он был создан."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        tasks = ((self.names[start:start + self.chunk_size], start, self.k, self.seed)
+                 for start in range(0, len(self.names), self.chunk_size))
+        progress = tqdm(total=len(self.names), desc=self.desc)
+        try:
+            if self.workers <= 1 or len(self.names) <= self.chunk_size:
+                state = random.getstate()
+                try:
+                    for task in tasks:
+                        yield from _synthesize_and_tokenize_chunk(task)
+                        progress.update(len(task[0]))
+                finally:
+                    random.setstate(state)
+                return
+
+            if self._pool is None:
+                self._pool = get_pool_context().Pool(self.workers)
+            chunk_sizes = iter(range(0, len(self.names), self.chunk_size))
+            for token_lists in imap_bounded(self._pool, _synthesize_and_tokenize_chunk, tasks, 2 * self.workers):
+                yield from token_lists
+                progress.update(min(self.chunk_size, len(self.names) - next(chunk_sizes)))
+        finally:
+            progress.close()
+
+
+def write_synthetic_dataset(names, path=SYNTHETIC_DATA_PATH, k=SYNTHETIC_K, seed=SYNTHETIC_SEED, workers=None,
+                            chunk_size=10_000):
+    """
+    Генерирует синтетические варианты наименований и потоково записывает их в Parquet
+    (колонки 'vink_name' и 'vink_name_synt', сжатие zstd): каждая порция записывается
+    отдельной группой строк, весь синтетический датасет в памяти не хранится.
+
+    Возвращает:
+    -----------
+    int
+        Число записанных строк.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([('vink_name', pa.string()), ('vink_name_synt', pa.string())])
+    tmp_path = path + '.tmp'
+    n_rows = 0
+    with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer, \
+            tqdm(total=len(names), desc="Генерация синтетических наименований") as progress:
+        for originals, variants in iter_synthetic_chunks(names, k=k, seed=seed, workers=workers,
+                                                         chunk_size=chunk_size):
+            writer.write_table(pa.table([originals, variants], schema=schema))
+            n_rows += len(variants)
+            progress.update(min(chunk_size, len(names) - progress.n))
+    os.replace(tmp_path, path)
+    return n_rows
+
+
+def iter_synthetic_texts(path=SYNTHETIC_DATA_PATH, batch_size=65_536):
+    """
+    Потоково читает синтетический датасет (Parquet или CSV прежнего формата) и выдаёт
+    тексты обучающего корпуса: оригинальное и синтетическое наименования через пробел.
+
+    Возвращает:
+    -----------
+    generator of str
+        Тексты в порядке строк датасета.
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        batches = (
+            (batch.column(0).to_pylist(), batch.column(1).to_pylist())
+            for batch in pq.ParquetFile(path).iter_batches(batch_size, columns=['vink_name', 'vink_name_synt'])
+        )
+    else:
+        batches = (
+            (chunk['vink_name'].tolist(), chunk['vink_name_synt'].tolist())
+            for chunk in pd.read_csv(path, chunksize=batch_size)
+        )
+    for names, variants in batches:
+        for name, variant in zip(names, variants):
+            yield f"{name} {variant}"
+
+
+def count_synthetic_rows(path=SYNTHETIC_DATA_PATH):
+    """Возвращает число строк синтетического датасета (для Parquet — по метаданным файла)."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    return sum(len(chunk) for chunk in pd.read_csv(path, chunksize=65_536, usecols=['vink_name']))
+
+
+def generate_synthetic_names(df, column='vink_name', k=10, seed=None):
     """
     Генерирует синтетические варианты наименований товаров с помощью случайных модификаций.
 
@@ -96,6 +299,9 @@ def generate_synthetic_names(df, column='vink_name', k=10):
     функций модификации текста из заранее заданного списка `mod_functions`. Каждое изменение
     сохраняется вместе с оригинальным наименованием в выходной датафрейм.
 
+    Если задан `seed`, генератор инициализируется для каждой строки от (seed, номер строки),
+    как при записи датасета (`write_synthetic_dataset`), и результат воспроизводим.
+
     Возвращает:
     -----------
     pd.DataFrame
@@ -103,6 +309,13 @@ def generate_synthetic_names(df, column='vink_name', k=10):
         - 'vink_name' — оригинальное наименование
         - 'vink_name_synt' — синтетически модифицированное наименование
     """
+    if seed is not None:
+        originals, variants = [], []
+        for chunk_originals, chunk_variants in iter_synthetic_chunks(df[column].tolist(), k=k, seed=seed, workers=1):
+            originals += chunk_originals
+            variants += chunk_variants
+        return pd.DataFrame({'vink_name': originals, 'vink_name_synt': variants})
+
     synthetic_data = []
 
     for name in tqdm(df[column].tolist(), desc="Генерация синтетических наименований"):
@@ -117,51 +330,79 @@ def generate_synthetic_names(df, column='vink_name', k=10):
 
 # ---------- Основная функция подготовки ---------- #
 
-def prepare_processed_and_synthetic_datasets(csv_path=DATA_PATH):
+def load_goods(csv_path=DATA_PATH):
+    """
+    Читает исходный CSV и очищает список товаров: удаляет дубликаты, пропуски и служебные наименования.
+
+    Возвращает:
+    -----------
+    pd.DataFrame
+        Датафрейм с колонками 'vink_id' (SKU) и 'vink_name' в порядке исходного файла.
+    """
+    goods = pd.read_csv(csv_path)
+    goods = goods[['sku_id', 'sku_name']].drop_duplicates().dropna()
+    goods.columns = ['vink_id', 'vink_name']
+
+    return goods[~goods['vink_name'].isin(BAD_NAMES)]
+
+
+def prepare_processed_and_synthetic_datasets(csv_path=DATA_PATH, workers=None, write_synthetic=False,
+                                             save_dir_model='models'):
     """
-    Загружает и подготавливает обработанный и синтетический датасеты наименований товаров.
+    Загружает и подготавливает обработанный (и, по запросу, синтетический) датасеты наименований товаров.
+
+    Если файлы уже существуют и собраны из текущего исходного CSV с текущими параметрами
+    (по манифесту сборки), они загружаются. В противном случае функция читает исходный CSV-файл,
+    очищает данные и фильтрует неподходящие наименования.
 
-    Если файлы с обработанными и синтетическими данными уже существуют, они загружаются.
-    В противном случае функция читает исходный CSV-файл, очищает данные, фильтрует неподходящие
-    наименования и генерирует синтетические варианты с помощью набора модификаций. Результаты
-    сохраняются на диск для повторного использования.
+    Синтетические варианты для обучения FastText генерируются потоково при обучении
+    (`SyntheticCorpus`), поэтому на диск по умолчанию не пишутся. При write_synthetic=True
+    они дополнительно записываются в `data/synthetic_data.parquet` для отладки и анализа
+    (порциями на `workers` процессах); файл можно читать потоково (`iter_synthetic_texts`)
+    или целиком через `pd.read_parquet`.
 
     Возвращает:
     -----------
     vink_names : list of str
         Список уникальных, очищенных наименований товаров.
-    synthetic_data : pd.DataFrame
-        Датафрейм с синтетически изменёнными наименованиями.
+    synthetic_path : str или None
+        Путь к синтетическому датасету в формате Parquet (None, если он не записывается).
     """
 
-    if os.path.exists(VINK_NAMES_PATH) and os.path.exists(SYNTHETIC_DATA_PATH):
-        print("Обработанный и синтетический датасет на месте, подготовка не требуется.")
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
+    outputs = [VINK_NAMES_PATH, SYNTHETIC_DATA_PATH] if write_synthetic else [VINK_NAMES_PATH]
+    synthetic_path = SYNTHETIC_DATA_PATH if write_synthetic else None
+    source_exists = os.path.exists(csv_path)
+    if source_exists:
+        inputs = {'source': file_hash(csv_path, manifest_path), 'bad_names': sorted(BAD_NAMES), 'synthetic_k': SYNTHETIC_K,
+                  'synthetic_seed': SYNTHETIC_SEED}
+
+    if all(os.path.exists(path) for path in outputs) and (
+        not source_exists or is_stage_current('datasets', inputs, outputs, manifest_path)
+    ):
+        print("Датасеты на месте, подготовка не требуется.")
         vink_names = joblib.load(VINK_NAMES_PATH)
-        synthetic_data = pd.read_csv(SYNTHETIC_DATA_PATH)
-        return vink_names, synthetic_data
+        return vink_names, synthetic_path
 
-    if not os.path.exists(csv_path):
+    if not source_exists:
         raise FileNotFoundError(f"Исходный файл не найден: {csv_path}")
 
-    print("Загружаем исходные данные и готовим обработанный и синтетический датасеты...")
+    print("Загружаем исходные данные и готовим обработанный датасет...")
 
     # Подготовка обработанного датасета
-    goods = pd.read_csv(csv_path)
-    goods = goods[['sku_id', 'sku_name']].drop_duplicates().dropna()
-    goods.columns = ['vink_id', 'vink_name']
-
-    bad_names = {'ТЕСТ', 'v', 'test', 'тест', 'Наклейка', 'Образцы', 'Канцелярия', 'Этикетка'}
-    goods = goods[~goods['vink_name'].isin(bad_names)]
-
+    goods = load_goods(csv_path)
     vink_names = goods['vink_name'].tolist()
 
-    # Генерация синтетических данных
-    synthetic_data = generate_synthetic_names(goods)
-
     os.makedirs('data', exist_ok=True)
     joblib.dump(vink_names, VINK_NAMES_PATH)
-    synthetic_data.to_csv(SYNTHETIC_DATA_PATH, index=False)
 
-    print(f"Обработанный и синтетический датасеты сохранены в: {VINK_NAMES_PATH} и {SYNTHETIC_DATA_PATH}")
+    # Синтетические данные пишутся на диск только по запросу (для обучения они генерируются потоково)
+    if write_synthetic:
+        write_synthetic_dataset(vink_names, SYNTHETIC_DATA_PATH, k=SYNTHETIC_K, seed=SYNTHETIC_SEED, workers=workers)
+    if os.path.exists(LEGACY_SYNTHETIC_DATA_PATH):
+        os.remove(LEGACY_SYNTHETIC_DATA_PATH)
+    record_stage('datasets', inputs, outputs, manifest_path)
+
+    print(f"Датасеты сохранены в: {', '.join(outputs)}")
 
-    return vink_names, synthetic_data
\ No newline at end of file
+    return vink_names, synthetic_path
\ No newline at end of file
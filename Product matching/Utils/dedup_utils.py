@@ -0,0 +1,237 @@
+"""
+Модуль поиска дубликатов внутри каталога.
+
+Поиск всех пар похожих наименований выполняется без перебора пар в Python:
+1. `find_similar_pairs` — блочное умножение нормированной матрицы эмбеддингов каталога
+   на себя: матрица делится на блоки строк, для каждой пары блоков (только над диагональю)
+   считается плитка косинусных сходств и из неё берутся пары не ниже порога. Плитка небольшая
+   (по умолчанию 1024 x 1024, 4 МБ) и помещается в кэш процессора: отбор пар по порогу на ней
+   в несколько раз быстрее, чем на плитках размером с доступную память. Блоки строк
+   обрабатываются параллельно в потоках (numpy отпускает GIL при умножении и сравнении).
+2. `confirm_pairs` — подтверждение пар по токенам BM25-индекса: доля общих токенов
+   с весами IDF должна быть не ниже порога; при несовпадающих числовых атрибутах
+   (например, толщине 3 мм и 6 мм) пара отбрасывается.
+3. `UnionFind` / `cluster_pairs` — объединение подтверждённых пар в кластеры дубликатов.
+
+`find_duplicates` выполняет все этапы и возвращает таблицу кластеров.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from utils.attribute_utils import extract_attributes
+
+
+class UnionFind:
+    """Система непересекающихся множеств на массивах numpy (объединение по размеру, сжатие путей)."""
+
+    def __init__(self, size):
+        self.parent = np.arange(size, dtype=np.int64)
+        self.size = np.ones(size, dtype=np.int64)
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+
+def _block_pairs(embeddings, start, stop, block_size, threshold):
+    """Пары (i, j), i < j, с i в [start, stop) и сходством не ниже порога, по плиткам блока строк."""
+    rows = embeddings[start:stop]
+    found_i, found_j, found_sim = [], [], []
+    for col_start in range(start, len(embeddings), block_size):
+        tile = rows @ embeddings[col_start:col_start + block_size].T
+        flat = np.flatnonzero(tile >= threshold)
+        i, j = start + flat // tile.shape[1], col_start + flat % tile.shape[1]
+        if col_start == start:
+            # На диагональной плитке оставляем только пары над диагональю
+            above = j > i
+            flat, i, j = flat[above], i[above], j[above]
+        if len(flat):
+            found_i.append(i)
+            found_j.append(j)
+            found_sim.append(tile.ravel()[flat])
+    if not found_i:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_sim)
+
+
+def find_similar_pairs(embeddings, threshold=0.95, block_size=1024, workers=None):
+    """
+    Находит все пары строк матрицы эмбеддингов с косинусным сходством не ниже `threshold`.
+    Строки матрицы должны быть нормированы (как у `prepare_catalog_embeddings`).
+
+    Сходства считаются плитками `block_size` x `block_size`, блоки строк обрабатываются
+    на `workers` потоках (по умолчанию — по числу ядер).
+
+    Возвращает:
+    -----------
+    tuple(np.ndarray, np.ndarray, np.ndarray)
+        Номера строк i и j (i < j) и сходство каждой пары; пары упорядочены по i, затем по j.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    starts = range(0, len(embeddings), block_size)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_block_pairs, embeddings, start, start + block_size, block_size, threshold)
+                   for start in starts]
+        parts = [future.result() for future in tqdm(futures, desc="Поиск похожих пар")]
+
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    pair_i, pair_j, similarity = (np.concatenate(arrays) for arrays in zip(*parts))
+    order = np.lexsort((pair_j, pair_i))
+    return pair_i[order], pair_j[order], similarity[order]
+
+
+def token_overlap(bm25_index, pair_i, pair_j, chunk_size=100_000):
+    """
+    Доля общих токенов пар документов с весами IDF: сумма IDF общих терминов, делённая
+    на меньшую из сумм IDF терминов двух документов (1 — токены одного документа
+    содержатся в другом).
+
+    Возвращает:
+    -----------
+    np.ndarray
+        Доля общих токенов для каждой пары.
+    """
+    # Матрица документ-термин с весом IDF для каждого термина документа
+    term_doc = bm25_index.matrix
+    doc_term = term_doc.T.tocsr()
+    term_ids = np.asarray(doc_term.indices)
+    weights = doc_term.copy()
+    weights.data = np.asarray(bm25_index.idf, dtype=np.float64)[term_ids]
+    presence = doc_term.copy()
+    presence.data = np.ones(len(term_ids))
+    totals = np.asarray(weights.sum(axis=1)).ravel()
+
+    overlap = np.empty(len(pair_i))
+    for start in range(0, len(pair_i), chunk_size):
+        i, j = pair_i[start:start + chunk_size], pair_j[start:start + chunk_size]
+        shared = np.asarray(weights[i].multiply(presence[j]).sum(axis=1)).ravel()
+        smaller = np.minimum(totals[i], totals[j])
+        overlap[start:start + chunk_size] = np.divide(shared, smaller, out=np.zeros_like(shared), where=smaller > 0)
+    return overlap
+
+
+def attributes_agree(vink_names, pair_i, pair_j):
+    """
+    Проверяет, что числовые атрибуты наименований пары не противоречат друг другу:
+    наборы атрибутов совпадают или у одного из наименований атрибутов нет.
+
+    Возвращает:
+    -----------
+    np.ndarray of bool
+        Признак согласия атрибутов для каждой пары.
+    """
+    rows = np.unique(np.concatenate([pair_i, pair_j]))
+    names = vink_names.take_names(rows) if hasattr(vink_names, 'take_names') else [vink_names[i] for i in rows]
+    attributes = {row: frozenset(extract_attributes(name)) for row, name in zip(rows.tolist(), names)}
+    return np.array([not attributes[i] or not attributes[j] or attributes[i] == attributes[j]
+                     for i, j in zip(pair_i.tolist(), pair_j.tolist())], dtype=bool)
+
+
+def confirm_pairs(bm25_index, vink_names, pair_i, pair_j, min_overlap=0.8, check_attributes=True):
+    """
+    Отбирает пары, подтверждённые токенами: доля общих токенов (`token_overlap`) не ниже
+    `min_overlap` и, при check_attributes=True, непротиворечивые числовые атрибуты.
+
+    Возвращает:
+    -----------
+    tuple(np.ndarray, np.ndarray)
+        Маска подтверждённых пар и доля общих токенов каждой пары.
+    """
+    overlap = token_overlap(bm25_index, pair_i, pair_j)
+    confirmed = overlap >= min_overlap
+    if check_attributes and confirmed.any():
+        candidates = np.flatnonzero(confirmed)
+        confirmed[candidates] = attributes_agree(vink_names, pair_i[candidates], pair_j[candidates])
+    return confirmed, overlap
+
+
+def cluster_pairs(n_items, pair_i, pair_j):
+    """
+    Объединяет пары в кластеры (`UnionFind`).
+
+    Возвращает:
+    -----------
+    np.ndarray
+        Номер кластера для каждого элемента, входящего в пары (-1 — элемент без пары).
+        Кластеры пронумерованы с 0 в порядке наименьшего элемента.
+    """
+    union_find = UnionFind(n_items)
+    for i, j in zip(pair_i.tolist(), pair_j.tolist()):
+        union_find.union(i, j)
+
+    labels = np.full(n_items, -1, dtype=np.int64)
+    members = np.unique(np.concatenate([pair_i, pair_j])).astype(np.int64)
+    if not len(members):
+        return labels
+    roots = np.array([union_find.find(x) for x in members.tolist()], dtype=np.int64)
+    _, first, inverse = np.unique(roots, return_index=True, return_inverse=True)
+    # Номера кластеров — по порядку первого (наименьшего) элемента
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    labels[members] = rank[inverse]
+    return labels
+
+
+def find_duplicates(vink_names, catalog_embeddings, bm25_index, threshold=0.95, min_overlap=0.8,
+                    check_attributes=True, block_size=1024, workers=None):
+    """
+    Находит кластеры дубликатов в каталоге: похожие пары по эмбеддингам (`find_similar_pairs`),
+    подтверждение по токенам и атрибутам (`confirm_pairs`) и объединение в кластеры (`cluster_pairs`).
+
+    Возвращает:
+    -----------
+    tuple(pandas.DataFrame, pandas.DataFrame)
+        Кластеры — по строке на наименование, входящее в кластер: 'cluster_id', 'cluster_size',
+        'vink_idx', 'vink_id' (только для `CatalogStore`) и 'vink_name';
+        подтверждённые пары — 'vink_idx_1', 'vink_idx_2', 'similarity', 'token_overlap'.
+    """
+    if len(catalog_embeddings) != len(vink_names) or bm25_index.corpus_size != len(vink_names):
+        raise ValueError("Матрица эмбеддингов и BM25-индекс не соответствуют списку vink_names.")
+
+    pair_i, pair_j, similarity = find_similar_pairs(catalog_embeddings, threshold, block_size, workers)
+    print(f"Пар со сходством не ниже {threshold}: {len(pair_i)}")
+    confirmed, overlap = confirm_pairs(bm25_index, vink_names, pair_i, pair_j, min_overlap, check_attributes)
+    print(f"Подтверждено по токенам: {int(confirmed.sum())}")
+
+    pairs = pd.DataFrame({
+        'vink_idx_1': pair_i[confirmed],
+        'vink_idx_2': pair_j[confirmed],
+        'similarity': similarity[confirmed],
+        'token_overlap': overlap[confirmed],
+    })
+
+    labels = cluster_pairs(len(vink_names), pairs['vink_idx_1'].to_numpy(), pairs['vink_idx_2'].to_numpy())
+    rows = np.flatnonzero(labels >= 0)
+    rows = rows[np.lexsort((rows, labels[rows]))]
+    cluster_ids = labels[rows]
+    clusters = {
+        'cluster_id': cluster_ids,
+        'cluster_size': np.bincount(cluster_ids)[cluster_ids] if len(rows) else cluster_ids,
+        'vink_idx': rows,
+    }
+    if hasattr(vink_names, 'resolve_ids'):
+        clusters['vink_id'] = vink_names.resolve_ids(rows)
+    clusters['vink_name'] = vink_names.take_names(rows) if hasattr(vink_names, 'take_names') else [vink_names[i] for i in rows]
+    clusters = pd.DataFrame(clusters)
+    print(f"Кластеров дубликатов: {clusters['cluster_id'].nunique()}, наименований в них: {len(clusters)}")
+    return clusters, pairs
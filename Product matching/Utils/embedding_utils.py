@@ -0,0 +1,135 @@
+"""
+Модуль для подготовки матрицы эмбеддингов каталога товаров.
+
+Содержит функции для:
+- Расчёта L2-нормированных эмбеддингов для списка наименований.
+- Однократного построения и сохранения матрицы эмбеддингов всего каталога.
+- Векторизованного доранжирования кандидатов по заранее рассчитанной матрице.
+
+Сохраняет:
+- `models/catalog_embeddings.npy` — матрица эмбеддингов `vink_names` (float32, строки нормированы).
+"""
+
+import os
+import joblib
+import numpy as np
+from tqdm import tqdm
+from utils.text_utils import get_embedding, get_text_config
+from utils.vectors_utils import ServingVectors
+from utils.manifest_utils import config_hash, file_hash, get_stage_build_id, is_stage_current, record_stage
+
+
+def normalize_rows(matrix):
+    """
+    Нормирует строки матрицы по L2-норме. Нулевые строки остаются нулевыми,
+    поэтому их сходство с любым вектором равно 0 (как у `cosine_similarity`).
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def embed_token_lists(token_lists, wv_embeddings):
+    """
+    Рассчитывает эмбеддинги для уже предобработанных и токенизированных текстов.
+    Повторяет `get_embedding`, но без повторной предобработки текста.
+
+    Возвращает:
+    -----------
+    np.ndarray
+        Матрица размера (len(token_lists), vector_size) в float32 с L2-нормированными строками.
+    """
+    dim = wv_embeddings.vector_size
+    matrix = np.zeros((len(token_lists), dim), dtype=np.float32)
+    for i, words in enumerate(token_lists):
+        word_vectors = [wv_embeddings[word] for word in words if word in wv_embeddings]
+        if word_vectors:
+            matrix[i] = np.mean(word_vectors, axis=0)
+    return normalize_rows(matrix)
+
+
+def embed_names(names, wv_embeddings, desc=None):
+    """
+    Рассчитывает эмбеддинги для списка наименований.
+
+    Возвращает:
+    -----------
+    np.ndarray
+        Матрица размера (len(names), vector_size) в float32 с L2-нормированными строками.
+    """
+    dim = wv_embeddings.vector_size
+    matrix = np.zeros((len(names), dim), dtype=np.float32)
+    names_iter = tqdm(names, desc=desc) if desc else names
+    for i, name in enumerate(names_iter):
+        matrix[i] = get_embedding(name, wv_embeddings, dim)
+    return normalize_rows(matrix)
+
+
+def prepare_catalog_embeddings(fasttext_model, save_dir_names='data', save_dir_model='models'):
+    """
+    Строит матрицу эмбеддингов всех наименований каталога.
+
+    Если матрица уже сохранена на диске и рассчитана по текущим наименованиям текущей
+    FastText-моделью или облегчёнными векторами `ServingVectors` (по манифесту сборки),
+    она загружается. Матрица считается теми же векторами, что и эмбеддинги запросов.
+    В противном случае каждое
+    наименование из `vink_names` один раз прогоняется через `get_embedding`, строки
+    нормируются и результат сохраняется для повторного использования в `match_query`.
+
+    Возвращает:
+    -----------
+    np.ndarray
+        Матрица эмбеддингов каталога (float32), строка i соответствует vink_names[i].
+        Возвращает None, если отсутствует файл с предобработанными наименованиями.
+    """
+
+    matrix_path = os.path.join(save_dir_model, 'catalog_embeddings.npy')
+    names_path = os.path.join(save_dir_names, 'vink_names.joblib')
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
+
+    if not os.path.exists(save_dir_model):
+        os.makedirs(save_dir_model)
+        print(f"Создана директория под модель: {save_dir_model}")
+
+    if not os.path.exists(names_path):
+        print("Подготовьте обработанный датасет.")
+        return None
+
+    vectors_stage = 'fasttext_serving' if isinstance(fasttext_model, ServingVectors) else 'fasttext'
+    inputs = {
+        'vink_names': file_hash(names_path, manifest_path),
+        'text_config': config_hash(get_text_config()),
+        'fasttext': get_stage_build_id(vectors_stage, manifest_path),
+    }
+    if is_stage_current('catalog_embeddings', inputs, [matrix_path], manifest_path):
+        print("Матрица эмбеддингов каталога на месте, расчёт не требуется")
+        return np.load(matrix_path)
+
+    if fasttext_model is None or not hasattr(fasttext_model, 'wv'):
+        raise ValueError("FastText-модель не загружена или повреждена.")
+
+    vink_names = joblib.load(names_path)
+    catalog_embeddings = embed_names(vink_names, fasttext_model.wv, desc="Эмбеддинги каталога")
+
+    np.save(matrix_path, catalog_embeddings)
+    record_stage('catalog_embeddings', inputs, [matrix_path], manifest_path)
+    print(f"Матрица эмбеддингов каталога сохранена в {matrix_path}")
+
+    return catalog_embeddings
+
+
+def rerank_candidates(query_vec, candidate_indices, catalog_embeddings):
+    """
+    Считает косинусное сходство запроса с кандидатами одним матричным умножением.
+
+    Вектор запроса нормируется, строки кандидатов берутся из заранее нормированной
+    матрицы каталога по индексам.
+
+    Возвращает:
+    -----------
+    np.ndarray
+        Массив сходств в порядке `candidate_indices`.
+    """
+    query_vec = normalize_rows(np.asarray(query_vec).reshape(1, -1))[0]
+    return catalog_embeddings[np.asarray(candidate_indices)] @ query_vec
@@ -1,78 +1,159 @@
 
 import os
 import random
+import joblib
 import numpy as np
-import pandas as pd
 from tqdm import tqdm
-from gensim.models import FastText
-from nltk.tokenize import word_tokenize
-from utils.text_utils import preprocess_text
-from config import DATA_PATH
+from utils.corpus_utils import iter_tokenized_corpus
+from utils.dataset_utils import (VINK_NAMES_PATH, SYNTHETIC_K, SYNTHETIC_SEED, SyntheticCorpus,
+                                 iter_synthetic_texts, count_synthetic_rows)
+from utils.text_utils import get_text_config
+from utils.manifest_utils import config_hash, file_hash, is_stage_current, record_stage
 
 
-def train_and_save_fasttext_model(csv_path=DATA_PATH, model_save_path='models/fasttext_model_full.model', vector_size=200, epochs=5):    
+class SyntheticFileCorpus:
     """
-    Обучает FastText-модель на паре оригинальных и синтетических наименований товаров 
-    или загружает уже обученную модель из файла, если она существует.
+    Переитерируемый корпус из готового синтетического датасета (Parquet или CSV):
+    при каждом проходе файл читается и токенизируется потоково.
+    """
+
+    def __init__(self, path, workers=None, desc="Обучение FastText"):
+        self.path = path
+        self.workers = workers
+        self.desc = desc
+
+    def __iter__(self):
+        corpus_iter = iter_tokenized_corpus(iter_synthetic_texts(self.path), workers=self.workers)
+        return iter(tqdm(corpus_iter, total=count_synthetic_rows(self.path), desc=self.desc))
 
-    Модель обучается на тексте, составленном из объединения колонок 'vink_name' и 'vink_name_synt'.
-    Каждый текст предварительно очищается и токенизируется. После обучения модель сохраняется на диск.
+
+def train_and_save_fasttext_model(csv_path=None, model_save_path='models/fasttext_model_full.model', vector_size=200, epochs=5,
+                                  workers=None, min_count=5, bucket=2_000_000, deterministic=False, load_model=True,
+                                  names_path=VINK_NAMES_PATH, corpus_file=True):
+    """
+    Обучает FastText-модель на паре оригинальных и синтетических наименований товаров 
+    или загружает уже обученную модель из файла, если она существует и обучена на текущих
+    данных с текущими параметрами (по манифесту сборки).
+
+    Модель обучается на текстах «оригинальное наименование + синтетический вариант».
+    Корпус не держится в памяти: `SyntheticCorpus` генерирует варианты для наименований
+    из `names_path`, нормализует и токенизирует их порциями на `workers` процессах
+    (по умолчанию — по числу ядер), поэтому память не растёт с размером каталога.
+    Если передан `csv_path` — готовый синтетический датасет (Parquet или CSV прежнего формата,
+    см. `prepare_processed_and_synthetic_datasets(write_synthetic=True)`), корпус потоково читается из него.
+    После обучения модель сохраняется на диск.
+
+    Режимы обучения:
+    - по умолчанию (`corpus_file=True`) поток корпуса один раз записывается в текстовый файл
+      (одна строка — одно предложение, рядом с моделью, `*_corpus.txt`) и модель обучается
+      через `corpus_file` gensim: каждый поток обучения читает свою часть файла, поэтому обучение
+      масштабируется по ядрам; цена — место на диске под файл корпуса;
+    - `corpus_file=False` — модель обучается на потоке корпуса без файла на диске: корпус
+      заново генерируется на каждой эпохе, а предложения раздаёт потокам обучения один поток
+      gensim, поэтому на многоядерных машинах обучение заметно медленнее;
+      результат зависит от планирования потоков и между запусками немного отличается;
+    - `deterministic=True` — поток корпуса, один поток обучения и фиксированный seed.
+      Используется, когда воспроизводимость важнее скорости. Для полной
+      воспроизводимости процесс также нужно запускать с фиксированным `PYTHONHASHSEED`.
+
+    Параметры `min_count` и `bucket` (число корзин n-грамм) передаются в gensim без изменений;
+    уменьшение `bucket` сокращает размер модели ценой большего числа коллизий n-грамм.
+
+    При `load_model=False` актуальная модель с диска не загружается (функция только проверяет,
+    что переобучение не требуется) — для поиска используются облегчённые векторы
+    (`utils.vectors_utils.prepare_serving_vectors`).
 
     Возвращает:
     -----------
     gensim.models.FastText
         Обученная или загруженная FastText-модель.
+        Возвращает None, если модель актуальна и `load_model=False`.
     """
 
-    if os.path.exists(model_save_path):
+    manifest_path = os.path.join(os.path.dirname(model_save_path) or '.', 'manifest.json')
+    source_path = csv_path or names_path
+
+    if not os.path.exists(source_path):
+        if os.path.exists(model_save_path):
+            print(f"FastText-модель на месте, обучение не требуется")
+            if not load_model:
+                return None
+            from gensim.models import FastText
+            return FastText.load(model_save_path)
+        raise FileNotFoundError(f"Файл с данными для обучения не найден: {source_path}")
+
+    if csv_path is not None:
+        corpus_inputs = {'synthetic_data': file_hash(csv_path, manifest_path)}
+    else:
+        corpus_inputs = {'vink_names': file_hash(names_path, manifest_path),
+                         'synthetic': {'k': SYNTHETIC_K, 'seed': SYNTHETIC_SEED}}
+    inputs = {
+        **corpus_inputs,
+        'text_config': config_hash(get_text_config()),
+        'params': {'vector_size': vector_size, 'epochs': epochs, 'window': 5, 'min_count': min_count,
+                   'bucket': bucket, 'deterministic': deterministic},
+    }
+    if is_stage_current('fasttext', inputs, [model_save_path], manifest_path):
         print(f"FastText-модель на месте, обучение не требуется")
+        if not load_model:
+            return None
+        from gensim.models import FastText
         return FastText.load(model_save_path)
 
-    df = pd.read_csv(csv_path)
+    # gensim импортируется только при загрузке или обучении модели
+    from gensim.models import FastText
 
-    print(f"Приступаем к обучению FastText-модели на {df.shape[0]} строках")
+    if workers is None:
+        workers = os.cpu_count() or 1
 
-    def create_corpus(df, col1, col2):
-        """
-        Создаёт корпус для обучения модели FastText из двух текстовых колонок датафрейма.
-
-        Для каждой строки объединяет значения двух указанных колонок, применяет предобработку
-        текста и токенизацию, после чего добавляет результат в список. Используется для
-        генерации обучающего корпуса на паре оригинального и синтетического названия товара.
-
-        Возвращает:
-        -----------
-        Список токенизированных и предобработанных строк, готовых к обучению модели FastText.
-        """
-
-        corpus = []
-        for _, row in tqdm(df.iterrows(), total=df.shape[0], desc="Создание корпуса"):
-            text = f"{row[col1]} {row[col2]}"
-            processed = preprocess_text(text)
-            corpus.append(word_tokenize(processed))
-        return corpus
-
-    corpus = create_corpus(df, 'vink_name', 'vink_name_synt')
+    if csv_path is not None:
+        corpus = SyntheticFileCorpus(csv_path, workers=workers)
+        print(f"Приступаем к обучению FastText-модели на {count_synthetic_rows(csv_path)} строках из {csv_path}")
+    else:
+        vink_names = joblib.load(names_path)
+        corpus = SyntheticCorpus(vink_names, workers=workers)
+        print(f"Приступаем к обучению FastText-модели на потоке синтетических данных "
+              f"для {len(vink_names)} наименований")
 
     # Фиксируем воспроизводимость результатов и обучаем модель
     SEED = 42
     random.seed(SEED)
     np.random.seed(SEED)
 
-    class TqdmCorpus:
-        def __init__(self, corpus): self.corpus = corpus
-        def __iter__(self): return (doc for doc in tqdm(self.corpus, desc="Обучение FastText"))
-
-    model = FastText(
-        sentences=TqdmCorpus(corpus),
+    params = dict(
         vector_size=vector_size,
         window=5,
         epochs=epochs,
+        min_count=min_count,
+        bucket=bucket,
         seed=SEED,
-        workers=1
     )
 
+    try:
+        if deterministic:
+            model = FastText(sentences=corpus, workers=1, **params)
+        elif corpus_file:
+            corpus_path = os.path.splitext(model_save_path)[0] + '_corpus.txt'
+            os.makedirs(os.path.dirname(corpus_path) or '.', exist_ok=True)
+            corpus.desc = "Запись корпуса"
+            with open(corpus_path, 'w', encoding='utf-8') as f:
+                for tokens in corpus:
+                    f.write(' '.join(tokens))
+                    f.write('\n')
+            if hasattr(corpus, 'close'):
+                corpus.close()
+
+            print(f"Обучаем FastText-модель на {workers} потоках...")
+            model = FastText(corpus_file=corpus_path, workers=workers, **params)
+        else:
+            print(f"Обучаем FastText-модель на {workers} потоках...")
+            model = FastText(sentences=corpus, workers=workers, **params)
+    finally:
+        if hasattr(corpus, 'close'):
+            corpus.close()
+
     model.save(model_save_path)
+    record_stage('fasttext', inputs, [model_save_path], manifest_path)
     print(f"FastText-модель сохранена в {model_save_path}")
 
     return model
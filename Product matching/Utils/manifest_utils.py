@@ -0,0 +1,208 @@
+"""
+Модуль для учёта собранных артефактов (манифест сборки).
+
+Для каждого этапа сборки (датасеты, BM25, FastText, эмбеддинги каталога, ANN-индекс)
+в манифесте хранится отпечаток его входов: хэши содержимого входных файлов, конфигурация
+предобработки и параметры построения. Этап пересобирается, только если отпечаток
+изменился или отсутствует какой-либо из его выходных файлов. Каждая сборка этапа получает
+уникальный `build_id`, на который ссылаются зависящие от него этапы.
+
+Изменения манифеста выполняются под общей блокировкой, поэтому этапы можно
+готовить в параллельных потоках одного процесса.
+
+Артефакты-директории (BM25-индекс, векторы FastText, шарды) публикуются версиями:
+каждая сборка пишется в новую поддиректорию (`new_version_dir`), а затем указатель
+`CURRENT` атомарно переключается на неё (`publish_version`). Предыдущая версия сохраняется
+до следующей публикации: читатель, который только что прочитал указатель, дочитает её
+целиком. Более старые версии удаляются, если их файлы не заняты: на Windows отображённые
+в память файлы работающего сервиса удалить нельзя, они удаляются при следующей публикации.
+Читатели открывают версию, на которую указывает `CURRENT` (`current_version_dir`).
+
+Сохраняет:
+- `models/manifest.json` — отпечатки этапов и кэш хэшей файлов (по размеру и времени изменения).
+"""
+
+import os
+import re
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+
+MANIFEST_PATH = 'models/manifest.json'
+CURRENT_VERSION_FILE = 'CURRENT'
+_VERSION_NAME = re.compile(r'v\d{14}-[0-9a-f]{8}')
+_manifest_lock = threading.RLock()
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
+        return {'stages': {}, 'files': {}}
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest.setdefault('stages', {})
+    manifest.setdefault('files', {})
+    return manifest
+
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def config_hash(obj):
+    """Возвращает SHA-256 от JSON-представления объекта (ключи сортируются)."""
+    payload = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_hash(path, manifest_path=MANIFEST_PATH, chunk_size=1 << 20):
+    """
+    Возвращает SHA-256 содержимого файла.
+
+    Хэш кэшируется в манифесте вместе с размером и временем изменения файла,
+    поэтому неизменённые большие файлы повторно не читаются.
+    """
+    stat = os.stat(path)
+    manifest = load_manifest(manifest_path)
+    cached = manifest['files'].get(path)
+    if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+        return cached['sha256']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+
+    with _manifest_lock:
+        manifest = load_manifest(manifest_path)
+        manifest['files'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        save_manifest(manifest, manifest_path)
+    return digest.hexdigest()
+
+
+def record_stage(stage, inputs, outputs, manifest_path=MANIFEST_PATH):
+    """
+    Записывает в манифест отпечаток входов и список выходов собранного этапа.
+
+    Возвращает:
+    -----------
+    str
+        Новый build_id этапа.
+    """
+    build_id = uuid.uuid4().hex
+    with _manifest_lock:
+        manifest = load_manifest(manifest_path)
+        manifest['stages'][stage] = {
+            'fingerprint': config_hash(inputs),
+            'inputs': inputs,
+            'outputs': list(outputs),
+            'build_id': build_id,
+            'built_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        save_manifest(manifest, manifest_path)
+    return build_id
+
+
+def is_stage_current(stage, inputs, outputs, manifest_path=MANIFEST_PATH):
+    """
+    Проверяет, актуальны ли выходы этапа для заданных входов.
+
+    Если этап не записан в манифест (например, артефакты собраны до появления манифеста),
+    его входы неизвестны, и этап пересобирается.
+
+    Возвращает:
+    -----------
+    bool
+        True, если этап пересобирать не нужно.
+    """
+    if not all(os.path.exists(path) for path in outputs):
+        return False
+
+    entry = load_manifest(manifest_path)['stages'].get(stage)
+    if entry is None:
+        print(f"Этап '{stage}' отсутствует в манифесте, требуется пересборка.")
+        return False
+
+    if entry['fingerprint'] != config_hash(inputs):
+        changed = sorted(k for k in set(inputs) | set(entry['inputs']) if inputs.get(k) != entry['inputs'].get(k))
+        print(f"Входы этапа '{stage}' изменились ({', '.join(changed)}), требуется пересборка.")
+        return False
+    return True
+
+
+def get_stage_build_id(stage, manifest_path=MANIFEST_PATH):
+    """Возвращает build_id последней сборки этапа или None, если этап не собирался."""
+    entry = load_manifest(manifest_path)['stages'].get(stage)
+    return entry['build_id'] if entry else None
+
+
+def refresh_stage(stage, updated_inputs, manifest_path=MANIFEST_PATH):
+    """
+    Перезаписывает этап с изменёнными входами, сохраняя остальные входы и выходы.
+    Используется, когда артефакты этапа обновлены не полной пересборкой (инкрементально).
+    Если этап не записан в манифест, ничего не делает.
+    """
+    with _manifest_lock:
+        entry = load_manifest(manifest_path)['stages'].get(stage)
+        if entry is None:
+            return None
+        inputs = dict(entry['inputs'], **updated_inputs)
+        return record_stage(stage, inputs, entry['outputs'], manifest_path)
+
+
+def new_version_dir(path):
+    """Создаёт пустую директорию новой версии артефакта `path` (публикуется `publish_version`)."""
+    version_dir = os.path.join(path, datetime.now().strftime('v%Y%m%d%H%M%S-') + uuid.uuid4().hex[:8])
+    os.makedirs(version_dir)
+    return version_dir
+
+
+def publish_version(version_dir):
+    """
+    Делает записанную версию текущей: атомарно заменяет указатель `CURRENT` и удаляет
+    незанятые версии старше предыдущей. Предыдущая версия (или, при первой публикации,
+    файлы прежнего формата без версий) сохраняется для читателей, открывающих её сейчас.
+    """
+    path, version = os.path.split(version_dir.rstrip('/\\'))
+    pointer_path = os.path.join(path, CURRENT_VERSION_FILE)
+    previous = os.path.basename(current_version_dir(path)) if os.path.exists(pointer_path) else None
+    tmp_path = pointer_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pointer_path)
+
+    for name in os.listdir(path):
+        if name in (version, previous, CURRENT_VERSION_FILE):
+            continue
+        if previous is None and not _VERSION_NAME.fullmatch(name):
+            # Файлы прежнего формата — предыдущая версия, удаляются при следующей публикации
+            continue
+        stale = os.path.join(path, name)
+        try:
+            if os.path.isdir(stale):
+                shutil.rmtree(stale)
+            else:
+                os.remove(stale)
+        except OSError:
+            # Файлы ещё открыты (отображены в память) другим процессом — удалятся при следующей публикации
+            pass
+
+
+def current_version_dir(path):
+    """
+    Возвращает директорию текущей версии артефакта `path`. Для артефактов прежнего
+    формата (без указателя `CURRENT`) возвращает сам `path`.
+    """
+    pointer_path = os.path.join(path, CURRENT_VERSION_FILE)
+    if not os.path.exists(pointer_path):
+        return path
+    with open(pointer_path, encoding='utf-8') as f:
+        return os.path.join(path, f.read().strip())
@@ -1,12 +1,82 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
-from nltk.tokenize import word_tokenize
-from sklearn.metrics.pairwise import cosine_similarity
-from utils.text_utils import preprocess_text, get_embedding
+from utils.text_utils import tokenize_product_name, get_embedding
+from utils.embedding_utils import rerank_candidates, embed_token_lists
+from utils.ann_utils import fuse_candidates
+from utils.attribute_utils import extract_attributes, attribute_match_counts
+from utils.metrics_utils import metrics
 
 pd.set_option('display.max_colwidth', None)
 
-def match_query(query_text, vink_names, bm25_model, fasttext_model, k_top=10, n_top=5):
+# Пул потоков для ANN-поиска, выполняемого параллельно с BM25
+_ann_executor = None
+
+# Токен запроса, состоящий только из числа (например, «6» или «5.5»)
+_NUMERIC_TOKEN = re.compile(r'[\d.,]+')
+
+
+def _get_ann_executor():
+    global _ann_executor
+    if _ann_executor is None:
+        _ann_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ann')
+    return _ann_executor
+
+def _fuse_with_ann(bm25_indices, bm25_scores, ann_indices, ann_index, k_top):
+    """
+    Объединяет кандидатов BM25 и ANN. Кандидаты BM25 с нулевым скором (без общих
+    с запросом токенов) отбрасываются, их места могут занять кандидаты ANN.
+
+    Кандидатов всегда min(k_top, число кандидатов BM25): если ANN нашёл меньше документов
+    (в просмотренных кластерах их мало), оставшиеся места в исходном порядке занимают
+    отброшенные кандидаты BM25 с нулевым скором.
+    """
+    bm25_indices = np.asarray(bm25_indices)
+    width = min(k_top, len(bm25_indices))
+    positive = bm25_scores > 0
+    fused = fuse_candidates([bm25_indices[positive], ann_indices], width, weights=(1.0, ann_index.fusion_weight))
+    if len(fused) < width:
+        dropped = bm25_indices[~positive]
+        fused = np.concatenate([fused, dropped[~np.isin(dropped, fused)]])[:width]
+    return fused
+
+
+def _timed_call(stage, func, *args):
+    """Вызывает func, замеряя длительность как этап `stage` (для задач в пуле потоков)."""
+    with metrics.stage(stage):
+        return func(*args)
+
+
+def _attribute_counts(bm25_model, query_tokens, attribute_match, candidates):
+    """
+    Число совпавших атрибутов запроса у кандидатов — первый ключ упорядочивания при доранжировании.
+
+    Учитываются только кандидаты, совпавшие с запросом и по словам (ненулевой BM25-скор
+    по нечисловым токенам запроса): документ, общий с запросом лишь числом («Саморез 6мм»
+    для запроса «Лист ПВХ 6мм»), не поднимается выше листов. Если нечисловых токенов
+    в запросе нет, учитываются все кандидаты.
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    counts = attribute_match_counts(attribute_match, candidates)
+    words = [token for token in query_tokens if not _NUMERIC_TOKEN.fullmatch(token)]
+    if words and counts.any():
+        order = np.argsort(candidates, kind='stable')
+        word_scores = np.empty(len(candidates))
+        word_scores[order] = bm25_model.get_scores_subset(words, candidates[order])
+        counts = np.where(word_scores > 0, counts, 0)
+    return counts
+
+
+def _take_names(vink_names, rows):
+    """Возвращает наименования по номерам строк из списка `vink_names` или хранилища каталога."""
+    if hasattr(vink_names, 'take_names'):
+        return vink_names.take_names(rows)
+    return [vink_names[i] for i in rows]
+
+
+def match_query(query_text, vink_names, bm25_model, fasttext_model, k_top=10, n_top=5, catalog_embeddings=None,
+                ann_index=None, cache=None, attribute_index=None):
     """
     Выполняет сопоставление входного текстового запроса с наименованиями товаров, используя 
     BM25 для отбора кандидатов и FastText для ранжирования по косинусному сходству.
@@ -15,17 +85,50 @@ def match_query(query_text, vink_names, bm25_model, fasttext_model, k_top=10, n_
     считается косинусное сходство между эмбеддингом запроса и эмбеддингами кандидатов 
     с помощью FastText. Возвращаются n_top наиболее похожих результатов.
 
+    Если передана матрица `catalog_embeddings` (см. `prepare_catalog_embeddings`),
+    эмбеддинги кандидатов не пересчитываются, а берутся из неё по индексам,
+    и сходство считается одним векторизованным скалярным произведением.
+
+    Если передан `ann_index` (см. `prepare_ann_index`), параллельно с BM25 выполняется
+    приближённый поиск по эмбеддингам каталога, и оба списка кандидатов объединяются
+    (Reciprocal Rank Fusion) в k_top кандидатов до доранжирования. Это находит
+    наименования без общих с запросом токенов. Требует `catalog_embeddings`.
+
+    Если передан `attribute_index` (см. `prepare_attribute_index`), из запроса извлекаются
+    числовые атрибуты (размеры, толщина, плотность с единицами). Кандидаты отбираются BM25
+    по всему каталогу как обычно, а при доранжировании упорядочиваются сначала по числу
+    совпавших атрибутов и затем по сходству — лист 3 мм не окажется выше запрошенного листа 6 мм.
+    Атрибуты учитываются только у кандидатов, совпавших с запросом и по словам (см. `_attribute_counts`).
+
+    Если передан `cache` (`QueryResultCache`), ранжированные кандидаты запроса берутся из кэша
+    по нормализованным токенам запроса, его атрибутам и k_top, а при промахе сохраняются в него.
+    Одна запись кэша обслуживает любой n_top <= k_top.
+
+    Вместо списка `vink_names` можно передать хранилище каталога `CatalogStore`
+    (см. `prepare_catalog_store`) — тогда в результат добавляются коды товаров.
+
+    Если включён сбор метрик (`utils.metrics_utils.enable_metrics`), длительность каждого этапа
+    запроса попадает в гистограммы, а при debug=True выводится трассировка запроса.
+
     Возвращает:
     -----------
     pandas.DataFrame
         Таблица с n_top наиболее похожими наименованиями товаров и их сходством:
         - '№' — порядковый номер
+        - 'Код товара' — SKU товара (только для `CatalogStore`)
         - 'Наименование товара' — отобранный кандидат
         - 'Сходство' — косинусное сходство с запросом
     """
 
+    with metrics.query('match_query', query_text):
+        return _match_query(query_text, vink_names, bm25_model, fasttext_model, k_top, n_top,
+                            catalog_embeddings, ann_index, cache, attribute_index)
+
+
+def _match_query(query_text, vink_names, bm25_model, fasttext_model, k_top, n_top, catalog_embeddings,
+                 ann_index, cache, attribute_index):
     # Проверка наличия обработанного датасета
-    if not vink_names or len(vink_names) == 0:
+    if vink_names is None or len(vink_names) == 0:
         raise ValueError("Список vink_names пуст. Проверь, что данные загружены корректно.")
 
     # Проверка наличия моделей
@@ -33,34 +136,299 @@ def match_query(query_text, vink_names, bm25_model, fasttext_model, k_top=10, n_
         raise ValueError("Модель BM25 не загружена.")
     if fasttext_model is None or not hasattr(fasttext_model, 'wv'):
         raise ValueError("FastText-модель не загружена или повреждена.")
+    if catalog_embeddings is not None and len(catalog_embeddings) != len(vink_names):
+        raise ValueError("Матрица эмбеддингов каталога не соответствует списку vink_names.")
+    if ann_index is not None and catalog_embeddings is None:
+        raise ValueError("Для ANN-поиска нужна матрица эмбеддингов каталога.")
 
     embeddings = fasttext_model.wv
 
     # Обработка запроса
-    query_clean = preprocess_text(query_text)
-    query_tokens = word_tokenize(query_clean)
+    with metrics.stage('preprocess'):
+        query_tokens = tokenize_product_name(query_text)
+        query_attributes = extract_attributes(query_text) if attribute_index is not None else []
+
+    # Результат для тех же токенов запроса может быть уже в кэше
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(query_tokens, k_top, ann_index is not None, query_attributes)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            metrics.inc('match_query_cache_hits')
+            with metrics.stage('result_frame'):
+                return _result_frame(vink_names, *cached, n_top)
+
+    with metrics.stage('query_embedding'):
+        query_vec = get_embedding(query_text, embeddings).reshape(1, -1)
+
+    # Запускаем ANN-поиск параллельно с BM25
+    ann_future = None
+    if ann_index is not None:
+        ann_future = _get_ann_executor().submit(
+            _timed_call, 'ann_search', ann_index.search, query_vec, catalog_embeddings, k_top
+        )
+
+    # Документы, совпавшие с числовыми атрибутами запроса
+    attribute_match = None
+    if query_attributes:
+        with metrics.stage('attributes'):
+            attribute_match = attribute_index.match(query_attributes)
+        if attribute_match is not None:
+            metrics.inc('match_query_attribute_matched')
 
     # Получаем кандидатов из BM25 
-    scores = bm25_model.get_scores(query_tokens)
-    top_indices = np.argsort(scores)[::-1][:k_top]
-    bm25_candidates = [vink_names[i] for i in top_indices]
+    with metrics.stage('bm25'):
+        top_indices, top_scores = bm25_model.top_k(query_tokens, k_top)
+    if ann_future is not None:
+        with metrics.stage('ann_fusion'):
+            ann_indices, _ = ann_future.result()
+            top_indices = _fuse_with_ann(top_indices, top_scores, ann_indices, ann_index, k_top)
+
+    # Доранжируем кандидатов
+
+    with metrics.stage('rerank'):
+        if catalog_embeddings is not None:
+            similarities = rerank_candidates(query_vec, top_indices, catalog_embeddings)
+        else:
+            from sklearn.metrics.pairwise import cosine_similarity
+            candidate_vectors = [
+                get_embedding(vink_names[i], embeddings).reshape(1, -1)
+                for i in top_indices
+            ]
+            similarities = np.array([cosine_similarity(query_vec, vec)[0][0] for vec in candidate_vectors])
+
+    # Упорядочиваем кандидатов по убыванию сходства (при равенстве — в порядке отбора),
+    # а при совпавших атрибутах — сначала по числу совпадений
+    with metrics.stage('sort'):
+        if attribute_match is not None:
+            attribute_counts = _attribute_counts(bm25_model, query_tokens, attribute_match, top_indices)
+            order = np.lexsort((-similarities, -attribute_counts))
+        else:
+            order = np.argsort(-similarities, kind='stable')
+        ranked = (np.asarray(top_indices)[order], similarities[order])
+    if cache is not None:
+        for array in ranked:
+            array.setflags(write=False)
+        cache.put(cache_key, ranked)
 
-    # Получаем эмбеддинги и доранжируем кандидатов
-    query_vec = get_embedding(query_text, embeddings).reshape(1, -1)
+    with metrics.stage('result_frame'):
+        return _result_frame(vink_names, *ranked, n_top)
 
-    candidate_vectors = [
-        get_embedding(name, embeddings).reshape(1, -1)
-        for name in bm25_candidates
-    ]
-    similarities = [cosine_similarity(query_vec, vec)[0][0] for vec in candidate_vectors]
 
+def _result_frame(vink_names, ranked_indices, ranked_similarities, n_top):
+    """Собирает таблицу результата `match_query` из первых n_top ранжированных кандидатов."""
+    rows = ranked_indices[:n_top]
     df = pd.DataFrame({
-        'Наименование товара': bm25_candidates,
-        'Сходство': similarities,
-    }).sort_values(by='Сходство', ascending=False).head(n_top)
+        'Наименование товара': _take_names(vink_names, rows),
+        'Сходство': ranked_similarities[:n_top],
+    })
 
-    # Добавляем колонку "№"
+    # Добавляем колонки "№" и, для хранилища каталога, "Код товара"
+    if hasattr(vink_names, 'resolve_ids'):
+        df.insert(0, 'Код товара', vink_names.resolve_ids(rows))
     df.insert(0, '№', range(1, len(df) + 1))
-    df = df.reset_index(drop=True)
 
     return df
+
+
+def match_queries(query_texts, vink_names, bm25_model, fasttext_model, catalog_embeddings,
+                  k_top=10, n_top=5, batch_size=1024, ann_index=None, attribute_index=None):
+    """
+    Пакетное сопоставление списка запросов с наименованиями товаров.
+
+    Запросы обрабатываются порциями по `batch_size`: все запросы порции предобрабатываются,
+    BM25-скоры считаются одним умножением разреженных матриц (`BM25Index.top_k_batch`),
+    а кандидаты всех запросов доранжируются одной операцией над матрицей эмбеддингов
+    каталога `catalog_embeddings`. Если передан `ann_index`, кандидаты BM25 объединяются
+    с кандидатами ANN-поиска так же, как в `match_query`. Если передан `attribute_index`,
+    кандидаты упорядочиваются с учётом числовых атрибутов запросов так же, как в `match_query`.
+    Этапы каждой порции замеряются так же, как в `match_query` (см. `utils.metrics_utils`).
+
+    Возвращает:
+    -----------
+    pandas.DataFrame
+        Таблица в «длинном» формате, по n_top строк на каждый запрос:
+        - 'query_idx' — номер запроса во входном списке
+        - 'rank' — место кандидата после доранжирования (с 1)
+        - 'vink_idx' — индекс наименования в vink_names
+        - 'vink_id' — SKU товара (только если вместо vink_names передан `CatalogStore`)
+        - 'vink_name' — отобранный кандидат
+        - 'score' — косинусное сходство с запросом
+    """
+
+    with metrics.query('match_queries'):
+        return _match_queries(query_texts, vink_names, bm25_model, fasttext_model, catalog_embeddings,
+                              k_top, n_top, batch_size, ann_index, attribute_index)
+
+
+def _match_queries(query_texts, vink_names, bm25_model, fasttext_model, catalog_embeddings,
+                   k_top, n_top, batch_size, ann_index, attribute_index):
+    if vink_names is None or len(vink_names) == 0:
+        raise ValueError("Список vink_names пуст. Проверь, что данные загружены корректно.")
+    if bm25_model is None:
+        raise ValueError("Модель BM25 не загружена.")
+    if fasttext_model is None or not hasattr(fasttext_model, 'wv'):
+        raise ValueError("FastText-модель не загружена или повреждена.")
+    if catalog_embeddings is None or len(catalog_embeddings) != len(vink_names):
+        raise ValueError("Матрица эмбеддингов каталога не соответствует списку vink_names.")
+
+    query_texts = list(query_texts)
+    n_top = min(n_top, k_top, len(vink_names))
+
+    query_idx, ranks, vink_idx, scores = [], [], [], []
+    for start in range(0, len(query_texts), batch_size):
+        batch = query_texts[start:start + batch_size]
+        metrics.inc('match_queries_queries', len(batch))
+        with metrics.stage('batch_preprocess'):
+            batch_tokens = [tokenize_product_name(text) for text in batch]
+
+        with metrics.stage('batch_query_embedding'):
+            query_vecs = embed_token_lists(batch_tokens, fasttext_model.wv)
+
+        # 1 этап: кандидаты BM25 (и параллельно ANN) для всех запросов порции
+        ann_future = None
+        if ann_index is not None:
+            ann_future = _get_ann_executor().submit(
+                _timed_call, 'batch_ann_search', ann_index.search_batch, query_vecs, catalog_embeddings, k_top
+            )
+        attribute_matches = None
+        if attribute_index is not None:
+            with metrics.stage('batch_attributes'):
+                attribute_matches = [attribute_index.match(extract_attributes(text)) for text in batch]
+        with metrics.stage('batch_bm25'):
+            top_indices, top_scores = bm25_model.top_k_batch(batch_tokens, k_top)
+        if ann_future is not None:
+            with metrics.stage('batch_ann_fusion'):
+                top_indices = np.stack([
+                    _fuse_with_ann(bm25_ids, bm25_scores, ann_ids, ann_index, top_indices.shape[1])
+                    for bm25_ids, bm25_scores, ann_ids in zip(top_indices, top_scores, ann_future.result())
+                ])
+
+        # 2 этап: сходство каждого запроса со своими кандидатами
+        with metrics.stage('batch_rerank'):
+            similarities = np.einsum('qkd,qd->qk', catalog_embeddings[top_indices], query_vecs)
+        with metrics.stage('batch_sort'):
+            if attribute_matches is not None:
+                attribute_counts = np.stack([_attribute_counts(bm25_model, tokens, match, row)
+                                             for tokens, match, row in zip(batch_tokens, attribute_matches, top_indices)])
+                order = np.lexsort((-similarities, -attribute_counts), axis=1)[:, :n_top]
+            else:
+                order = np.argsort(-similarities, axis=1, kind='stable')[:, :n_top]
+
+        query_idx.append(np.repeat(np.arange(start, start + len(batch)), n_top))
+        ranks.append(np.tile(np.arange(1, n_top + 1), len(batch)))
+        vink_idx.append(np.take_along_axis(top_indices, order, axis=1).ravel())
+        scores.append(np.take_along_axis(similarities, order, axis=1).ravel())
+
+    if not query_idx:
+        id_columns = ['vink_id'] if hasattr(vink_names, 'resolve_ids') else []
+        return pd.DataFrame(columns=['query_idx', 'rank', 'vink_idx', *id_columns, 'vink_name', 'score'])
+
+    with metrics.stage('batch_result_frame'):
+        vink_idx = np.concatenate(vink_idx)
+        result = {
+            'query_idx': np.concatenate(query_idx),
+            'rank': np.concatenate(ranks),
+            'vink_idx': vink_idx,
+        }
+        if hasattr(vink_names, 'resolve_ids'):
+            result['vink_id'] = vink_names.resolve_ids(vink_idx)
+        result['vink_name'] = _take_names(vink_names, vink_idx)
+        result['score'] = np.concatenate(scores)
+        return pd.DataFrame(result)
+
+
+def match_query_sharded(query_text, vink_names, sharded_index, fasttext_model, k_top=10, n_top=5):
+    """
+    Сопоставление запроса по шардированному каталогу (`utils.shard_utils.ShardedIndex`).
+
+    Токены запроса рассылаются всем шардам: каждый возвращает свои k_top кандидатов BM25
+    с их эмбеддингами, координатор объединяет их в общий top-k по BM25-скору и доранжирует
+    по косинусному сходству так же, как `match_query`. Результат совпадает с `match_query`
+    по всему каталогу без ANN-поиска.
+
+    Возвращает:
+    -----------
+    pandas.DataFrame
+        Таблица того же вида, что и у `match_query`.
+    """
+
+    with metrics.query('match_query_sharded', query_text):
+        if vink_names is None or len(vink_names) != sharded_index.corpus_size:
+            raise ValueError("Список vink_names не соответствует шардам каталога.")
+        if fasttext_model is None or not hasattr(fasttext_model, 'wv'):
+            raise ValueError("FastText-модель не загружена или повреждена.")
+
+        with metrics.stage('preprocess'):
+            query_tokens = tokenize_product_name(query_text)
+        with metrics.stage('query_embedding'):
+            query_vec = get_embedding(query_text, fasttext_model.wv).reshape(1, -1)
+
+        top_indices, _, candidate_vectors = sharded_index.search([query_tokens], k_top)
+        top_indices = top_indices[0]
+        with metrics.stage('rerank'):
+            similarities = rerank_candidates(query_vec, np.arange(len(top_indices)), candidate_vectors[0])
+        with metrics.stage('sort'):
+            order = np.argsort(-similarities, kind='stable')
+        with metrics.stage('result_frame'):
+            return _result_frame(vink_names, top_indices[order], similarities[order], n_top)
+
+
+def match_queries_sharded(query_texts, vink_names, sharded_index, fasttext_model, k_top=10, n_top=5,
+                          batch_size=1024):
+    """
+    Пакетное сопоставление по шардированному каталогу: порция запросов рассылается шардам
+    одним сообщением, каждый шард считает BM25 для всей порции (`BM25Index.top_k_batch`),
+    кандидаты доранжируются так же, как в `match_queries`.
+
+    Возвращает:
+    -----------
+    pandas.DataFrame
+        Таблица того же вида, что и у `match_queries`.
+    """
+
+    with metrics.query('match_queries_sharded'):
+        if vink_names is None or len(vink_names) != sharded_index.corpus_size:
+            raise ValueError("Список vink_names не соответствует шардам каталога.")
+        if fasttext_model is None or not hasattr(fasttext_model, 'wv'):
+            raise ValueError("FastText-модель не загружена или повреждена.")
+
+        query_texts = list(query_texts)
+        n_top = min(n_top, k_top, len(vink_names))
+
+        query_idx, ranks, vink_idx, scores = [], [], [], []
+        for start in range(0, len(query_texts), batch_size):
+            batch = query_texts[start:start + batch_size]
+            metrics.inc('match_queries_queries', len(batch))
+            with metrics.stage('batch_preprocess'):
+                batch_tokens = [tokenize_product_name(text) for text in batch]
+            with metrics.stage('batch_query_embedding'):
+                query_vecs = embed_token_lists(batch_tokens, fasttext_model.wv)
+
+            top_indices, _, candidate_vectors = sharded_index.search(batch_tokens, k_top)
+            with metrics.stage('batch_rerank'):
+                similarities = np.einsum('qkd,qd->qk', candidate_vectors, query_vecs)
+            with metrics.stage('batch_sort'):
+                order = np.argsort(-similarities, axis=1, kind='stable')[:, :n_top]
+
+            query_idx.append(np.repeat(np.arange(start, start + len(batch)), n_top))
+            ranks.append(np.tile(np.arange(1, n_top + 1), len(batch)))
+            vink_idx.append(np.take_along_axis(top_indices, order, axis=1).ravel())
+            scores.append(np.take_along_axis(similarities, order, axis=1).ravel())
+
+        id_columns = ['vink_id'] if hasattr(vink_names, 'resolve_ids') else []
+        if not query_idx:
+            return pd.DataFrame(columns=['query_idx', 'rank', 'vink_idx', *id_columns, 'vink_name', 'score'])
+
+        with metrics.stage('batch_result_frame'):
+            vink_idx = np.concatenate(vink_idx)
+            result = {
+                'query_idx': np.concatenate(query_idx),
+                'rank': np.concatenate(ranks),
+                'vink_idx': vink_idx,
+            }
+            if id_columns:
+                result['vink_id'] = vink_names.resolve_ids(vink_idx)
+            result['vink_name'] = _take_names(vink_names, vink_idx)
+            result['score'] = np.concatenate(scores)
+            return pd.DataFrame(result)
@@ -0,0 +1,235 @@
+"""
+Модуль инструментирования этапов сопоставления.
+
+По умолчанию выключен: `stage` возвращает пустой контекстный менеджер, и накладные расходы
+сводятся к одной проверке флага. После `enable_metrics()` для каждого этапа `match_query`
+и `match_queries` (предобработка запроса, BM25, ANN, доранжирование, сортировка, сборка таблицы)
+в памяти процесса накапливаются:
+- счётчики событий (запросы, попадания в кэш и т.п.);
+- гистограммы длительностей этапов с фиксированными границами корзин (как в Prometheus).
+
+Метрики доступны словарём (`get_metrics`) и в текстовом формате Prometheus (`prometheus_text`).
+Для поиска выбросов по задержке сохраняется трассировка запроса (длительность каждого этапа):
+она выводится для каждого запроса при debug=True и для запросов дольше `slow_query_ms`.
+"""
+
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# Границы корзин гистограмм длительности, в секундах
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_NULL_CONTEXT = nullcontext()
+
+
+class _Histogram:
+    """Гистограмма длительностей с кумулятивными корзинами, суммой, числом наблюдений и максимумом."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Оценка квантиля: верхняя граница корзины, в которую он попадает (для последней — максимум)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+
+class _StageTimer:
+    """Контекстный менеджер замера этапа (класс, а не генератор, — дешевле на горячем пути)."""
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class PipelineMetrics:
+    """
+    Потокобезопасный сборщик метрик этапов сопоставления.
+
+    Параметры:
+    ----------
+    enabled : bool
+        Собирать ли метрики.
+    debug : bool
+        Выводить ли трассировку каждого запроса.
+    slow_query_ms : float или None
+        Выводить трассировку запросов, выполнявшихся дольше этого порога.
+    trace_sink : callable
+        Получатель трассировки (словарь); по умолчанию печатает её строкой JSON.
+    """
+
+    def __init__(self, enabled=False, debug=False, slow_query_ms=None, trace_sink=None, buckets=LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.debug = debug
+        self.slow_query_ms = slow_query_ms
+        self.trace_sink = trace_sink or _print_trace
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {}
+        self._histograms = {}
+
+    def configure(self, enabled=True, debug=False, slow_query_ms=None, trace_sink=None):
+        self.enabled = enabled
+        self.debug = debug
+        self.slow_query_ms = slow_query_ms
+        if trace_sink is not None:
+            self.trace_sink = trace_sink
+
+    def inc(self, name, value=1):
+        """Увеличивает счётчик события."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, stage, seconds):
+        """Добавляет длительность этапа в гистограмму и в трассировку текущего запроса."""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace['stages'].append((stage, round(seconds * 1000, 3)))
+
+    def stage(self, name):
+        """Контекстный менеджер, замеряющий длительность этапа `name` (пустой, если сбор выключен)."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _StageTimer(self, name)
+
+    def query(self, name, query_text=None):
+        """
+        Контекстный менеджер вокруг обработки запроса: замеряет общую длительность (этап `name`)
+        и собирает трассировку этапов, выполненных в этом потоке.
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._traced(name, query_text)
+
+    @contextmanager
+    def _traced(self, name, query_text):
+        outer = getattr(self._local, 'trace', None)
+        trace = {'name': name, 'query': query_text, 'stages': []}
+        self._local.trace = trace
+        self.inc(f'{name}_calls')
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            seconds = time.perf_counter() - start
+            self._local.trace = outer
+            self.observe(name, seconds)
+            trace['total_ms'] = round(seconds * 1000, 3)
+            slow = self.slow_query_ms is not None and trace['total_ms'] > self.slow_query_ms
+            if slow:
+                self.inc(f'{name}_slow')
+            if self.debug or slow:
+                self.trace_sink(trace)
+
+    def snapshot(self):
+        """
+        Возвращает накопленные метрики.
+
+        Возвращает:
+        -----------
+        dict
+            {'counters': {событие: число}, 'stages': {этап: {'count', 'sum_ms', 'mean_ms',
+            'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}}}. Квантили оцениваются по корзинам гистограммы.
+        """
+        with self._lock:
+            stages = {
+                stage: {
+                    'count': h.count,
+                    'sum_ms': h.sum * 1000,
+                    'mean_ms': h.sum * 1000 / h.count if h.count else 0.0,
+                    'p50_ms': h.quantile(0.50) * 1000,
+                    'p95_ms': h.quantile(0.95) * 1000,
+                    'p99_ms': h.quantile(0.99) * 1000,
+                    'max_ms': h.max * 1000,
+                }
+                for stage, h in self._histograms.items()
+            }
+            return {'counters': dict(self._counters), 'stages': stages}
+
+    def prometheus_text(self, prefix='matching'):
+        """Возвращает метрики в текстовом формате Prometheus."""
+        with self._lock:
+            lines = [
+                f'# HELP {prefix}_events_total Число событий сопоставления.',
+                f'# TYPE {prefix}_events_total counter',
+            ]
+            for name, value in sorted(self._counters.items()):
+                lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+
+            metric = f'{prefix}_stage_duration_seconds'
+            lines += [f'# HELP {metric} Длительность этапов сопоставления.', f'# TYPE {metric} histogram']
+            for stage, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ['+Inf'], h.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {h.sum:.6f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _print_trace(trace):
+    print('Трассировка запроса: ' + json.dumps(trace, ensure_ascii=False))
+
+
+# Общий сборщик метрик процесса
+metrics = PipelineMetrics()
+
+
+def enable_metrics(enabled=True, debug=False, slow_query_ms=None, trace_sink=None):
+    """
+    Включает (или выключает) сбор метрик этапов сопоставления.
+    debug=True — трассировка каждого запроса; slow_query_ms — трассировка только медленных запросов.
+    """
+    metrics.configure(enabled=enabled, debug=debug, slow_query_ms=slow_query_ms, trace_sink=trace_sink)
+
+
+def get_metrics():
+    """Возвращает накопленные счётчики и статистику длительности этапов (см. `PipelineMetrics.snapshot`)."""
+    return metrics.snapshot()
+
+
+def prometheus_text():
+    """Возвращает накопленные метрики в текстовом формате Prometheus."""
+    return metrics.prometheus_text()
@@ -0,0 +1,296 @@
+"""
+Модуль HTTP-сервиса сопоставления на asyncio.
+
+Сервис отвечает на запросы по тем же ресурсам, что и приложение Streamlit (`load_resources`).
+Одновременные запросы объединяются в небольшие пачки (`MicroBatcher`): пачка обрабатывается
+одним вызовом `match_queries` (BM25 и доранжирование матричными операциями), поэтому при
+конкурентной нагрузке пропускная способность выше, чем при обработке запросов по одному.
+
+Эндпоинты:
+- `POST /match` — тело {"query": "..."} или {"queries": [...]}, необязательно "n_top";
+  ответ {"results": [[{"rank", "id", "name", "score"}, ...], ...]} по списку на каждый запрос;
+- `GET /health` — готовность сервиса и ход загрузки ресурсов по этапам.
+
+Если загрузка ресурсов завершилась ошибкой, `/match` и `/health` отвечают 500 с её текстом.
+- `GET /metrics` — метрики этапов поиска в формате Prometheus (`utils.metrics_utils`).
+
+HTTP реализован на `asyncio.start_server` без сторонних зависимостей: HTTP/1.1 с keep-alive,
+тело запроса — JSON с заголовком Content-Length.
+"""
+
+import json
+import math
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from utils.startup_utils import StartupProgress, load_resources
+from utils.metrics_utils import metrics, prometheus_text
+
+MAX_BODY_SIZE = 1024 * 1024
+MAX_QUERIES_PER_REQUEST = 1000
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+
+class MicroBatcher:
+    """
+    Объединяет одновременные запросы в пачки.
+
+    Первый запрос в очереди открывает пачку; в неё добираются запросы, пришедшие в течение
+    `max_wait_ms`, но не больше `max_batch_size`. Пачка обрабатывается функцией
+    `process_batch(queries, n_top)` в отдельном потоке, чтобы не блокировать цикл событий;
+    пока она считается, в очереди набирается следующая пачка.
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=5.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch')
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, query, n_top):
+        """Ставит запрос в очередь и возвращает его результат после обработки пачки."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, n_top, future))
+        return await future
+
+    async def _collect(self):
+        """Ждёт первый запрос и добирает пачку до max_batch_size или истечения max_wait."""
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            batch = [item for item in batch if not item[2].cancelled()]
+            if not batch:
+                continue
+            metrics.inc('service_batches')
+            metrics.inc('service_queries', len(batch))
+            queries = [query for query, _, _ in batch]
+            n_top = max(n_top for _, n_top, _ in batch)
+            try:
+                results = await loop.run_in_executor(self._executor, self.process_batch, queries, n_top)
+            except Exception as error:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, item_n_top, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result[:item_n_top])
+
+
+def _to_python(value):
+    """Приводит значение numpy/pandas к типу, сериализуемому в JSON (пропуски — None)."""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def make_batch_matcher(resources, k_top=10):
+    """
+    Создаёт функцию обработки пачки запросов по загруженным ресурсам.
+
+    Возвращает:
+    -----------
+    callable
+        process_batch(queries, n_top) -> список результатов по запросам; результат запроса —
+        список словарей {'rank', 'id', 'name', 'score'} по убыванию сходства.
+    """
+    from utils.matching_utils import match_queries
+
+    vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index = resources
+
+    def process_batch(queries, n_top):
+        result = match_queries(queries, vink_names, bm25_model, fasttext_model, catalog_embeddings,
+                               k_top=k_top, n_top=n_top, batch_size=len(queries), ann_index=ann_index,
+                               attribute_index=attribute_index)
+        ids = result['vink_id'] if 'vink_id' in result else [None] * len(result)
+        matches = [[] for _ in queries]
+        for query_idx, rank, vink_id, name, score in zip(result['query_idx'], result['rank'], ids,
+                                                         result['vink_name'], result['score']):
+            matches[query_idx].append({'rank': int(rank), 'id': _to_python(vink_id),
+                                       'name': name, 'score': float(score)})
+        return matches
+
+    return process_batch
+
+
+class MatchingService:
+    """
+    HTTP-сервис сопоставления: загрузка ресурсов в фоне, разбор HTTP и пакетная обработка запросов.
+    """
+
+    def __init__(self, k_top=10, default_n_top=5, max_batch_size=32, max_wait_ms=5.0, csv_path=None):
+        self.k_top = k_top
+        self.default_n_top = default_n_top
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.csv_path = csv_path
+        self.progress = StartupProgress()
+        self.batcher = None
+        self.load_error = None
+        self._loading = None
+
+    @property
+    def ready(self):
+        return self.batcher is not None
+
+    async def load(self):
+        """
+        Готовит ресурсы поиска в отдельном потоке; до готовности /match отвечает 503.
+        Ошибка загрузки сохраняется в `load_error`, после неё /match и /health отвечают 500.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            resources = await loop.run_in_executor(
+                None, lambda: load_resources(csv_path=self.csv_path, progress=self.progress)
+            )
+        except Exception as error:
+            self.load_error = f"{type(error).__name__}: {error}"
+            print(f"Не удалось загрузить ресурсы поиска: {self.load_error}")
+            return
+        batcher = MicroBatcher(make_batch_matcher(resources, k_top=self.k_top),
+                               max_batch_size=self.max_batch_size, max_wait_ms=self.max_wait_ms)
+        batcher.start()
+        self.batcher = batcher
+        print("Сервис готов к запросам")
+
+    async def handle_match(self, body):
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            return 400, {'error': "Тело запроса должно быть JSON"}
+        if not isinstance(payload, dict):
+            return 400, {'error': "Ожидается JSON-объект"}
+
+        queries = payload.get('queries', [payload['query']] if 'query' in payload else None)
+        if not isinstance(queries, list) or not queries or not all(isinstance(q, str) for q in queries):
+            return 400, {'error': "Передайте строку 'query' или непустой список строк 'queries'"}
+        if len(queries) > MAX_QUERIES_PER_REQUEST:
+            return 413, {'error': f"Не больше {MAX_QUERIES_PER_REQUEST} запросов за раз"}
+        n_top = payload.get('n_top', self.default_n_top)
+        if not isinstance(n_top, int) or isinstance(n_top, bool) or not 1 <= n_top <= self.k_top:
+            return 400, {'error': f"n_top должно быть целым от 1 до {self.k_top}"}
+        if self.load_error is not None:
+            return 500, {'error': f"Не удалось загрузить модели: {self.load_error}"}
+        if not self.ready:
+            return 503, {'error': "Модели ещё загружаются", 'progress': self.progress.fraction}
+
+        results = await asyncio.gather(*(self.batcher.submit(query, n_top) for query in queries))
+        return 200, {'results': results}
+
+    async def dispatch(self, method, path, body):
+        """Выбирает обработчик по методу и пути; возвращает (статус, тело-dict или текст)."""
+        path = path.split('?', 1)[0]
+        if path == '/match':
+            if method != 'POST':
+                return 405, {'error': "Используйте POST"}
+            return await self.handle_match(body)
+        if path == '/health':
+            if self.load_error is not None:
+                return 500, {'ready': False, 'error': self.load_error, 'progress': self.progress.snapshot()}
+            return 200, {'ready': self.ready, 'progress': self.progress.snapshot()}
+        if path == '/metrics':
+            return 200, prometheus_text()
+        return 404, {'error': "Неизвестный путь"}
+
+    async def handle_connection(self, reader, writer):
+        """Обслуживает соединение: читает HTTP/1.1-запросы подряд (keep-alive) и отвечает на каждый."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': "Некорректная строка запроса"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version.upper() == 'HTTP/1.1')
+                if 'chunked' in headers.get('transfer-encoding', '').lower():
+                    await self._respond(writer, 411, {'error': "Нужен заголовок Content-Length"}, keep_alive=False)
+                    break
+                length = int(headers.get('content-length', 0) or 0)
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {'error': "Слишком большое тело запроса"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, content = await self.dispatch(method.upper(), path, body)
+                except Exception as error:
+                    status, content = 500, {'error': str(error)}
+                await self._respond(writer, status, content, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, content, keep_alive):
+        if isinstance(content, str):
+            body, content_type = content.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body, content_type = json.dumps(content, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host='0.0.0.0', port=8000):
+        """Запускает HTTP-сервер; ресурсы загружаются в фоне, пока сервер уже принимает запросы."""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Сервис сопоставления слушает http://{host}:{port}")
+        self._loading = asyncio.get_running_loop().create_task(self.load())
+        async with server:
+            await server.serve_forever()
+
+
+def run_service(host='0.0.0.0', port=8000, **kwargs):
+    """Создаёт `MatchingService` с параметрами kwargs и запускает его до остановки процесса."""
+    asyncio.run(MatchingService(**kwargs).serve(host, port))
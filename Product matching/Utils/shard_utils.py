@@ -0,0 +1,316 @@
+"""
+Модуль шардированного индекса каталога.
+
+Каталог делится на N частей (шардов) по непрерывным диапазонам строк. У каждого шарда свой
+BM25-индекс и своя часть матрицы эмбеддингов каталога; шард обслуживается отдельным
+процессом — на этой же машине (`ShardedIndex.start`) или на другой (`serve_shard` +
+`ShardedIndex.connect`), поэтому память и работа на запрос делятся между процессами.
+
+BM25-индексы шардов строятся по статистикам всего каталога (`merge_statistics`): IDF
+и средняя длина документа общие, поэтому веса, а значит и скоры документов в шардах
+совпадают со скорами индекса всего каталога и сравнимы между шардами.
+
+Поиск (scatter-gather):
+1. координатор токенизирует запрос, считает его эмбеддинг и рассылает запрос всем шардам;
+2. каждый шард отбирает свои k документов с наибольшим BM25-скором и возвращает их номера,
+   скоры и строки своей части матрицы эмбеддингов;
+3. координатор объединяет списки шардов в общий top-k по BM25-скору (при равных скорах —
+   по номеру документа, как в `BM25Index.top_k`) и доранжирует кандидатов по их эмбеддингам.
+Результат совпадает с поиском по индексу всего каталога (`match_query` без ANN): скоры
+BM25 в шардах те же, а сходство считается теми же операциями над теми же векторами.
+
+Обмен с процессами шардов идёт через `multiprocessing.connection`: локально — каналы (Pipe),
+между машинами — TCP с ключом аутентификации.
+
+Сохраняет (в текущую версию шардов, см. `utils.manifest_utils.publish_version`;
+пути `models/shards/shard_{i}` указывают на шарды текущей версии):
+- `models/shards/shards.json` — число шардов и диапазоны строк каталога;
+- `models/shards/shard_{i}/` — BM25-индекс шарда (`bm25_index`), его строки матрицы
+  эмбеддингов (`catalog_embeddings.npy`) и `shard.json` (смещение и размер шарда).
+"""
+
+import os
+import json
+import threading
+import joblib
+import numpy as np
+from multiprocessing import Pipe, Process
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from utils.bm25_utils import BM25Index, corpus_statistics, merge_statistics
+from utils.corpus_utils import build_corpus
+from utils.text_utils import get_text_config
+from utils.manifest_utils import (config_hash, file_hash, get_stage_build_id, is_stage_current, record_stage,
+                                  new_version_dir, publish_version, current_version_dir)
+from utils.metrics_utils import metrics
+
+SHARDS_DIR = 'models/shards'
+
+
+class CatalogShard:
+    """
+    Часть каталога: BM25-индекс и строки матрицы эмбеддингов документов
+    с номерами [offset, offset + len(shard)) каталога.
+    """
+
+    def __init__(self, bm25_index, embeddings, offset):
+        self.bm25_index = bm25_index
+        self.embeddings = embeddings
+        self.offset = offset
+
+    def __len__(self):
+        return self.bm25_index.corpus_size
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.bm25_index.save(os.path.join(path, 'bm25_index'))
+        np.save(os.path.join(path, 'catalog_embeddings.npy'), self.embeddings)
+        with open(os.path.join(path, 'shard.json'), 'w', encoding='utf-8') as f:
+            json.dump({'offset': self.offset, 'size': len(self)}, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Открывает шард, сохранённый методом `save` (массивы — через memory-map).
+        Путь вида `models/shards/shard_0` указывает на шард текущей версии шардов.
+        """
+        if not os.path.exists(path):
+            parent, name = os.path.split(path.rstrip('/\\'))
+            path = os.path.join(current_version_dir(parent), name)
+        with open(os.path.join(path, 'shard.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        bm25_index = BM25Index.load(os.path.join(path, 'bm25_index'), mmap_mode=mmap_mode)
+        embeddings = np.load(os.path.join(path, 'catalog_embeddings.npy'), mmap_mode=mmap_mode)
+        return cls(bm25_index, embeddings, meta['offset'])
+
+    def search(self, batch_tokens, k):
+        """
+        Отбирает для каждого запроса k документов шарда с наибольшим BM25-скором.
+
+        Возвращает:
+        -----------
+        tuple(np.ndarray, np.ndarray, np.ndarray)
+            Номера документов в каталоге и BM25-скоры — матрицы (число запросов,
+            min(k, размер шарда)); эмбеддинги этих документов — массив (..., размерность).
+        """
+        if len(batch_tokens) == 1:
+            indices, scores = self.bm25_index.top_k(batch_tokens[0], k)
+            indices, scores = indices[None, :], scores[None, :]
+        else:
+            indices, scores = self.bm25_index.top_k_batch(batch_tokens, k)
+        return indices + self.offset, scores, self.embeddings[indices]
+
+
+def _serve_connection(shard, connection):
+    """Отвечает на запросы координатора по соединению до команды 'close' или разрыва соединения."""
+    while True:
+        try:
+            command, *args = connection.recv()
+        except EOFError:
+            return
+        if command == 'close':
+            return
+        try:
+            if command == 'search':
+                connection.send(('ok', shard.search(*args)))
+            elif command == 'info':
+                connection.send(('ok', {'offset': shard.offset, 'size': len(shard)}))
+            else:
+                connection.send(('error', f"Неизвестная команда: {command}"))
+        except Exception as error:
+            connection.send(('error', f"{type(error).__name__}: {error}"))
+
+
+def _shard_process(connection, shard_dir):
+    """Точка входа процесса шарда: открывает шард и обслуживает канал координатора."""
+    try:
+        shard = CatalogShard.load(shard_dir)
+    except Exception as error:
+        connection.send(('error', f"{type(error).__name__}: {error}"))
+        return
+    connection.send(('ok', {'offset': shard.offset, 'size': len(shard)}))
+    _serve_connection(shard, connection)
+
+
+def serve_shard(shard_dir, address, authkey):
+    """
+    Обслуживает шард по TCP: принимает подключения координаторов (`ShardedIndex.connect`)
+    и отвечает на их запросы, пока процесс не будет остановлен. Каждое соединение
+    обслуживается в отдельном потоке.
+
+    Сообщения передаются через pickle, поэтому подключиться может только координатор,
+    знающий общий ключ `authkey` (bytes); шарды не следует открывать в недоверенную сеть.
+    """
+    shard = CatalogShard.load(shard_dir)
+    print(f"Шард {shard_dir} ({len(shard)} документов, смещение {shard.offset}) слушает {address}")
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, OSError, EOFError) as error:
+                print(f"Отклонено подключение к шарду: {type(error).__name__}: {error}")
+                continue
+            threading.Thread(target=_serve_connection, args=(shard, connection), daemon=True).start()
+
+
+class ShardedIndex:
+    """
+    Координатор шардов: рассылает запросы всем шардам и объединяет их результаты.
+
+    Соединения с шардами используются под блокировкой, поэтому объект можно вызывать
+    из нескольких потоков (запросы координатора выполняются по очереди, шарды — параллельно).
+    """
+
+    def __init__(self, connections, processes=()):
+        self.connections = list(connections)
+        self.processes = list(processes)
+        self._lock = threading.Lock()
+        self.shards = [self._receive(connection) for connection in self.connections]
+        self.corpus_size = sum(shard['size'] for shard in self.shards)
+
+    @classmethod
+    def start(cls, shards_dir=SHARDS_DIR):
+        """
+        Запускает по процессу на каждый шард из `shards_dir` на этой машине.
+
+        Возвращает:
+        -----------
+        ShardedIndex
+            Координатор, готовый к поиску (после того как все шарды открыты).
+        """
+        shards_dir = current_version_dir(shards_dir)
+        with open(os.path.join(shards_dir, 'shards.json'), encoding='utf-8') as f:
+            n_shards = json.load(f)['n_shards']
+        connections, processes = [], []
+        for i in range(n_shards):
+            parent, child = Pipe()
+            process = Process(target=_shard_process, args=(child, os.path.join(shards_dir, f'shard_{i}')),
+                              daemon=True)
+            process.start()
+            child.close()
+            connections.append(parent)
+            processes.append(process)
+        return cls(connections, processes)
+
+    @classmethod
+    def connect(cls, addresses, authkey):
+        """Подключается к шардам, запущенным `serve_shard` на адресах `addresses` ((хост, порт), ...)."""
+        connections = [Client(tuple(address), authkey=authkey) for address in addresses]
+        for connection in connections:
+            connection.send(('info',))
+        return cls(connections)
+
+    @staticmethod
+    def _receive(connection):
+        status, payload = connection.recv()
+        if status != 'ok':
+            raise RuntimeError(f"Ошибка шарда: {payload}")
+        return payload
+
+    def search(self, batch_tokens, k):
+        """
+        Рассылает запросы всем шардам и объединяет их списки в общий top-k по BM25-скору
+        (при равных скорах раньше документ с меньшим номером).
+
+        Возвращает:
+        -----------
+        tuple(np.ndarray, np.ndarray, np.ndarray)
+            Номера документов каталога и BM25-скоры — матрицы (число запросов,
+            min(k, размер каталога)); эмбеддинги кандидатов — массив (..., размерность).
+        """
+        k = min(k, self.corpus_size)
+        request = ('search', list(batch_tokens), k)
+        with self._lock:
+            with metrics.stage('shard_fanout'):
+                for connection in self.connections:
+                    connection.send(request)
+                results = [self._receive(connection) for connection in self.connections]
+
+        with metrics.stage('shard_merge'):
+            indices, scores, vectors = (np.concatenate(parts, axis=1) for parts in zip(*results))
+            order = np.lexsort((indices, -scores), axis=1)[:, :k]
+            return (np.take_along_axis(indices, order, axis=1), np.take_along_axis(scores, order, axis=1),
+                    np.take_along_axis(vectors, order[:, :, None], axis=1))
+
+    def close(self):
+        """Останавливает процессы шардов и закрывает соединения."""
+        with self._lock:
+            for connection in self.connections:
+                try:
+                    connection.send(('close',))
+                except (OSError, EOFError):
+                    pass
+                connection.close()
+        for process in self.processes:
+            process.join(timeout=5)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def shard_ranges(corpus_size, n_shards):
+    """Делит строки каталога на n_shards непрерывных диапазонов почти равного размера."""
+    bounds = np.linspace(0, corpus_size, n_shards + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def prepare_shards(catalog_embeddings, n_shards=4, save_dir_names='data', save_dir_model='models', workers=None):
+    """
+    Делит каталог на n_shards шардов и строит для каждого BM25-индекс по статистикам всего
+    каталога и часть матрицы эмбеддингов. Если шарды уже построены по текущим наименованиям,
+    конфигурации предобработки, матрице эмбеддингов и числу шардов (по манифесту сборки),
+    построение пропускается.
+
+    Возвращает:
+    -----------
+    str
+        Директория шардов (для `ShardedIndex.start` или `serve_shard`).
+        Возвращает None, если отсутствует файл с предобработанными наименованиями
+        или не подготовлена матрица эмбеддингов каталога.
+    """
+
+    shards_dir = os.path.join(save_dir_model, 'shards')
+    names_path = os.path.join(save_dir_names, 'vink_names.joblib')
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
+
+    if not os.path.exists(names_path) or catalog_embeddings is None:
+        print("Подготовьте обработанный датасет и матрицу эмбеддингов каталога.")
+        return None
+
+    inputs = {
+        'vink_names': file_hash(names_path, manifest_path),
+        'text_config': config_hash(get_text_config()),
+        'catalog_embeddings': get_stage_build_id('catalog_embeddings', manifest_path),
+        'params': {'n_shards': n_shards, 'k1': 1.5, 'b': 0.75, 'epsilon': 0.25},
+    }
+    if is_stage_current('shards', inputs, [shards_dir], manifest_path):
+        print("Шарды каталога на месте, построение не требуется")
+        return shards_dir
+
+    vink_names = joblib.load(names_path)
+    if len(catalog_embeddings) != len(vink_names):
+        raise ValueError("Матрица эмбеддингов каталога не соответствует списку vink_names.")
+    if not 1 <= n_shards <= len(vink_names):
+        raise ValueError("Число шардов должно быть от 1 до числа наименований каталога.")
+
+    print(f"Строим {n_shards} шардов каталога...")
+    corpus = build_corpus(vink_names, workers=workers, desc="Токенизация каталога")
+    ranges = shard_ranges(len(corpus), n_shards)
+    statistics = merge_statistics(corpus_statistics(corpus[start:stop]) for start, stop in ranges)
+
+    tmp_dir = new_version_dir(shards_dir)
+    for i, (start, stop) in enumerate(ranges):
+        bm25_index = BM25Index(corpus[start:stop], statistics=statistics)
+        embeddings = np.ascontiguousarray(catalog_embeddings[start:stop])
+        CatalogShard(bm25_index, embeddings, start).save(os.path.join(tmp_dir, f'shard_{i}'))
+    with open(os.path.join(tmp_dir, 'shards.json'), 'w', encoding='utf-8') as f:
+        json.dump({'n_shards': n_shards, 'corpus_size': len(corpus), 'ranges': ranges}, f, indent=2)
+
+    publish_version(tmp_dir)
+    record_stage('shards', inputs, [shards_dir], manifest_path)
+    print(f"Шарды каталога сохранены в {shards_dir}")
+
+    return shards_dir
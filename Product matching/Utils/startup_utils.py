@@ -0,0 +1,177 @@
+"""
+Модуль для быстрого запуска приложения поиска.
+
+Подготовка ресурсов разбита на этапы, независимые этапы выполняются в параллельных потоках:
+- датасеты готовятся первыми (от них зависят остальные этапы);
+- цепочка хранилище каталога → BM25-индекс (строится по токенам хранилища) и индекс атрибутов
+  готовятся параллельно с цепочкой FastText → векторы для поиска → эмбеддинги каталога → ANN-индекс;
+- в отдельном потоке заранее импортируются библиотеки, нужные только при первом запросе
+  (NLTK для стемминга, модуль сопоставления).
+
+Тяжёлые модули (pandas, gensim, NLTK) импортируются внутри этапов, а не при импорте модуля.
+Этапы, использующие пулы процессов, создают их из контекста forkserver/spawn
+(`utils.corpus_utils.get_pool_context`): fork из многопоточного процесса может зависнуть.
+Ход запуска отслеживается `StartupProgress`: статус и длительность каждого этапа
+доступны для индикатора готовности и сводки времени запуска.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+STARTUP_PHASES = {
+    'imports': "Импорт библиотек",
+    'datasets': "Датасеты",
+    'catalog_store': "Хранилище каталога",
+    'bm25': "BM25-индекс",
+    'attributes': "Индекс атрибутов",
+    'fasttext': "Проверка FastText-модели",
+    'serving_vectors': "Векторы FastText",
+    'catalog_embeddings': "Эмбеддинги каталога",
+    'ann': "ANN-индекс",
+}
+
+
+class StartupProgress:
+    """
+    Потокобезопасный учёт этапов запуска.
+
+    Для каждого этапа хранится статус ('pending', 'running', 'done' или 'failed')
+    и длительность в секундах. Этапы отмечаются контекстным менеджером `phase`.
+    """
+
+    def __init__(self, phases=STARTUP_PHASES):
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        self._ready_at = None
+        self._phases = {name: {'title': title, 'status': 'pending', 'seconds': None}
+                        for name, title in phases.items()}
+
+    @contextmanager
+    def phase(self, name):
+        with self._lock:
+            self._phases[name]['status'] = 'running'
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self._finish(name, 'failed', time.perf_counter() - start)
+            raise
+        self._finish(name, 'done', time.perf_counter() - start)
+
+    def _finish(self, name, status, seconds):
+        with self._lock:
+            self._phases[name].update(status=status, seconds=seconds)
+            if all(phase['status'] == 'done' for phase in self._phases.values()):
+                self._ready_at = time.perf_counter()
+
+    @property
+    def fraction(self):
+        """Доля завершённых этапов (от 0 до 1)."""
+        with self._lock:
+            done = sum(phase['status'] == 'done' for phase in self._phases.values())
+            return done / len(self._phases)
+
+    @property
+    def ready(self):
+        return self.fraction == 1.0
+
+    def snapshot(self):
+        """Возвращает копию состояния этапов: {этап: {'title', 'status', 'seconds'}}."""
+        with self._lock:
+            return {name: dict(phase) for name, phase in self._phases.items()}
+
+    def report(self):
+        """
+        Возвращает сводку времени запуска по этапам.
+
+        Возвращает:
+        -----------
+        dict
+            {этап: длительность в секундах} для завершённых этапов и 'total' — время
+            от создания объекта до готовности (или до текущего момента, если запуск не завершён).
+        """
+        timings = {name: round(phase['seconds'], 3)
+                   for name, phase in self.snapshot().items() if phase['seconds'] is not None}
+        timings['total'] = round((self._ready_at or time.perf_counter()) - self._started_at, 3)
+        return timings
+
+
+def warm_up_imports():
+    """Импортирует библиотеки первого запроса заранее: NLTK (через первый стемминг) и модуль сопоставления."""
+    from utils.text_utils import tokenize_product_name
+    import utils.matching_utils  # noqa: F401
+    tokenize_product_name("лист")
+
+
+def load_resources(csv_path=None, synthetic_path=None, progress=None):
+    """
+    Готовит ресурсы поиска, выполняя независимые этапы в параллельных потоках.
+
+    Каждый этап использует ту же функцию `prepare_*`, что и при последовательной подготовке,
+    поэтому устаревшие артефакты по-прежнему пересобираются по манифесту сборки.
+
+    Возвращает:
+    -----------
+    tuple
+        (vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index), где
+        vink_names — хранилище каталога `CatalogStore`, fasttext_model — облегчённые векторы
+        `ServingVectors`, attribute_index — индекс числовых атрибутов `AttributeIndex`.
+    """
+
+    if progress is None:
+        progress = StartupProgress()
+
+    def run_phase(name, func, *args, **kwargs):
+        with progress.phase(name):
+            return func(*args, **kwargs)
+
+    def prepare_vectors():
+        from utils.fasttext_utils import train_and_save_fasttext_model
+        from utils.vectors_utils import prepare_serving_vectors
+        from utils.embedding_utils import prepare_catalog_embeddings
+        from utils.ann_utils import prepare_ann_index
+
+        fasttext_model = run_phase('fasttext', train_and_save_fasttext_model, synthetic_path, load_model=False)
+        serving_vectors = run_phase('serving_vectors', prepare_serving_vectors, fasttext_model)
+        del fasttext_model
+        catalog_embeddings = run_phase('catalog_embeddings', prepare_catalog_embeddings, serving_vectors)
+        ann_index = run_phase('ann', prepare_ann_index, catalog_embeddings)
+        return serving_vectors, catalog_embeddings, ann_index
+
+    def prepare_lexical():
+        from utils.store_utils import prepare_catalog_store
+        from utils.bm25_utils import prepare_bm25_model
+
+        catalog_store = run_phase('catalog_store', prepare_catalog_store, csv_path=csv_path)
+        bm25_model = run_phase('bm25', prepare_bm25_model, catalog_store=catalog_store)
+        return catalog_store, bm25_model
+
+    def prepare_attributes():
+        from utils.attribute_utils import prepare_attribute_index
+        return prepare_attribute_index()
+
+    def prepare_datasets():
+        from utils.dataset_utils import prepare_processed_and_synthetic_datasets
+        prepare_processed_and_synthetic_datasets(csv_path=csv_path)
+
+    if csv_path is None:
+        from config import DATA_PATH
+        csv_path = DATA_PATH
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        imports_future = executor.submit(run_phase, 'imports', warm_up_imports)
+        run_phase('datasets', prepare_datasets)
+        lexical_future = executor.submit(prepare_lexical)
+        attributes_future = executor.submit(run_phase, 'attributes', prepare_attributes)
+        vectors_future = executor.submit(prepare_vectors)
+
+        vink_names, bm25_model = lexical_future.result()
+        attribute_index = attributes_future.result()
+        fasttext_model, catalog_embeddings, ann_index = vectors_future.result()
+        imports_future.result()
+
+    print("Время запуска по этапам (с):", progress.report())
+
+    return vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index
@@ -0,0 +1,187 @@
+"""
+Модуль колоночного хранилища каталога товаров.
+
+Каталог хранится в файле Arrow IPC (`data/catalog.arrow`) одной таблицей, строка i которой
+соответствует документу i BM25-индекса и строке i матрицы эмбеддингов каталога:
+- `vink_id` — код товара (SKU) из исходного CSV;
+- `vink_name` — исходное наименование;
+- `tokens` — нормализованные токены наименования (список строк: плоский массив токенов
+  и смещения начала токенов каждой строки);
+- `embedding_row` — номер строки в матрице эмбеддингов каталога.
+
+Файл открывается через memory-map без копирования: столбцы читаются напрямую с диска,
+а не держатся в памяти списком Python-строк. `CatalogStore` ведёт себя как последовательность
+наименований, поэтому передаётся в `match_query` и `match_queries` вместо `vink_names`;
+индексы поиска (номера строк) переводятся в коды товаров через `resolve_ids`.
+
+Сохраняет:
+- `data/catalog.arrow` — таблица каталога.
+"""
+
+import os
+import joblib
+import numpy as np
+import pyarrow as pa
+from config import DATA_PATH
+from utils.corpus_utils import build_corpus
+from utils.text_utils import get_text_config
+from utils.manifest_utils import config_hash, file_hash, is_stage_current, record_stage
+
+CATALOG_STORE_PATH = 'data/catalog.arrow'
+
+
+def _column(table, name):
+    """Возвращает столбец таблицы одним массивом (без копирования, если он из одного блока)."""
+    column = table.column(name)
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+class CatalogStore:
+    """
+    Каталог товаров в таблице Arrow.
+
+    Поддерживает `len(store)` и `store[i]` (наименование строки i), выборку наименований,
+    кодов товаров и токенов по массиву номеров строк.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._ids = _column(table, 'vink_id')
+        self._names = _column(table, 'vink_name')
+        self._tokens = _column(table, 'tokens')
+        self._embedding_rows = _column(table, 'embedding_row')
+
+    @classmethod
+    def from_columns(cls, ids, names, token_lists):
+        """Собирает каталог из кодов товаров, наименований и списков токенов (строки по порядку)."""
+        table = pa.table({
+            'vink_id': pa.array(ids),
+            'vink_name': pa.array(names, type=pa.string()),
+            'tokens': pa.array(token_lists, type=pa.list_(pa.string())),
+            'embedding_row': pa.array(np.arange(len(names), dtype=np.int64)),
+        })
+        return cls(table)
+
+    @classmethod
+    def open(cls, path=CATALOG_STORE_PATH, memory_map=True):
+        """
+        Открывает каталог из файла Arrow IPC. При memory_map=True столбцы отображаются
+        с диска без копирования в память процесса.
+
+        Возвращает:
+        -----------
+        CatalogStore
+            Каталог, готовый к использованию в поиске.
+        """
+        source = pa.memory_map(path, 'r') if memory_map else pa.OSFile(path, 'rb')
+        return cls(pa.ipc.open_file(source).read_all())
+
+    def save(self, path=CATALOG_STORE_PATH):
+        """Записывает каталог в файл Arrow IPC одним блоком (через временный файл)."""
+        tmp_path = path + '.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, self.table.schema) as writer:
+                writer.write_table(self.table, max_chunksize=max(self.table.num_rows, 1))
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, row):
+        return self._names[int(row)].as_py()
+
+    def __iter__(self):
+        return iter(self._names.to_pylist())
+
+    @property
+    def ids(self):
+        """Коды товаров всех строк (numpy; для числовых кодов без копирования)."""
+        return self._ids.to_numpy(zero_copy_only=False)
+
+    def resolve_ids(self, rows):
+        """Возвращает коды товаров для номеров строк каталога (результатов поиска)."""
+        return self._ids.take(pa.array(np.asarray(rows, dtype=np.int64))).to_numpy(zero_copy_only=False)
+
+    def take_ids(self, rows):
+        """Возвращает коды товаров для номеров строк списком Python (пустые коды — None)."""
+        return self._ids.take(pa.array(np.asarray(rows, dtype=np.int64))).to_pylist()
+
+    def take_names(self, rows):
+        """Возвращает наименования для номеров строк каталога."""
+        return self._names.take(pa.array(np.asarray(rows, dtype=np.int64))).to_pylist()
+
+    def tokens(self, row):
+        """Возвращает нормализованные токены наименования строки."""
+        return self._tokens[int(row)].as_py()
+
+    def token_lists(self, rows):
+        """Возвращает списки нормализованных токенов для номеров строк каталога."""
+        return self._tokens.take(pa.array(np.asarray(rows, dtype=np.int64))).to_pylist()
+
+    def embedding_rows(self, rows):
+        """Возвращает номера строк матрицы эмбеддингов для номеров строк каталога."""
+        return self._embedding_rows.take(pa.array(np.asarray(rows, dtype=np.int64))).to_numpy()
+
+
+def prepare_catalog_store(csv_path=DATA_PATH, save_dir_names='data', save_dir_model='models', workers=None):
+    """
+    Собирает колоночное хранилище каталога или открывает его с диска, если оно собрано
+    по текущим исходному CSV, списку наименований и конфигурации предобработки
+    (по манифесту сборки).
+
+    Коды товаров берутся из исходного CSV (строки отбираются так же, как при подготовке
+    `vink_names`). Если список наименований был изменён инкрементальным обновлением каталога,
+    коды берутся из прежнего хранилища. Токены считаются параллельно на `workers` процессах.
+
+    Возвращает:
+    -----------
+    CatalogStore
+        Каталог, открытый через memory-map.
+        Возвращает None, если отсутствует файл с предобработанными наименованиями.
+    """
+
+    from utils.dataset_utils import load_goods
+
+    store_path = os.path.join(save_dir_names, 'catalog.arrow')
+    names_path = os.path.join(save_dir_names, 'vink_names.joblib')
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
+
+    if not os.path.exists(names_path) or not os.path.exists(csv_path):
+        if os.path.exists(store_path):
+            print("Хранилище каталога на месте, сборка не требуется")
+            return CatalogStore.open(store_path)
+        print("Подготовьте обработанный датасет.")
+        return None
+
+    inputs = {
+        'source': file_hash(csv_path, manifest_path),
+        'vink_names': file_hash(names_path, manifest_path),
+        'text_config': config_hash(get_text_config()),
+    }
+    if is_stage_current('catalog_store', inputs, [store_path], manifest_path):
+        print("Хранилище каталога на месте, сборка не требуется")
+        return CatalogStore.open(store_path)
+
+    print("Собираем хранилище каталога...")
+    vink_names = joblib.load(names_path)
+
+    # Коды товаров: из исходного CSV или, если наименования обновлялись, из прежнего хранилища
+    goods = load_goods(csv_path)
+    ids = None
+    if goods['vink_name'].tolist() == vink_names:
+        ids = goods['vink_id'].to_numpy()
+    elif os.path.exists(store_path):
+        previous = CatalogStore.open(store_path, memory_map=False)
+        if list(previous) == vink_names:
+            ids = previous.ids
+    if ids is None:
+        print("Коды товаров не удалось сопоставить с наименованиями, они оставлены пустыми.")
+        # Тип пустого столбца — тот же, что у кодов в исходном CSV (например, строковые SKU)
+        ids = pa.nulls(len(vink_names), type=pa.array(goods['vink_id'].to_numpy()).type)
+
+    token_lists = build_corpus(vink_names, workers=workers, desc="Токенизация каталога")
+    CatalogStore.from_columns(ids, vink_names, token_lists).save(store_path)
+    record_stage('catalog_store', inputs, [store_path], manifest_path)
+    print(f"Хранилище каталога сохранено в {store_path}")
+
+    return CatalogStore.open(store_path)
@@ -3,30 +3,33 @@
 
 Основные функции:
 1. `preprocess_text` — очищает текст от лишних символов, выполняет замену слов по словарю и приводит слова к их базовой форме.
-2. `get_embedding` — извлекает эмбеддинг для переданного текста с использованием предоставленных векторных представлений слов.
+   Работает через общий `TextNormalizer` с предкомпилированными выражениями и кэшами (статистика — `get_normalizer_stats`).
+2. `tokenize_product_name` — возвращает итоговый список токенов наименования за один проход
+   (то же, что `word_tokenize(preprocess_text(text))`, но без NLTK-токенизатора на основном пути
+   и без данных NLTK `punkt`; строки с точками и запятыми разбираются тем же конвейером NLTK
+   с необученным делением на предложения).
+3. `get_embedding` — извлекает эмбеддинг для переданного текста с использованием предоставленных векторных представлений слов.
+4. `verify_tokenizer_parity` — проверяет совпадение `tokenize_product_name` с прежним двухшаговым путём.
 
 Используемые библиотеки:
 - `re`: для работы с регулярными выражениями.
-- `nltk`: для токенизации и стемминга.
+- `nltk`: для стемминга и токенизации редких строк с пунктуацией.
 - `numpy`: для работы с векторами.
 
 Зависимости:
-1. NLTK: токенизатор `punkt` загружается автоматически при первом использовании.
+1. NLTK: данные `punkt` для токенизации не нужны. Строки с точками и запятыми всегда делятся
+   на предложения необученным Punkt, поэтому токены не зависят от того, установлены ли данные
+   на машине, где строится индекс или обслуживаются запросы. От `word_tokenize` (обученная модель
+   Punkt) они могут отличаться на строках с сокращениями вида «д.»; `verify_tokenizer_parity`
+   показывает такие расхождения и загружает данные `punkt` при необходимости.
+2. NLTK импортируется не при импорте модуля, а при первом стемминге или первой строке
+   с пунктуацией (импорт пакета занимает заметную часть времени запуска приложения).
 """
 
 import re
-from nltk.stem.snowball import SnowballStemmer
-from nltk.tokenize import word_tokenize
-import nltk
+from functools import lru_cache
 import numpy as np
 
-# Автоматическая загрузка токенизатора punkt при необходимости
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt")
-
-stemmer = SnowballStemmer(language='russian')
 replacement_dict = {
     "прозр": "прозрачный",
     "проз": "прозрачный",
@@ -34,6 +37,125 @@ replacement_dict = {
 }
 stop_words = {'м', 'мм', 'мк', 'мкм', 'кг', 'г', 'для', 'на', 'с', 'и', 'плотностью'}
 
+
+class TextNormalizer:
+    """
+    Нормализатор наименований товаров с предкомпилированными регулярными выражениями
+    и кэшами.
+
+    - Регулярные выражения компилируются один раз при создании объекта.
+    - Результат стемминга кэшируется по токену (словарь товаров небольшой и сильно повторяется).
+    - Результат обработки целой строки кэшируется в LRU-кэше ограниченного размера.
+    - Если стеммер не передан, Snowball-стеммер для `language` создаётся при первом обращении.
+
+    Статистика попаданий в кэши доступна через `stats()`.
+    """
+
+    def __init__(self, stop_words, replacement_dict, stemmer=None, cache_size=100_000, stem_cache_size=200_000,
+                 language='russian'):
+        self.stop_words = stop_words
+        self.replacement_dict = replacement_dict
+        self.stemmer = stemmer
+        self.language = language
+        self.patterns = [
+            (re.compile(r'[^а-яёa-z0-9\s,\.]'), ' '),
+            (re.compile(r'([^\d])[\.,]+([^\d])'), r'\1 \2'),
+            (re.compile(r'(\d)[\.,]+(\d)'), r'\1.\2'),
+            (re.compile(r'(?<=\d)(?=[а-яa-z])|(?<=[а-яa-z])(?=\d)'), ' '),
+            (re.compile(r'(\d)\s*[xх]\s*(\d)'), r'\1 \2'),
+            (re.compile(r'\b\d+(\.\d+)?\s*кг\b'), ' '),
+            (re.compile(r'\b0+(\d+)\b'), r'\1'),
+            (re.compile(r'\.+$'), ''),
+        ]
+        self._stem = lru_cache(maxsize=stem_cache_size)(self._stem_word)
+        self._normalize_cached = lru_cache(maxsize=cache_size)(self._normalize)
+
+        # Строки с точками/запятыми и словами-сокращениями (cannot, gonna, ...) разбираются конвейером NLTK
+        self._needs_word_tokenizer = re.compile(r'[\.,]|cannot|gimme|gonna|gotta|lemme|wanna')
+        self._word_tokenizer = None
+
+    def _stem_word(self, word):
+        if self.stemmer is None:
+            from nltk.stem.snowball import SnowballStemmer
+            self.stemmer = SnowballStemmer(language=self.language)
+        return self.stemmer.stem(word)
+
+    def _normalize(self, text):
+        text = text.lower()
+        for pattern, repl in self.patterns:
+            text = pattern.sub(repl, text)
+
+        words = [word for word in text.split() if word not in self.stop_words]
+        words = [self.replacement_dict.get(word, word) for word in words]
+        words = [self._stem(word) for word in words]
+
+        return ' '.join(words)
+
+    def normalize(self, text):
+        return self._normalize_cached(str(text))
+
+    def tokenize(self, text):
+        """
+        Возвращает список токенов нормализованного текста.
+
+        В нормализованной строке токены разделены одиночными пробелами и, кроме редких
+        случаев с точками и запятыми, состоят только из букв и цифр — для них NLTK
+        `word_tokenize` эквивалентен `str.split`. Редкие строки разбираются конвейером
+        `word_tokenize` без обученных данных (см. `_load_word_tokenizer`).
+        """
+        normalized = self.normalize(text)
+        if not self._needs_word_tokenizer.search(normalized):
+            return normalized.split()
+        if self._word_tokenizer is None:
+            self._word_tokenizer = _load_word_tokenizer()
+        return self._word_tokenizer(normalized)
+
+    def stats(self):
+        """
+        Возвращает статистику кэшей: попадания, промахи и текущий размер
+        для кэша целых строк ('text') и кэша стемминга ('stem').
+        """
+        result = {}
+        for name, cache in (('text', self._normalize_cached), ('stem', self._stem)):
+            info = cache.cache_info()
+            result[name] = {'hits': info.hits, 'misses': info.misses,
+                            'size': info.currsize, 'maxsize': info.maxsize}
+        return result
+
+    def clear_cache(self):
+        self._normalize_cached.cache_clear()
+        self._stem.cache_clear()
+
+    def config(self):
+        """Возвращает конфигурацию предобработки (для отслеживания её изменений при сборке моделей)."""
+        return {
+            'patterns': [[pattern.pattern, repl] for pattern, repl in self.patterns],
+            'stop_words': sorted(self.stop_words),
+            'replacement_dict': self.replacement_dict,
+            'word_tokenizer': 'punkt_untrained',
+            'stemmer': (f'{self.language.capitalize()}Stemmer' if self.stemmer is None
+                        else type(getattr(self.stemmer, 'stemmer', self.stemmer)).__name__),
+        }
+
+
+def _load_word_tokenizer():
+    """
+    Возвращает конвейер NLTK `word_tokenize` с необученным делением на предложения (Punkt
+    без данных `punkt`). Обученная модель не используется даже при установленных данных:
+    токены не должны зависеть от окружения, в котором строится индекс или обслуживаются запросы.
+    """
+    from nltk.tokenize import NLTKWordTokenizer
+    from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+    sentence_splitter = PunktSentenceTokenizer()
+    word_tokenizer = NLTKWordTokenizer()
+    return lambda text: [token for sentence in sentence_splitter.tokenize(text)
+                         for token in word_tokenizer.tokenize(sentence)]
+
+
+normalizer = TextNormalizer(stop_words, replacement_dict)
+
+
 def preprocess_text(text):
     """
     Очищает и обрабатывает текст.
@@ -51,25 +173,67 @@ def preprocess_text(text):
     10. Заменяет слова по заданному словарю.
     11. Применяет стемминг к словам.
 
+    Обработка выполняется общим нормализатором `normalizer` с кэшированием результатов.
+
     Возвращает:
     str: Обработанный текст
     """
-    text = str(text).lower()
-    text = re.sub(r'[^а-яёa-z0-9\s,\.]', ' ', text)
-    text = re.sub(r'([^\d])[\.,]+([^\d])', r'\1 \2', text)
-    text = re.sub(r'(\d)[\.,]+(\d)', r'\1.\2', text)
-    text = re.sub(r'(?<=\d)(?=[а-яa-z])|(?<=[а-яa-z])(?=\d)', ' ', text)
-    text = re.sub(r'(\d)\s*[xх]\s*(\d)', r'\1 \2', text)
-    text = re.sub(r'\b\d+(\.\d+)?\s*кг\b', ' ', text)
-    text = re.sub(r'\b0+(\d+)\b', r'\1', text)
-    text = re.sub(r'\.+$', '', text)
-
-    words = text.split()
-    words = [word for word in words if word not in stop_words]
-    words = [replacement_dict.get(word, word) for word in words]
-    words = [stemmer.stem(word) for word in words]
-
-    return ' '.join(words)
+    return normalizer.normalize(text)
+
+
+def tokenize_product_name(text):
+    """
+    Предобрабатывает наименование товара и возвращает итоговый список стеммированных токенов.
+
+    Даёт те же токены, что и `word_tokenize(preprocess_text(text))`, но без повторного
+    разбора уже разделённой пробелами строки NLTK-токенизатором и без данных `punkt`.
+    На строках с точками и сокращениями возможны расхождения (см. `_load_word_tokenizer`).
+
+    Возвращает:
+    list of str: Список токенов
+    """
+    return normalizer.tokenize(text)
+
+
+def get_normalizer_stats():
+    """Возвращает статистику кэшей общего нормализатора текста."""
+    return normalizer.stats()
+
+
+def get_text_config():
+    """Возвращает конфигурацию предобработки общего нормализатора текста."""
+    return normalizer.config()
+
+
+def verify_tokenizer_parity(texts):
+    """
+    Сравнивает `tokenize_product_name` с прежним путём `word_tokenize(preprocess_text(text))`.
+
+    Используется для проверки на каталоге после изменения правил предобработки.
+    Требует данные NLTK `punkt` (загружаются при необходимости). Расхождения возможны только
+    на строках с точками, где обученная модель Punkt делит предложения иначе, чем необученная.
+
+    Возвращает:
+    list of tuple
+        Список расхождений (текст, токены прежнего пути, токены нового пути); пустой при полном совпадении.
+    """
+    import nltk
+    from nltk.tokenize import word_tokenize
+
+    try:
+        word_tokenize('.')
+    except LookupError:
+        # NLTK до 3.8 включительно использует данные punkt, новые версии — punkt_tab
+        nltk.download("punkt")
+        nltk.download("punkt_tab")
+
+    mismatches = []
+    for text in texts:
+        expected = word_tokenize(preprocess_text(text))
+        actual = tokenize_product_name(text)
+        if expected != actual:
+            mismatches.append((text, expected, actual))
+    return mismatches
 
 def get_embedding(text, wv_embeddings, dim=None):
     """
@@ -80,13 +244,14 @@ def get_embedding(text, wv_embeddings, dim=None):
 
     Примечания:
     - Функция использует токенизацию и предобработку текста, определенные в других частях кода.
+    - wv_embeddings — векторы FastText-модели (`model.wv`) или облегчённые векторы
+      `ServingVectors` для поиска; для последних векторы слов возвращаются в float32.
     """
         
     if dim is None:
         dim = wv_embeddings.vector_size
 
-    cleaned_text = preprocess_text(text)
-    words = word_tokenize(cleaned_text)
+    words = tokenize_product_name(text)
     word_vectors = [wv_embeddings[word] for word in words if word in wv_embeddings]
 
     if not word_vectors:
@@ -0,0 +1,287 @@
+"""
+Модуль для облегчённых векторов FastText, используемых при поиске.
+
+Для расчёта эмбеддингов запросов нужны только векторы слов и корзин n-грамм, тогда как
+`FastText.load` поднимает в память всю обучаемую модель вместе с состоянием обучения.
+Модуль экспортирует из обученной модели только необходимые для поиска массивы и открывает
+их через memory-map, без импорта gensim.
+
+Содержит:
+- `ServingVectors` — векторы слов и n-грамм с тем же интерфейсом, что у `FastText.wv`
+  (`vector_size`, `word in wv`, `wv[word]`), поэтому подходит для `get_embedding`,
+  `embed_token_lists` и `match_query` вместо FastText-модели.
+- `export_serving_vectors` — экспорт векторов из обученной FastText-модели.
+- `prepare_serving_vectors` — экспорт по манифесту сборки и загрузка через memory-map.
+
+Параметры экспорта:
+- `dtype` — тип хранения векторов: 'float32', 'float16' или 'int8' (с масштабом на строку).
+- `prune_ngrams` — хранить только корзины, в которые попадают n-граммы слов словаря
+  (по умолчанию выключено). Остальные корзины при обучении не обновляются и содержат случайную
+  инициализацию; при прореживании их вклад в вектор слова вне словаря считается нулевым,
+  поэтому векторы слов вне словаря отличаются от `FastText.wv` (векторы слов словаря совпадают).
+
+Сохраняет:
+- `models/fasttext_serving/` — версии векторов (массивы .npy и meta.json) и указатель текущей версии `CURRENT`.
+"""
+
+import os
+import json
+from functools import lru_cache
+import numpy as np
+from utils.manifest_utils import (get_stage_build_id, is_stage_current, record_stage, new_version_dir,
+                                  publish_version, current_version_dir)
+
+SERVING_FORMAT_VERSION = 1
+SERVING_DTYPES = ('float32', 'float16', 'int8')
+
+
+def ft_hash(ngram):
+    """Хэш FNV-1a байтовой строки n-граммы, как в FastText (байты как знаковые char)."""
+    h = 2166136261
+    for byte in ngram:
+        h ^= (byte - 256 if byte > 127 else byte) & 0xFFFFFFFF
+        h = (h * 16777619) & 0xFFFFFFFF
+    return h
+
+
+def compute_ngrams(word, min_n, max_n):
+    """Возвращает n-граммы слова '<word>' в UTF-8 (длины от min_n до max_n символов), как в FastText."""
+    encoded = f'<{word}>'.encode('utf-8')
+    n_bytes = len(encoded)
+    ngrams = []
+    for i in range(n_bytes):
+        # Пропускаем байты продолжения UTF-8: n-грамма начинается с символа
+        if encoded[i] & 0xC0 == 0x80:
+            continue
+        j, n = i, 1
+        while j < n_bytes and n <= max_n:
+            j += 1
+            while j < n_bytes and encoded[j] & 0xC0 == 0x80:
+                j += 1
+            if n >= min_n and not (n == 1 and (i == 0 or j == n_bytes)):
+                ngrams.append(encoded[i:j])
+            n += 1
+    return ngrams
+
+
+def _quantize(matrix, dtype):
+    """Переводит матрицу в тип хранения; для int8 возвращает также масштаб каждой строки."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype == 'int8':
+        scale = np.abs(matrix).max(axis=1) / 127
+        scale[scale == 0] = 1.0
+        return np.round(matrix / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+    return matrix.astype(dtype), None
+
+
+class ServingVectors:
+    """
+    Векторы FastText только для расчёта эмбеддингов, без состояния обучения.
+
+    Слова словаря хранятся отсортированным массивом в UTF-8 (`terms`), их векторы — в том же
+    порядке. Вектор слова вне словаря, как в FastText, равен среднему векторов корзин его n-грамм;
+    номера корзин слова кэшируются. При прореживании корзин `ngram_buckets` — отсортированные
+    номера сохранённых корзин, строка `ngram_vectors` соответствует позиции корзины в нём.
+    """
+
+    def __init__(self, terms, vectors, ngram_vectors, min_n, max_n, bucket, ngram_buckets=None,
+                 vectors_scale=None, ngram_scale=None, cache_size=100_000):
+        self.terms = terms
+        self.vectors = vectors
+        self.ngram_vectors = ngram_vectors
+        self.min_n = min_n
+        self.max_n = max_n
+        self.bucket = bucket
+        self.ngram_buckets = ngram_buckets
+        self.vectors_scale = vectors_scale
+        self.ngram_scale = ngram_scale
+        self._ngram_rows = lru_cache(maxsize=cache_size)(self._compute_ngram_rows)
+
+    @property
+    def vector_size(self):
+        return self.vectors.shape[1]
+
+    @property
+    def wv(self):
+        """Векторы слов — сам объект; позволяет передавать его вместо FastText-модели."""
+        return self
+
+    def _word_index(self, word):
+        if len(self.terms) == 0:
+            return -1
+        encoded = word.encode('utf-8')
+        position = int(np.searchsorted(self.terms, encoded))
+        if position < len(self.terms) and self.terms[position] == encoded:
+            return position
+        return -1
+
+    def _compute_ngram_rows(self, word):
+        """Возвращает строки сохранённых корзин n-грамм слова и общее число его n-грамм."""
+        buckets = np.array([ft_hash(ngram) % self.bucket for ngram in compute_ngrams(word, self.min_n, self.max_n)],
+                           dtype=np.int64)
+        if self.ngram_buckets is None:
+            return buckets, len(buckets)
+        if len(self.ngram_buckets) == 0:
+            return buckets[:0], len(buckets)
+        rows = np.minimum(np.searchsorted(self.ngram_buckets, buckets), len(self.ngram_buckets) - 1)
+        return rows[self.ngram_buckets[rows] == buckets], len(buckets)
+
+    @staticmethod
+    def _gather(matrix, scale, rows):
+        vectors = np.asarray(matrix[rows], dtype=np.float32)
+        if scale is not None:
+            vectors = vectors * np.asarray(scale[rows], dtype=np.float32)[..., None]
+        return vectors
+
+    def __contains__(self, word):
+        return self._word_index(word) >= 0 or len(self._ngram_rows(word)[0]) > 0
+
+    def get_vector(self, word):
+        """Возвращает вектор слова (float32); для слова без сохранённых n-грамм — нулевой вектор."""
+        index = self._word_index(word)
+        if index >= 0:
+            return self._gather(self.vectors, self.vectors_scale, index)
+
+        rows, n_ngrams = self._ngram_rows(word)
+        if len(rows) == 0:
+            return np.zeros(self.vector_size, dtype=np.float32)
+        return self._gather(self.ngram_vectors, self.ngram_scale, rows).sum(axis=0) / n_ngrams
+
+    __getitem__ = get_vector
+
+    def save(self, path):
+        """Сохраняет векторы в директорию (новой версией с атомарной публикацией, как `BM25Index.save`)."""
+        tmp_path = new_version_dir(path)
+
+        arrays = {
+            'terms': self.terms,
+            'vectors': self.vectors,
+            'ngram_vectors': self.ngram_vectors,
+            'ngram_buckets': self.ngram_buckets,
+            'vectors_scale': self.vectors_scale,
+            'ngram_scale': self.ngram_scale,
+        }
+        for name, array in arrays.items():
+            if array is not None:
+                np.save(os.path.join(tmp_path, f'{name}.npy'), np.asarray(array))
+
+        meta = {
+            'format_version': SERVING_FORMAT_VERSION,
+            'min_n': self.min_n,
+            'max_n': self.max_n,
+            'bucket': self.bucket,
+            'dtype': str(self.vectors.dtype),
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+        publish_version(tmp_path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Загружает векторы, сохранённые методом `save`. При mmap_mode='r' массивы
+        отображаются с диска и разделяются между процессами.
+
+        Возвращает:
+        -----------
+        ServingVectors
+            Векторы, готовые к расчёту эмбеддингов.
+        """
+        path = current_version_dir(path)
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != SERVING_FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия формата векторов: {meta.get('format_version')}")
+
+        def load_array(name):
+            array_path = os.path.join(path, f'{name}.npy')
+            return np.load(array_path, mmap_mode=mmap_mode) if os.path.exists(array_path) else None
+
+        return cls(load_array('terms'), load_array('vectors'), load_array('ngram_vectors'),
+                   meta['min_n'], meta['max_n'], meta['bucket'], ngram_buckets=load_array('ngram_buckets'),
+                   vectors_scale=load_array('vectors_scale'), ngram_scale=load_array('ngram_scale'))
+
+
+def export_serving_vectors(fasttext_model, out_dir='models/fasttext_serving', dtype='float16', prune_ngrams=False):
+    """
+    Экспортирует из обученной FastText-модели векторы, необходимые для поиска.
+
+    Сохраняются итоговые векторы слов словаря (с учётом n-грамм) и матрица корзин n-грамм
+    для слов вне словаря. При `prune_ngrams=True` сохраняются только корзины n-грамм слов
+    словаря — остальные корзины при обучении не обновлялись; файлы меньше, но векторы слов
+    вне словаря отличаются от векторов FastText-модели.
+
+    Возвращает:
+    -----------
+    dict
+        Сводка экспорта: число слов, число сохранённых корзин и размер на диске в байтах.
+    """
+
+    if dtype not in SERVING_DTYPES:
+        raise ValueError(f"dtype должен быть одним из {SERVING_DTYPES}, получено: {dtype}")
+
+    wv = fasttext_model.wv
+    words = np.array([word.encode('utf-8') for word in wv.index_to_key], dtype=bytes)
+    order = np.argsort(words, kind='stable')
+    vectors, vectors_scale = _quantize(wv.vectors[order], dtype)
+
+    ngram_buckets = None
+    ngram_matrix = wv.vectors_ngrams
+    if prune_ngrams:
+        used = np.zeros(wv.bucket, dtype=bool)
+        for word in wv.index_to_key:
+            used[[ft_hash(ngram) % wv.bucket for ngram in compute_ngrams(word, wv.min_n, wv.max_n)]] = True
+        ngram_buckets = np.flatnonzero(used)
+        ngram_matrix = ngram_matrix[ngram_buckets]
+    ngram_vectors, ngram_scale = _quantize(ngram_matrix, dtype)
+
+    serving = ServingVectors(words[order], vectors, ngram_vectors, wv.min_n, wv.max_n, wv.bucket,
+                             ngram_buckets=ngram_buckets, vectors_scale=vectors_scale, ngram_scale=ngram_scale)
+    serving.save(out_dir)
+
+    size = sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir))
+    return {'words': len(words), 'ngram_buckets': len(ngram_vectors), 'bytes': size}
+
+
+def prepare_serving_vectors(fasttext_model=None, model_path='models/fasttext_model_full.model',
+                            save_dir_model='models', dtype='float16', prune_ngrams=False):
+    """
+    Готовит облегчённые векторы FastText для поиска.
+
+    Если векторы уже экспортированы из текущей FastText-модели с текущими параметрами
+    (по манифесту сборки), они открываются через memory-map без загрузки самой модели.
+    В противном случае модель (переданная или загруженная из `model_path`) экспортируется.
+
+    Возвращает:
+    -----------
+    ServingVectors
+        Векторы для расчёта эмбеддингов запросов и каталога.
+        Возвращает None, если FastText-модель не обучена.
+    """
+
+    out_dir = os.path.join(save_dir_model, 'fasttext_serving')
+    manifest_path = os.path.join(save_dir_model, 'manifest.json')
+
+    inputs = {
+        'fasttext': get_stage_build_id('fasttext', manifest_path),
+        'params': {'dtype': dtype, 'prune_ngrams': prune_ngrams},
+    }
+    if is_stage_current('fasttext_serving', inputs, [out_dir], manifest_path):
+        print("Векторы FastText для поиска на месте, экспорт не требуется")
+        return ServingVectors.load(out_dir)
+
+    if fasttext_model is None:
+        if not os.path.exists(model_path):
+            print("Обучите FastText-модель.")
+            return None
+        from gensim.models import FastText
+        fasttext_model = FastText.load(model_path)
+
+    print("Экспортируем векторы FastText для поиска...")
+    summary = export_serving_vectors(fasttext_model, out_dir, dtype=dtype, prune_ngrams=prune_ngrams)
+    record_stage('fasttext_serving', inputs, [out_dir], manifest_path)
+    print(f"Векторы FastText сохранены в {out_dir}: {summary['words']} слов, "
+          f"{summary['ngram_buckets']} корзин n-грамм, {summary['bytes'] / 2 ** 20:.1f} МБ")
+
+    return ServingVectors.load(out_dir)
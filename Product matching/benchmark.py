@@ -0,0 +1,86 @@
+"""
+Замер качества и скорости сопоставления с проверкой регрессий.
+
+Готовит ресурсы поиска так же, как приложение (`load_resources`), строит отложенную выборку
+запросов и замеряет:
+- hits@1/3/5 и задержки p50/p95/p99, запросов в секунду для `match_query` и `match_queries`;
+- холодный запуск (в отдельном процессе) и время построения индексов BM25 и ANN.
+
+Результаты сохраняются в JSON и сравниваются с эталонными (baseline). При регрессиях
+скрипт завершается с кодом 1.
+
+Запуск:
+-------
+python benchmark.py                                   # синтетическая выборка, seed=42
+python benchmark.py --matches data/Сметченные_позиции_источник_1.csv data/Сметченные_позиции_источник_2.csv
+python benchmark.py --update-baseline                 # сохранить результаты как эталонные
+"""
+
+import sys
+import argparse
+from utils.benchmark_utils import (build_synthetic_holdout, load_competitor_holdout, run_benchmark,
+                                   save_results, load_results, compare_with_baseline, DEFAULT_TOLERANCES)
+from utils.startup_utils import load_resources
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Замер качества и скорости сопоставления")
+    parser.add_argument('--queries', type=int, default=500, help="Размер синтетической выборки")
+    parser.add_argument('--seed', type=int, default=42, help="Seed синтетической выборки")
+    parser.add_argument('--matches', nargs='+', help="Размеченные файлы сопоставлений вместо синтетической выборки")
+    parser.add_argument('--k-top', type=int, default=10, help="Число кандидатов BM25")
+    parser.add_argument('--batch-size', type=int, default=256, help="Размер порции для match_queries")
+    parser.add_argument('--output', default='benchmarks/results.json', help="Файл результатов")
+    parser.add_argument('--baseline', default='benchmarks/baseline.json', help="Файл эталонных результатов")
+    parser.add_argument('--update-baseline', action='store_true', help="Сохранить результаты как эталонные")
+    parser.add_argument('--skip-cold-start', action='store_true', help="Не замерять холодный запуск")
+    parser.add_argument('--skip-build', action='store_true', help="Не замерять построение индексов")
+    for kind, value in DEFAULT_TOLERANCES.items():
+        parser.add_argument(f"--tolerance-{kind.replace('_', '-')}", type=float, default=value, help=f"Допуск для метрик '{kind}'")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    resources = load_resources()
+
+    if args.matches:
+        holdout = load_competitor_holdout(args.matches)
+        holdout_name = 'competitors:' + ','.join(args.matches)
+    else:
+        holdout = build_synthetic_holdout(resources[0], n_queries=args.queries, seed=args.seed)
+        holdout_name = f'synthetic:n={args.queries},seed={args.seed}'
+
+    results = run_benchmark(resources, holdout, holdout_name, k_top=args.k_top, batch_size=args.batch_size,
+                            cold_start=not args.skip_cold_start, index_build=not args.skip_build)
+    save_results(results, args.output)
+    for name, value in results['metrics'].items():
+        print(f"{name:<40} {value:.4f}")
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.update_baseline:
+        save_results(results, args.baseline)
+        print(f"Эталонные результаты обновлены: {args.baseline}")
+        return 0
+
+    try:
+        baseline = load_results(args.baseline)
+    except FileNotFoundError:
+        print(f"Эталонные результаты не найдены ({args.baseline}), сравнение пропущено.")
+        return 0
+
+    tolerances = {kind: getattr(args, f'tolerance_{kind}') for kind in DEFAULT_TOLERANCES}
+    regressions = compare_with_baseline(results, baseline, tolerances)
+    if baseline['meta'].get('holdout') != holdout_name:
+        print("Внимание: эталон получен на другой выборке, сравнение может быть некорректным.")
+    if not regressions:
+        print("Регрессий относительно эталона нет.")
+        return 0
+    print("Обнаружены регрессии:")
+    for regression in regressions:
+        print(f"  {regression['metric']}: {regression['baseline']:.4f} -> {regression['current']:.4f}")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
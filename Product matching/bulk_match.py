@@ -0,0 +1,49 @@
+"""
+Массовое сопоставление файла поставщика с каталогом.
+
+Готовит ресурсы поиска так же, как приложение (`load_resources`: устаревшие артефакты
+пересобираются), затем сопоставляет наименования из CSV-файла поставщика порциями
+на пуле процессов (`utils.bulk_utils.match_file`) и дописывает результаты в выходной CSV.
+
+После каждой порции сохраняется контрольная точка: при падении или остановке повторный
+запуск с теми же аргументами продолжит с места остановки.
+
+Запуск:
+-------
+python bulk_match.py data/прайс_поставщика.csv --column name --output data/прайс_поставщика_matches.csv
+python bulk_match.py data/прайс.csv --column "Наименование" --sep ";" --encoding cp1251 --restart
+"""
+
+import argparse
+from utils.bulk_utils import match_file
+from utils.startup_utils import load_resources
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Массовое сопоставление файла поставщика с каталогом")
+    parser.add_argument('input', help="CSV-файл поставщика")
+    parser.add_argument('--column', required=True, help="Колонка с наименованиями товаров")
+    parser.add_argument('--output', help="Файл результатов (по умолчанию — <входной файл>_matches.csv)")
+    parser.add_argument('--k-top', type=int, default=10, help="Число кандидатов BM25")
+    parser.add_argument('--n-top', type=int, default=5, help="Число результатов на строку")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Размер порции (строк между контрольными точками)")
+    parser.add_argument('--workers', type=int, default=None, help="Число процессов (по умолчанию — по числу ядер)")
+    parser.add_argument('--sep', default=',', help="Разделитель CSV")
+    parser.add_argument('--encoding', default='utf-8', help="Кодировка CSV")
+    parser.add_argument('--no-ann', action='store_true', help="Не использовать ANN-поиск")
+    parser.add_argument('--restart', action='store_true', help="Начать заново, игнорируя контрольную точку")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = args.output or args.input.rsplit('.', 1)[0] + '_matches.csv'
+    # Подготовка (и при необходимости пересборка) артефактов, которые затем откроют процессы пула
+    load_resources()
+    match_file(args.input, output, args.column, k_top=args.k_top, n_top=args.n_top, chunk_size=args.chunk_size,
+               workers=args.workers, restart=args.restart, use_ann=not args.no_ann,
+               sep=args.sep, encoding=args.encoding)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
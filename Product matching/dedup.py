@@ -0,0 +1,53 @@
+"""
+Поиск дубликатов внутри каталога.
+
+Готовит ресурсы поиска так же, как приложение (`load_resources`), и находит кластеры
+дубликатов (`find_duplicates`): все пары наименований с косинусным сходством эмбеддингов
+не ниже порога (блочное умножение матрицы эмбеддингов на себя), подтверждённые общими
+токенами BM25-индекса и совпадающими числовыми атрибутами.
+
+Кластеры сохраняются в CSV (по строке на наименование), подтверждённые пары — по желанию.
+
+Запуск:
+-------
+python dedup.py                                       # порог 0.95, результат в data/duplicates.csv
+python dedup.py --threshold 0.9 --min-overlap 0.9 --pairs-output data/duplicate_pairs.csv
+"""
+
+import os
+import argparse
+from utils.dedup_utils import find_duplicates
+from utils.startup_utils import load_resources
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Поиск дубликатов внутри каталога")
+    parser.add_argument('--threshold', type=float, default=0.95, help="Минимальное косинусное сходство пары")
+    parser.add_argument('--min-overlap', type=float, default=0.8, help="Минимальная доля общих токенов (с весами IDF)")
+    parser.add_argument('--ignore-attributes', action='store_true', help="Не отбрасывать пары с разными числовыми атрибутами")
+    parser.add_argument('--block-size', type=int, default=1024, help="Размер блока строк (плитки сходств)")
+    parser.add_argument('--workers', type=int, default=None, help="Число потоков (по умолчанию — по числу ядер)")
+    parser.add_argument('--output', default='data/duplicates.csv', help="Файл кластеров дубликатов")
+    parser.add_argument('--pairs-output', help="Файл подтверждённых пар")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    vink_names, bm25_model, _, catalog_embeddings, _, _ = load_resources()
+
+    clusters, pairs = find_duplicates(vink_names, catalog_embeddings, bm25_model, threshold=args.threshold,
+                                      min_overlap=args.min_overlap, check_attributes=not args.ignore_attributes,
+                                      block_size=args.block_size, workers=args.workers)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    clusters.to_csv(args.output, index=False)
+    print(f"Кластеры дубликатов сохранены в {args.output}")
+    if args.pairs_output:
+        os.makedirs(os.path.dirname(args.pairs_output) or '.', exist_ok=True)
+        pairs.to_csv(args.pairs_output, index=False)
+        print(f"Пары дубликатов сохранены в {args.pairs_output}")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
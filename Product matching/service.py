@@ -0,0 +1,38 @@
+"""
+HTTP-сервис сопоставления товарных наименований для программной интеграции (ERP и т.п.).
+
+Использует те же ресурсы, что и приложение Streamlit, и объединяет одновременные запросы
+в пачки для пакетного поиска (см. `utils.service_utils`).
+
+Запуск:
+-------
+python service.py --port 8000 --max-batch-size 32 --max-wait-ms 5
+
+Пример запроса:
+curl -X POST http://localhost:8000/match -d '{"query": "ПВХ ECO-FIX 1050х2450х6мм", "n_top": 3}'
+"""
+
+import argparse
+from utils.service_utils import run_service
+from utils.metrics_utils import enable_metrics
+from config import DATA_PATH
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP-сервис сопоставления товаров")
+    parser.add_argument('--host', default='0.0.0.0', help="Адрес для приёма соединений")
+    parser.add_argument('--port', type=int, default=8000, help="Порт")
+    parser.add_argument('--k-top', type=int, default=10, help="Число кандидатов BM25 (и максимальный n_top)")
+    parser.add_argument('--n-top', type=int, default=5, help="Число результатов по умолчанию")
+    parser.add_argument('--max-batch-size', type=int, default=32, help="Максимальный размер пачки запросов")
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help="Сколько ждать запросы в пачку, мс")
+    parser.add_argument('--slow-query-ms', type=float, default=None, help="Порог трассировки медленных пачек, мс")
+    parser.add_argument('--debug', action='store_true', help="Трассировка каждой пачки")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    enable_metrics(debug=args.debug, slow_query_ms=args.slow_query_ms)
+    run_service(host=args.host, port=args.port, k_top=args.k_top, default_n_top=args.n_top,
+                max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, csv_path=DATA_PATH)
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+Сервер шарда каталога для поиска на нескольких машинах (см. `utils.shard_utils`).
+
+Шарды строятся на машине с полным каталогом (`prepare_shards`), директория шарда
+копируется на машину сервера. Координатор подключается к серверам через
+`ShardedIndex.connect([(хост, порт), ...], authkey)`.
+
+Запуск:
+-------
+SHARD_AUTHKEY=секрет python shard_server.py models/shards/shard_0 --port 6001
+"""
+
+import os
+import argparse
+from utils.shard_utils import serve_shard
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сервер шарда каталога")
+    parser.add_argument('shard_dir', help="Директория шарда (models/shards/shard_{i})")
+    parser.add_argument('--host', default='0.0.0.0', help="Адрес для приёма соединений")
+    parser.add_argument('--port', type=int, default=6000, help="Порт")
+    parser.add_argument('--authkey-env', default='SHARD_AUTHKEY',
+                        help="Переменная окружения с общим ключом координатора и шардов")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    authkey = os.environ.get(args.authkey_env)
+    if not authkey:
+        raise SystemExit(f"Задайте общий ключ в переменной окружения {args.authkey_env}")
+    serve_shard(args.shard_dir, (args.host, args.port), authkey.encode('utf-8'))
\ No newline at end of file
@@ -2,9 +2,12 @@
 Поиск похожих товарных наименований по запросу пользователя с использованием Streamlit
 
 Приложение использует:
-- Обработанный список оригинальных наименований (`vink_names`)
+- Хранилище каталога (`CatalogStore`): оригинальные наименования и коды товаров
 - BM25-модель для поиска кандидатов
-- FastText-модель для ранжирования кандидатов по косинусному сходству эмбеддингов
+- Векторы FastText-модели (облегчённые, через memory-map) для ранжирования кандидатов по косинусному сходству эмбеддингов
+- Предрассчитанную матрицу эмбеддингов каталога для быстрого доранжирования
+- ANN-индекс по эмбеддингам каталога для расширения списка кандидатов
+- Общий для всех сессий кэш результатов поиска, привязанный к версии загруженных артефактов
 
 Основной функционал:
 - Ввод текстового запроса пользователем
@@ -13,66 +16,149 @@
 
 Функции:
 --------
-- `init_models`: инициализация и кэширование необходимых моделей и данных
+- `init_models`: фоновая инициализация и кэширование необходимых моделей и данных
+- `init_query_cache`: общий кэш результатов поиска
 - `match_query`: поиск и ранжирование товаров по введённому запросу
+- `main`: страница поиска (строится только в главном процессе, не в процессах пулов)
+
+Запуск:
+-------
+Ресурсы готовятся в фоновом потоке (независимые этапы — параллельно, см. `utils.startup_utils`),
+пока страница показывает индикатор готовности. Тяжёлые библиотеки импортируются при первом
+использовании, время запуска по этапам выводится в блоке «Время запуска».
+
+Если артефакты пересобраны или каталог обновлён (`update_catalog`) после загрузки ресурсов,
+при следующем обращении к странице ресурсы загружаются заново, а кэш результатов сбрасывается.
+
+Длительности этапов поиска собираются всегда (блок «Метрики поиска»); трассировка медленных
+запросов (дольше 200 мс) печатается в консоль, а при MATCHING_DEBUG=1 — трассировка каждого запроса.
 """
 
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from utils.dataset_utils import prepare_processed_and_synthetic_datasets
-from utils.bm25_utils import prepare_bm25_model
-from utils.fasttext_utils import train_and_save_fasttext_model
-from utils.matching_utils import match_query
+from utils.startup_utils import StartupProgress, load_resources
+from utils.cache_utils import QueryResultCache, get_artifact_version
+from utils.metrics_utils import enable_metrics, get_metrics
 from config import DATA_PATH
 
 # Предварительная инициализация моделей
 @st.cache_resource
 def init_models():
     """
-    Инициализирует и кэширует ресурсы: обработанный список наименований товаров,
-    BM25-модель и FastText-модель, чтобы ресурсоёмкие операции выполнялись 
-    только один раз при первом запуске.
+    Запускает в фоновом потоке подготовку ресурсов: хранилища каталога товаров,
+    BM25-модели, векторов FastText-модели, матрицы эмбеддингов каталога и ANN-индекса.
+    Кэшируется, чтобы ресурсоёмкие операции выполнялись только один раз при первом запуске;
+    если загрузка завершилась ошибкой, кэш сбрасывается и загрузка повторяется при следующем обращении.
+    Полная FastText-модель загружается только для обучения и экспорта векторов.
+
+    Возвращает:
+    -----------
+    tuple(StartupProgress, concurrent.futures.Future)
+        Ход запуска по этапам и future с кортежем ресурсов и версией артефактов.
+    """
+
+    progress = StartupProgress()
+    executor = ThreadPoolExecutor(max_workers=1)
+    resources_future = executor.submit(load_versioned_resources, progress)
+    # Поток исполнителя больше не нужен после загрузки
+    resources_future.add_done_callback(lambda _: executor.shutdown(wait=False))
+    return progress, resources_future
+
+def load_versioned_resources(progress):
+    """Готовит ресурсы поиска и возвращает их вместе с версией артефактов, из которых они загружены."""
+    resources = load_resources(csv_path=DATA_PATH, progress=progress)
+    return resources, get_artifact_version()
+
+@st.cache_resource
+def init_query_cache():
+    """
+    Создаёт кэш результатов поиска, общий для всех сессий приложения.
+    Версия артефактов задаётся после загрузки ресурсов (`set_version`).
     """
+    return QueryResultCache(maxsize=10_000)
+
+def main():
+    """Страница поиска: загрузка ресурсов, форма запроса и таблица результатов."""
+    enable_metrics(debug=os.environ.get('MATCHING_DEBUG') == '1', slow_query_ms=200)
+
+    st.title("🔍 Поиск похожих товаров")
+
+    # Инициализируем модели, пока они готовятся — показываем индикатор готовности
+    progress, resources_future = init_models()
+    if not resources_future.done():
+        progress_bar = st.progress(0.0, text="Загрузка моделей...")
+        while not resources_future.done():
+            running = [phase['title'] for phase in progress.snapshot().values() if phase['status'] == 'running']
+            progress_bar.progress(progress.fraction, text=f"Загрузка моделей: {', '.join(running) or '...'}")
+            time.sleep(0.2)
+        progress_bar.empty()
+
+    try:
+        resources, resources_version = resources_future.result()
+    except Exception as error:
+        # Не оставляем в кэше неудачную загрузку: при следующем обращении к странице она повторится
+        init_models.clear()
+        st.error(f"Не удалось загрузить модели: {type(error).__name__}: {error}")
+        st.stop()
+
+    # Артефакты изменились после загрузки ресурсов — загружаем их заново
+    if get_artifact_version() != resources_version:
+        init_models.clear()
+        st.rerun()
+
+    vink_names, bm25_model, fasttext_model, catalog_embeddings, ann_index, attribute_index = resources
+
+    # Кэш хранит индексы кандидатов, поэтому он сбрасывается при загрузке другой версии артефактов
+    query_cache = init_query_cache()
+    query_cache.set_version(resources_version)
+
+    with st.expander("Время запуска"):
+        st.json(progress.report())
+    with st.expander("Кэш запросов"):
+        st.json(query_cache.stats())
+    with st.expander("Метрики поиска"):
+        st.json(get_metrics())
+
+    # Форма для ввода запроса
+    with st.form("search_form"):
+        st.markdown("<h5>Введите наименование товара:</h5>", unsafe_allow_html=True)
+        query = st.text_input(
+            "Введите наименование товара", 
+            placeholder="Например, ПВХ ECO-FIX 1050х2450х6мм прозрачный",
+            label_visibility="collapsed"
+            )
+
+        # Оформление выпадающего списка и кнопки "Найти"
+        st.markdown("<h6>Сколько товаров показать:</h6>", unsafe_allow_html=True)
+        col1, col2 = st.columns([0.15, 1])  # пропорции
+
+        with col1:
+            n_top = st.selectbox(
+                "Сколько товаров показать",  
+                options=list(range(1, 11)), 
+                index=4,
+                label_visibility="collapsed"  
+            )
+
+
+        with col2:
+            submit = st.form_submit_button("Найти")
+
+
+    # Обработка после нажатия кнопки
+    if submit and query:
+        from utils.matching_utils import match_query
+
+        st.markdown("<h6>Результаты поиска (по убыванию сходства):</h6>", unsafe_allow_html=True)
+        result_df = match_query(query_text=query, vink_names=vink_names, bm25_model=bm25_model, fasttext_model=fasttext_model, n_top=n_top, catalog_embeddings=catalog_embeddings, ann_index=ann_index, cache=query_cache, attribute_index=attribute_index)
+
+        result_df["Сходство"] = result_df["Сходство"].round(3)
+        st.dataframe(result_df, use_container_width=True, hide_index=True)
+
 
-    vink_names, _ = prepare_processed_and_synthetic_datasets(csv_path=DATA_PATH)
-    bm25_model = prepare_bm25_model()
-    fasttext_model = train_and_save_fasttext_model('data/synthetic_data.csv')
-    return vink_names, bm25_model, fasttext_model
-
-st.title("🔍 Поиск похожих товаров")
-
-# Инициализируем модели
-vink_names, bm25_model, fasttext_model = init_models()
-
-# Форма для ввода запроса
-with st.form("search_form"):
-    st.markdown("<h5>Введите наименование товара:</h5>", unsafe_allow_html=True)
-    query = st.text_input(
-        "Введите наименование товара", 
-        placeholder="Например, ПВХ ECO-FIX 1050х2450х6мм прозрачный",
-        label_visibility="collapsed"
-        )
-
-    # Оформление выпадающего списка и кнопки "Найти"
-    st.markdown("<h6>Сколько товаров показать:</h6>", unsafe_allow_html=True)
-    col1, col2 = st.columns([0.15, 1])  # пропорции
-
-    with col1:
-        n_top = st.selectbox(
-            "Сколько товаров показать",  
-            options=list(range(1, 11)), 
-            index=4,
-            label_visibility="collapsed"  
-        )
-
-
-    with col2:
-        submit = st.form_submit_button("Найти")
-
-
-# Обработка после нажатия кнопки
-if submit and query:
-    st.markdown("<h6>Результаты поиска (по убыванию сходства):</h6>", unsafe_allow_html=True)
-    result_df = match_query(query_text=query, vink_names=vink_names, bm25_model=bm25_model, fasttext_model=fasttext_model, n_top=n_top)
-    
-    result_df["Сходство"] = result_df["Сходство"].round(3)
-    st.dataframe(result_df, use_container_width=True, hide_index=True)
\ No newline at end of file
+# Процессы пулов (forkserver/spawn) импортируют главный модуль заново под именем __mp_main__:
+# страница строится только при запуске через Streamlit, который выполняет скрипт как __main__
+if __name__ == '__main__':
+    main()
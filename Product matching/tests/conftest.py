@@ -0,0 +1,68 @@
+"""
+Общие фикстуры тестов: небольшой каталог наименований, BM25-индекс и FastText-модель по нему.
+
+Тесты запускаются из папки проекта: `python -m pytest tests`.
+"""
+
+import os
+import sys
+import importlib.util
+import itertools
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Модули импортируются как `utils`, а папка называется `Utils`: на Windows регистр не важен,
+# на остальных системах регистрируем пакет под нужным именем
+if importlib.util.find_spec('utils') is None:
+    utils_dir = os.path.join(ROOT, 'Utils')
+    spec = importlib.util.spec_from_file_location('utils', os.path.join(utils_dir, '__init__.py'),
+                                                  submodule_search_locations=[utils_dir])
+    sys.modules['utils'] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules['utils'])
+
+MATERIALS = ['Пленка', 'Акрил', 'ПВХ', 'Композит', 'Пенокартон']
+BRANDS = ['ORACAL', 'SIBU', 'Plexiglas', 'ECO-FIX']
+SIZES = ['1050х2050х3мм', '2000х3050х5мм']
+
+
+def make_catalog_names():
+    """Наименования вида «Акрил ORACAL 2000х3050х5мм» — все сочетания материала, бренда и размера."""
+    return [f'{material} {brand} {size}' for material, brand, size in itertools.product(MATERIALS, BRANDS, SIZES)]
+
+
+@pytest.fixture(scope='session')
+def catalog_names():
+    return make_catalog_names()
+
+
+@pytest.fixture(scope='session')
+def catalog_corpus(catalog_names):
+    from utils.text_utils import tokenize_product_name
+    return [tokenize_product_name(name) for name in catalog_names]
+
+
+@pytest.fixture(scope='session')
+def bm25_index(catalog_corpus):
+    from utils.bm25_utils import BM25Index
+    return BM25Index(catalog_corpus)
+
+
+@pytest.fixture(scope='session')
+def fasttext_model(catalog_corpus):
+    from gensim.models import FastText
+    return FastText(sentences=catalog_corpus, vector_size=16, window=3, min_count=1, epochs=5,
+                    workers=1, seed=42)
+
+
+@pytest.fixture(scope='session')
+def catalog_embeddings(catalog_corpus, fasttext_model):
+    from utils.embedding_utils import embed_token_lists
+    return embed_token_lists(catalog_corpus, fasttext_model.wv)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(42)
@@ -0,0 +1,13 @@
+import pytest
+from utils.attribute_utils import extract_attributes
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('Труба д.110', [(110.0, '')]),
+    ('Труба д.110мм', [(110.0, 'мм')]),
+    ('Лист 5.5мм', [(5.5, 'мм')]),
+    ('Лист 5,5 мм', [(5.5, 'мм')]),
+    ('ПВХ ECO-FIX 1050х2450х6мм', [(1050.0, 'мм'), (2450.0, 'мм'), (6.0, 'мм')]),
+])
+def test_extract_attributes(name, expected):
+    assert extract_attributes(name) == expected
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+from utils.bm25_utils import BM25Index
+
+VOCABULARY = [f'т{i}' for i in range(30)]
+
+
+def random_corpus(rng, n_docs, max_len=8):
+    """Случайный корпус: частоты терминов убывают, поэтому есть и частые термины (IDF ниже границы), и редкие."""
+    weights = 1 / np.arange(1, len(VOCABULARY) + 1)
+    weights /= weights.sum()
+    return [list(rng.choice(VOCABULARY, size=rng.integers(1, max_len + 1), p=weights)) for _ in range(n_docs)]
+
+
+def random_queries(rng, n_queries=20):
+    # Запросы с повторами терминов и словами вне словаря
+    return [list(rng.choice(VOCABULARY + ['вне_словаря'], size=rng.integers(1, 5))) for _ in range(n_queries)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_scores_match_bm25okapi(seed):
+    rng = np.random.default_rng(seed)
+    corpus = random_corpus(rng, n_docs=200)
+    index, reference = BM25Index(corpus), BM25Okapi(corpus)
+
+    for query in random_queries(rng):
+        np.testing.assert_allclose(index.get_scores(query), reference.get_scores(query), rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('k', [1, 5, 30])
+def test_pruned_top_k_matches_exhaustive(seed, k):
+    rng = np.random.default_rng(seed)
+    index = BM25Index(random_corpus(rng, n_docs=300), block_size=8)
+    assert index.min_weight >= 0
+
+    for query in random_queries(rng):
+        pruned_indices, pruned_scores = index.top_k(query, k, pruning=True)
+        full_indices, full_scores = index.top_k(query, k, pruning=False)
+        np.testing.assert_array_equal(pruned_indices, full_indices)
+        np.testing.assert_allclose(pruned_scores, full_scores, rtol=1e-9)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_update_matches_rebuild(seed):
+    rng = np.random.default_rng(seed)
+    corpus = random_corpus(rng, n_docs=100)
+    index = BM25Index(corpus, block_size=8)
+
+    # Новый каталог: часть документов удалена, остальные переставлены, добавлены новые (в т.ч. с новыми терминами)
+    kept = rng.permutation(len(corpus))[:70]
+    new_documents = random_corpus(rng, n_docs=20) + [['новый_термин', 'т0'], ['ещё_термин']]
+    source_ids = np.concatenate([kept, np.full(len(new_documents), -1)])
+    source_ids = source_ids[rng.permutation(len(source_ids))]
+    new_iter = iter(new_documents)
+    new_corpus = [corpus[i] if i >= 0 else next(new_iter) for i in source_ids]
+
+    index.update(source_ids, new_documents)
+    rebuilt = BM25Index(new_corpus, block_size=8)
+
+    np.testing.assert_array_equal(index.terms, rebuilt.terms)
+    for query in random_queries(rng) + [['новый_термин'], ['ещё_термин', 'т1']]:
+        np.testing.assert_allclose(index.get_scores(query), rebuilt.get_scores(query), rtol=1e-9, atol=1e-12)
+        np.testing.assert_array_equal(index.top_k(query, 5, pruning=True)[0], rebuilt.top_k(query, 5, pruning=True)[0])
@@ -0,0 +1,26 @@
+from utils.cache_utils import QueryResultCache, get_artifact_version
+from utils.manifest_utils import record_stage
+
+
+def test_set_version_drops_entries_of_previous_artifacts():
+    cache = QueryResultCache(version='v1')
+    key = cache.make_key(['лист'], 10, False)
+    cache.put(key, 'ranked')
+    assert cache.get(key) == 'ranked'
+
+    cache.set_version('v2')
+    assert cache.stats()['size'] == 0
+    assert cache.get(cache.make_key(['лист'], 10, False)) is None
+    # Запись, вычисленная по ключу прежней версии, не сохраняется
+    cache.put(key, 'stale')
+    assert cache.stats()['size'] == 0
+
+
+def test_artifact_version_changes_on_rebuild(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    record_stage('bm25', {'vink_names': 'hash'}, [], manifest_path)
+    version = get_artifact_version(manifest_path)
+    assert get_artifact_version(manifest_path) == version
+
+    record_stage('catalog_store', {'vink_names': 'hash'}, [], manifest_path)
+    assert get_artifact_version(manifest_path) != version
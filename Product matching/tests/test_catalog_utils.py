@@ -0,0 +1,44 @@
+import joblib
+import numpy as np
+import pytest
+from utils.bm25_utils import BM25Index
+from utils.catalog_utils import update_catalog
+from utils.embedding_utils import embed_token_lists
+from utils.store_utils import CatalogStore
+from utils.text_utils import tokenize_product_name
+
+# Одинаковые наименования у разных товаров
+CATALOG_IDS = ['A-1', 'B-2', 'C-3']
+CATALOG_NAMES = ['Лист ПВХ 3мм', 'Лист ПВХ 3мм', 'Пленка Oracal 641 белая']
+
+
+@pytest.fixture
+def catalog_dirs(fasttext_model, tmp_path):
+    data_dir, model_dir = tmp_path / 'data', tmp_path / 'models'
+    data_dir.mkdir()
+    model_dir.mkdir()
+    token_lists = [tokenize_product_name(name) for name in CATALOG_NAMES]
+    joblib.dump(CATALOG_NAMES, data_dir / 'vink_names.joblib')
+    BM25Index(token_lists).save(str(model_dir / 'bm25_index'))
+    np.save(model_dir / 'catalog_embeddings.npy', embed_token_lists(token_lists, fasttext_model.wv))
+    CatalogStore.from_columns(CATALOG_IDS, CATALOG_NAMES, token_lists).save(str(data_dir / 'catalog.arrow'))
+    return dict(fasttext_model=fasttext_model, save_dir_names=str(data_dir), save_dir_model=str(model_dir))
+
+
+def test_ambiguous_names_are_rejected(catalog_dirs):
+    with pytest.raises(ValueError, match='несколько раз'):
+        update_catalog(removed=['Лист ПВХ 3мм'], **catalog_dirs)
+    with pytest.raises(ValueError, match='несколько раз'):
+        update_catalog(renamed={'Лист ПВХ 3мм': 'Лист ПВХ 4мм'}, **catalog_dirs)
+    assert joblib.load(catalog_dirs['save_dir_names'] + '/vink_names.joblib') == CATALOG_NAMES
+
+
+def test_changes_by_id_touch_only_that_product(catalog_dirs):
+    names, bm25_model, embeddings, _, _ = update_catalog(removed_ids=['A-1'], renamed_ids={'B-2': 'Лист ПВХ 4мм'},
+                                                         **catalog_dirs)
+
+    assert names == ['Лист ПВХ 4мм', 'Пленка Oracal 641 белая']
+    assert embeddings.shape[0] == len(names)
+    store = CatalogStore.open(catalog_dirs['save_dir_names'] + '/catalog.arrow', memory_map=False)
+    assert store.take_ids([0, 1]) == ['B-2', 'C-3']
+    assert store.take_names([0, 1]) == names
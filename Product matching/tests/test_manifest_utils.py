@@ -0,0 +1,80 @@
+import os
+from utils.manifest_utils import (CURRENT_VERSION_FILE, is_stage_current, record_stage, new_version_dir,
+                                  publish_version, current_version_dir)
+
+
+def test_stage_missing_from_manifest_is_rebuilt(tmp_path):
+    output = tmp_path / 'index.npz'
+    output.write_bytes(b'built from an older catalog')
+    manifest_path = str(tmp_path / 'manifest.json')
+    inputs = {'vink_names': 'hash'}
+
+    assert not is_stage_current('ann', inputs, [str(output)], manifest_path)
+    # Непроверенные артефакты не записываются в манифест как актуальные
+    assert not is_stage_current('ann', inputs, [str(output)], manifest_path)
+
+
+def test_stage_current_only_for_recorded_inputs(tmp_path):
+    output = tmp_path / 'index.npz'
+    output.write_bytes(b'index')
+    manifest_path = str(tmp_path / 'manifest.json')
+    record_stage('ann', {'vink_names': 'hash'}, [str(output)], manifest_path)
+
+    assert is_stage_current('ann', {'vink_names': 'hash'}, [str(output)], manifest_path)
+    assert not is_stage_current('ann', {'vink_names': 'other'}, [str(output)], manifest_path)
+    output.unlink()
+    assert not is_stage_current('ann', {'vink_names': 'hash'}, [str(output)], manifest_path)
+
+
+def test_versioned_directory_keeps_previous_version_until_published(tmp_path):
+    path = str(tmp_path / 'index')
+    first = new_version_dir(path)
+    publish_version(first)
+    assert current_version_dir(path) == first
+
+    # Сбой во время записи новой версии: текущей остаётся прежняя
+    second = new_version_dir(path)
+    assert current_version_dir(path) == first
+
+    publish_version(second)
+    assert current_version_dir(path) == second
+    # Предыдущая версия остаётся для читателей, уже прочитавших указатель
+    assert sorted(os.listdir(path)) == sorted([CURRENT_VERSION_FILE, os.path.basename(first),
+                                               os.path.basename(second)])
+
+    third = new_version_dir(path)
+    publish_version(third)
+    assert sorted(os.listdir(path)) == sorted([CURRENT_VERSION_FILE, os.path.basename(second),
+                                               os.path.basename(third)])
+
+
+def test_first_publication_keeps_unversioned_files_until_next(tmp_path):
+    path = tmp_path / 'index'
+    path.mkdir()
+    (path / 'meta.json').write_text('{}')
+
+    first = new_version_dir(str(path))
+    publish_version(first)
+    assert (path / 'meta.json').exists()
+
+    publish_version(new_version_dir(str(path)))
+    assert not (path / 'meta.json').exists()
+    assert os.path.exists(first)
+
+
+def test_directory_without_pointer_is_read_as_is(tmp_path):
+    assert current_version_dir(str(tmp_path)) == str(tmp_path)
+
+
+def test_bm25_index_save_replaces_previous_version(tmp_path, catalog_corpus):
+    from utils.bm25_utils import BM25Index
+
+    path = str(tmp_path / 'bm25_index')
+    BM25Index(catalog_corpus[:10]).save(path)
+    opened = BM25Index.load(path)
+    BM25Index(catalog_corpus).save(path)
+
+    assert BM25Index.load(path).corpus_size == len(catalog_corpus)
+    # Индекс, открытый до публикации новой версии, остаётся рабочим
+    assert opened.corpus_size == 10
+    assert opened.top_k(catalog_corpus[0], 3)[0][0] == 0
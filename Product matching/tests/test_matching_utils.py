@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from utils.ann_utils import IVFIndex
+from utils.matching_utils import match_query, match_queries
+
+QUERIES = ["лист пвх 5", "кабель силовой xyz"]
+
+
+@pytest.mark.parametrize('n_lists', [40, 20])
+def test_match_queries_with_ann_keeps_n_top_rows_for_query_without_token_overlap(
+        catalog_names, bm25_index, fasttext_model, catalog_embeddings, n_lists):
+    # В одном просмотренном кластере меньше k_top документов, а у второго запроса нет общих с каталогом токенов
+    ann_index = IVFIndex.build(catalog_embeddings, n_lists=n_lists, n_probe=1)
+
+    result = match_queries(QUERIES, catalog_names, bm25_index, fasttext_model, catalog_embeddings,
+                           k_top=10, n_top=5, ann_index=ann_index)
+
+    assert result.groupby('query_idx').size().tolist() == [5, 5]
+    for query_idx, group in result.groupby('query_idx'):
+        assert group['vink_idx'].is_unique
+
+
+@pytest.mark.parametrize('n_lists', [40, 20])
+def test_match_query_with_ann_matches_batch(catalog_names, bm25_index, fasttext_model, catalog_embeddings, n_lists):
+    ann_index = IVFIndex.build(catalog_embeddings, n_lists=n_lists, n_probe=1)
+    batch = match_queries(QUERIES, catalog_names, bm25_index, fasttext_model, catalog_embeddings,
+                          k_top=10, n_top=5, ann_index=ann_index)
+
+    for query_idx, query in enumerate(QUERIES):
+        single = match_query(query, catalog_names, bm25_index, fasttext_model, k_top=10, n_top=5,
+                             catalog_embeddings=catalog_embeddings, ann_index=ann_index)
+        expected = batch[batch['query_idx'] == query_idx]
+        assert len(single) == 5
+        assert single['Наименование товара'].tolist() == expected['vink_name'].tolist()
+        np.testing.assert_allclose(single['Сходство'], expected['score'], rtol=1e-5, atol=1e-6)
+
+
+ATTRIBUTE_CATALOG = [
+    'Лист ПВХ 3мм белый', 'Лист ПВХ 6мм белый', 'Лист ПВХ 10мм белый', 'Лист ПВХ 8мм черный',
+    'Саморез 6мм', 'Товар 6', 'Сверло по металлу 6мм', 'Акрил 6мм прозрачный',
+    'Кабель медный', 'Краска акриловая', 'Профиль алюминиевый', 'Пленка ORACAL', 'Клей монтажный',
+    'Скотч двусторонний', 'Баннер литой', 'Композит серебро',
+]
+
+
+@pytest.fixture(scope='module')
+def attribute_catalog():
+    from gensim.models import FastText
+    from utils.attribute_utils import AttributeIndex
+    from utils.bm25_utils import BM25Index
+    from utils.embedding_utils import embed_token_lists
+    from utils.text_utils import tokenize_product_name
+
+    corpus = [tokenize_product_name(name) for name in ATTRIBUTE_CATALOG]
+    model = FastText(sentences=corpus, vector_size=16, window=3, min_count=1, epochs=5, workers=1, seed=42)
+    return (ATTRIBUTE_CATALOG, BM25Index(corpus), model, embed_token_lists(corpus, model.wv),
+            AttributeIndex.build(ATTRIBUTE_CATALOG))
+
+
+def test_attributes_do_not_outrank_lexical_matches(attribute_catalog):
+    names, bm25, model, embeddings, attribute_index = attribute_catalog
+
+    single = match_query('Лист ПВХ 6мм', names, bm25, model, k_top=4, n_top=3,
+                         catalog_embeddings=embeddings, attribute_index=attribute_index)
+    batch = match_queries(['Лист ПВХ 6мм'], names, bm25, model, embeddings, k_top=4, n_top=3,
+                          attribute_index=attribute_index)
+
+    for ranked in [single['Наименование товара'].tolist(), batch['vink_name'].tolist()]:
+        assert ranked[0] == 'Лист ПВХ 6мм белый'
+        assert all(name.startswith('Лист ПВХ') for name in ranked)
@@ -0,0 +1,86 @@
+import json
+import asyncio
+from utils import service_utils
+from utils.service_utils import MatchingService, MicroBatcher
+
+
+def fake_process_batch(calls):
+    def process_batch(queries, n_top):
+        calls.append((list(queries), n_top))
+        return [[{'rank': rank, 'id': None, 'name': f'{query} {rank}', 'score': 1.0 / rank}
+                 for rank in range(1, n_top + 1)] for query in queries]
+    return process_batch
+
+
+def test_micro_batcher_batches_requests_and_slices_n_top():
+    calls = []
+
+    async def scenario():
+        batcher = MicroBatcher(fake_process_batch(calls), max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(batcher.submit('a', 1), batcher.submit('b', 3), batcher.submit('c', 2))
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(scenario())
+    assert calls == [(['a', 'b', 'c'], 3)]
+    assert [len(result) for result in results] == [1, 3, 2]
+    assert results[1][0]['name'] == 'b 1'
+
+
+async def http_request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                 .encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(content)
+
+
+def run_with_server(service, requests, process_batch=None):
+    """Запускает сервис на свободном порту и выполняет HTTP-запросы; process_batch — вместо загрузки моделей."""
+    async def scenario():
+        if process_batch is not None:
+            service.batcher = MicroBatcher(process_batch, max_wait_ms=1)
+            service.batcher.start()
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [await http_request(port, *request) for request in requests]
+    return asyncio.run(scenario())
+
+
+def test_match_endpoint_validates_and_answers():
+    service = MatchingService(k_top=10, default_n_top=2)
+    responses = run_with_server(service, [
+        ('POST', '/match', {'queries': ['лист', 'пвх'], 'n_top': 3}),
+        ('POST', '/match', {'query': 'лист'}),
+        ('POST', '/match', {'query': 'лист', 'n_top': True}),
+        ('POST', '/match', {'query': 'лист', 'n_top': 11}),
+        ('GET', '/match', None),
+    ], process_batch=fake_process_batch([]))
+
+    status, content = responses[0]
+    assert status == 200 and [len(result) for result in content['results']] == [3, 3]
+    status, content = responses[1]
+    assert status == 200 and len(content['results'][0]) == 2
+    assert [status for status, _ in responses[2:]] == [400, 400, 405]
+
+
+def test_failed_loading_is_reported(monkeypatch):
+    def failing_load_resources(**kwargs):
+        raise FileNotFoundError("нет data/vink_names.joblib")
+
+    monkeypatch.setattr(service_utils, 'load_resources', failing_load_resources)
+    service = MatchingService()
+    asyncio.run(service.load())
+
+    responses = run_with_server(service, [('POST', '/match', {'query': 'лист'}), ('GET', '/health', None)])
+    for status, content in responses:
+        assert status == 500
+        assert 'нет data/vink_names.joblib' in content['error']
+    assert responses[1][1]['ready'] is False
@@ -0,0 +1,40 @@
+import threading
+from multiprocessing import Pipe
+import numpy as np
+import pytest
+from utils.bm25_utils import BM25Index, corpus_statistics, merge_statistics
+from utils.shard_utils import CatalogShard, ShardedIndex, _serve_connection, shard_ranges
+from test_bm25_utils import random_corpus, random_queries
+
+
+def start_in_threads(shards):
+    """Координатор для шардов, обслуживаемых потоками этого процесса (вместо процессов)."""
+    connections = []
+    for shard in shards:
+        parent, child = Pipe()
+        threading.Thread(target=_serve_connection, args=(shard, child), daemon=True).start()
+        parent.send(('info',))
+        connections.append(parent)
+    return ShardedIndex(connections)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('n_shards', [1, 3, 4])
+def test_sharded_search_matches_full_index(seed, n_shards):
+    rng = np.random.default_rng(seed)
+    corpus = random_corpus(rng, n_docs=150)
+    embeddings = rng.standard_normal((len(corpus), 4)).astype(np.float32)
+    ranges = shard_ranges(len(corpus), n_shards)
+    statistics = merge_statistics(corpus_statistics(corpus[start:stop]) for start, stop in ranges)
+    shards = [CatalogShard(BM25Index(corpus[start:stop], statistics=statistics), embeddings[start:stop], start)
+              for start, stop in ranges]
+    full_index = BM25Index(corpus)
+    queries = random_queries(rng)
+
+    with start_in_threads(shards) as sharded:
+        for k in [1, 10, 200]:
+            indices, scores, vectors = sharded.search(queries, k)
+            full_indices, full_scores = full_index.top_k_batch(queries, k)
+            np.testing.assert_array_equal(indices, full_indices)
+            np.testing.assert_allclose(scores, full_scores, rtol=1e-9)
+            np.testing.assert_array_equal(vectors, embeddings[indices])
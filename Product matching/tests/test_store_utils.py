@@ -0,0 +1,25 @@
+import joblib
+import pandas as pd
+from utils.store_utils import prepare_catalog_store
+
+
+def test_unmatched_ids_keep_the_source_id_type(tmp_path):
+    csv_path = tmp_path / 'goods.csv'
+    pd.DataFrame({'sku_id': ['A-1', 'B-2'], 'sku_name': ['Лист ПВХ 3мм', 'Лист ПВХ 6мм']}).to_csv(csv_path, index=False)
+    data_dir, model_dir = tmp_path / 'data', tmp_path / 'models'
+    data_dir.mkdir()
+    names_path = data_dir / 'vink_names.joblib'
+
+    def prepare(names):
+        joblib.dump(names, names_path)
+        return prepare_catalog_store(str(csv_path), save_dir_names=str(data_dir), save_dir_model=str(model_dir),
+                                     workers=1)
+
+    matched = prepare(['Лист ПВХ 3мм', 'Лист ПВХ 6мм'])
+    assert matched.take_ids([0, 1]) == ['A-1', 'B-2']
+    id_type = matched.table.schema.field('vink_id').type
+
+    # Наименования изменены не обновлением каталога: коды сопоставить не с чем
+    unmatched = prepare(['Лист ПВХ 3мм', 'Лист ПВХ 8мм'])
+    assert unmatched.take_ids([0, 1]) == [None, None]
+    assert unmatched.table.schema.field('vink_id').type == id_type
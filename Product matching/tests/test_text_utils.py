@@ -0,0 +1,40 @@
+import pytest
+from utils.text_utils import preprocess_text, tokenize_product_name, _load_word_tokenizer
+
+PUNCTUATED_NAMES = [
+    'Лист 5. бел',
+    'т.д. лист',
+    'Т Д. лист',
+    'ПВХ 3 мм, бел. (прозр.)',
+    'Акрил e.g. 5.5мм',
+    'ул. Ленина 5. лист',
+    'Труба д.110, 2.5 м.',
+]
+
+
+def test_plain_names_split_on_spaces():
+    for name in ['Лист ПВХ 5 мм белый', 'Кабель силовой 3x2 медный']:
+        assert tokenize_product_name(name) == preprocess_text(name).split()
+
+
+@pytest.mark.parametrize('name', PUNCTUATED_NAMES)
+def test_punctuated_names_match_untrained_word_tokenize_pipeline(name):
+    from nltk.tokenize import NLTKWordTokenizer
+    from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+    sentences = PunktSentenceTokenizer().tokenize(preprocess_text(name))
+    expected = [token for sentence in sentences for token in NLTKWordTokenizer().tokenize(sentence)]
+    assert tokenize_product_name(name) == expected
+
+
+def test_punctuated_names_do_not_need_nltk_data(monkeypatch):
+    import nltk
+
+    def missing(*args, **kwargs):
+        raise LookupError("нет данных NLTK")
+
+    expected = [tokenize_product_name(name) for name in PUNCTUATED_NAMES]
+    monkeypatch.setattr(nltk.data, 'find', missing)
+    monkeypatch.setattr(nltk.data, 'load', missing)
+    tokenizer = _load_word_tokenizer()
+    assert [tokenizer(preprocess_text(name)) for name in PUNCTUATED_NAMES] == expected
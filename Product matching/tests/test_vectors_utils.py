@@ -0,0 +1,22 @@
+import numpy as np
+from utils.vectors_utils import ServingVectors, export_serving_vectors
+
+OOV_WORDS = ['акрилл', 'пленочка', 'oracal123', 'xyz', 'ж']
+
+
+def test_unpruned_export_matches_fasttext(fasttext_model, tmp_path):
+    out_dir = str(tmp_path / 'fasttext_serving')
+    export_serving_vectors(fasttext_model, out_dir, dtype='float32')
+    serving = ServingVectors.load(out_dir)
+
+    for word in fasttext_model.wv.index_to_key[:20] + OOV_WORDS:
+        np.testing.assert_allclose(serving[word], fasttext_model.wv[word], rtol=1e-5, atol=1e-6)
+
+
+def test_pruned_export_keeps_in_vocabulary_vectors(fasttext_model, tmp_path):
+    out_dir = str(tmp_path / 'fasttext_serving')
+    export_serving_vectors(fasttext_model, out_dir, dtype='float32', prune_ngrams=True)
+    serving = ServingVectors.load(out_dir)
+
+    for word in fasttext_model.wv.index_to_key:
+        np.testing.assert_allclose(serving[word], fasttext_model.wv[word], rtol=1e-5, atol=1e-6)